@@ -0,0 +1,25 @@
+# app_paths.py
+"""
+Thư mục dữ liệu dùng chung của ứng dụng (cache bền giữa các phiên), không phụ
+thuộc giao diện: update_check, vector_image... cùng dùng.
+"""
+
+import os
+from typing import Optional
+
+
+def get_cache_dir(name: Optional[str] = None) -> str:
+    """
+    Thư mục cache theo người dùng (LOCALAPPDATA / XDG_CACHE_HOME / ~/.cache), dùng chung
+    cho các cache bền giữa các phiên; name: thư mục con.
+    """
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') \
+        or os.path.join(os.path.expanduser('~'), '.cache')
+    cache_dir = os.path.join(base, 'docx_xml_converter', name or '')
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError:
+        import tempfile
+        cache_dir = os.path.join(tempfile.gettempdir(), 'docx_xml_converter', name or '')
+        os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
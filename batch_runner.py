@@ -0,0 +1,767 @@
+# batch_runner.py
+"""
+Chạy một batch file DOCX: tạm dừng / hủy được và giới hạn thời gian cho từng file.
+
+- BatchControl: cờ hủy / tạm dừng (multiprocessing.Event) dùng chung giữa UI,
+  thread điều phối và worker process. DocxProcessor gọi control.checkpoint()
+  giữa các câu hỏi / học liệu; BatchRunner kiểm tra giữa các file.
+- FileWorker: process riêng chạy DocxProcessor, nhận từng file qua Pipe. Một file
+  treo (regex, bảng lỗi...) chỉ làm treo process này: watchdog kill nó khi quá
+  thời gian, ghi trạng thái 'timeout' vào file_results rồi chạy tiếp file sau
+  trên process mới.
+- Hủy: đặt cờ, chờ worker dừng ở checkpoint kế tiếp (CANCEL_GRACE_S), quá hạn thì kill.
+- Lập lịch: chi phí mỗi file ước lượng trước từ central directory của zip
+  (document.xml, word/media, số paragraph), file lớn chạy trước trên nhiều
+  worker, giới hạn số file nặng chạy cùng lúc; ETA tính theo chi phí đã xử lý.
+- WorkerPool: worker sống suốt phiên (đã warm-up), dùng lại giữa các batch và
+  được thay mới sau một số file hoặc khi RAM vượt ngưỡng.
+
+Trạng thái trong file_results: 'success', 'error', 'critical_error', 'timeout', 'cancelled'.
+"""
+
+import multiprocessing
+import multiprocessing.connection
+import os
+import re
+import sys
+import time
+import traceback
+import zipfile
+from pathlib import Path
+from typing import Optional
+
+import output_writer
+import xml_validate
+
+
+# File .docx từ kích thước này trở lên được xử lý ở chế độ stream
+STREAM_MIN_BYTES = 100 * 1024 * 1024
+
+# Thời gian tối đa cho một file: FILE_TIMEOUT_BASE_S + FILE_TIMEOUT_PER_MB_S mỗi MB
+FILE_TIMEOUT_BASE_S = 300
+FILE_TIMEOUT_PER_MB_S = 2
+
+# Chu kỳ watchdog kiểm tra worker (giây)
+WATCH_INTERVAL_S = 0.2
+
+# Thời gian chờ worker tự dừng ở checkpoint sau khi hủy, quá hạn thì kill
+CANCEL_GRACE_S = 3
+
+# Trọng số ước lượng chi phí (byte quy đổi): 1 byte document.xml = 1,
+# MEDIA_COST_DIVISOR byte ảnh = 1, mỗi paragraph = PARAGRAPH_COST
+MEDIA_COST_DIVISOR = 8
+PARAGRAPH_COST = 200
+AVG_PARAGRAPH_BYTES = 1500
+
+# File có chi phí từ ngưỡng này là file nặng; tối đa MAX_HEAVY_FILES file nặng chạy cùng lúc
+HEAVY_COST = 40 * 1024 * 1024
+MAX_HEAVY_FILES = 1
+
+_APP_PARAGRAPHS = re.compile(rb'<Paragraphs>(\d+)</Paragraphs>')
+
+
+# Worker được thay mới sau WORKER_MAX_FILES file hoặc khi RAM vượt WORKER_MAX_RSS_MB
+WORKER_MAX_FILES = 50
+WORKER_MAX_RSS_MB = 1536
+
+
+def default_workers() -> int:
+    """Số worker mặc định: nửa số CPU, tối đa 4 (mỗi worker giữ một tài liệu trong RAM)"""
+    return max(1, min(4, (os.cpu_count() or 2) // 2))
+
+
+class BatchCancelled(BaseException):
+    """
+    Hủy batch tại checkpoint.
+    Kế thừa BaseException để không bị các khối `except Exception` trong processor nuốt mất.
+    """
+
+
+class BatchControl:
+    """Cờ hủy / tạm dừng, dùng được cả trong thread lẫn worker process"""
+
+    def __init__(self):
+        ctx = multiprocessing.get_context('spawn')
+        self._cancel = ctx.Event()
+        self._running = ctx.Event()
+        self._running.set()
+
+    def cancel(self):
+        self._cancel.set()
+        self._running.set()  # nhả các chỗ đang chờ tạm dừng để chúng thấy cờ hủy
+
+    def pause(self):
+        if not self._cancel.is_set():
+            self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def reset(self):
+        """Xóa cờ hủy / tạm dừng trước batch mới (control dùng lại cùng WorkerPool)"""
+        self._cancel.clear()
+        self._running.set()
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def is_paused(self) -> bool:
+        return not self._running.is_set()
+
+    def wait_if_paused(self):
+        self._running.wait()
+
+    def checkpoint(self):
+        """Chờ nếu đang tạm dừng; ném BatchCancelled nếu đã hủy"""
+        self._running.wait()
+        if self._cancel.is_set():
+            raise BatchCancelled()
+
+
+def file_timeout(input_file) -> float:
+    """Thời gian tối đa (giây) cho một file, tăng theo kích thước"""
+    size_mb = os.path.getsize(input_file) / (1024 * 1024)
+    return FILE_TIMEOUT_BASE_S + FILE_TIMEOUT_PER_MB_S * size_mb
+
+
+def convert_file(processor, input_file, output_file, output_options=None):
+    """
+    Chuyển một file .docx sang .xml, trả về danh sách lỗi.
+    output_options (output_writer.OutputOptions): ghi dạng nén .xml.gz / .xml.zst.
+    """
+    # Processor được dùng lại cho nhiều file: số thứ tự câu hỏi tính riêng cho từng file
+    processor.index_question = 0
+    # Ghi vào .part rồi đổi tên, để file bị kill giữa chừng (hết giờ, hủy) không để lại XML dở
+    part_file = output_file + '.part'
+    if os.path.getsize(input_file) >= STREAM_MIN_BYTES:
+        # File rất lớn: ghi từng câu hỏi ra file ngay, không giữ cả tài liệu trong RAM
+        errors = processor.process_docx_stream(input_file, part_file, output_options)
+    else:
+        xml_content, errors = processor.process_docx(input_file)
+        # Luôn lưu file, ngay cả khi có lỗi (nếu có thể)
+        with output_writer.open_output(part_file, output_options) as f:
+            f.write(xml_content)
+    if os.path.exists(part_file):
+        os.replace(part_file, output_file)
+
+    if processor.validate_output and os.path.exists(output_file):
+        errors = errors + xml_validate.validate_file(output_file)
+    return errors
+
+
+# ============================================
+# Worker process
+# ============================================
+
+# Tài liệu mẫu chạy một lần khi worker khởi động: nạp hết các module dùng lười
+# và đưa các regex của processor vào cache của `re` trước khi nhận file thật
+_WARM_UP_PARAGRAPHS = [
+    '[TOANTHPT_1, 1, NB]',
+    'Câu 1: 1 + 1 = ?', 'A. 1', 'B. 2', 'C. 3', 'D. 4', 'Lời giải', '2', '###', 'Giải thích: 1 + 1 = 2',
+    'Câu 2: Chọn đúng sai', 'a) 1 + 1 = 2', 'b) 1 + 1 = 3', 'Lời giải', '10', '###', 'Giải thích',
+    '[TINHOCTHPT_1, 1, NB]',
+    'Câu 1: 1 + 1 = ?', 'A. 1', 'B. 2', 'C. 3', 'D. 4', 'Lời giải', '2', '###', 'Giải thích: 1 + 1 = 2',
+]
+
+
+def _warm_up(processor):
+    """Chạy processor trên tài liệu mẫu trong bộ nhớ (bỏ qua mọi lỗi / output)"""
+    import contextlib
+    import io
+    from docx import Document
+
+    try:
+        doc = Document()
+        for text in _WARM_UP_PARAGRAPHS:
+            doc.add_paragraph(text)
+        data = io.BytesIO()
+        doc.save(data)
+        data.seek(0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            processor.process_docx(data)
+    except Exception as e:
+        print(f"[WARN] Warm-up worker lỗi: {e}")
+    processor.doc = None
+    processor.memo.clear()
+    if processor.validate_output:
+        # Biên dịch schema ngay khi khởi động worker, không để file đầu tiên chịu
+        xml_validate.get_schema('question')
+        xml_validate.get_schema('itemDocument')
+
+
+def _process_rss_mb() -> Optional[float]:
+    """RAM đang dùng (working set / RSS) của process hiện tại, MB; None nếu không đo được"""
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                            ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                            ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                            ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            if ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                        ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize / (1024 * 1024)
+            return None
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _worker_main(conn, control, log_path, processor_kwargs=None):
+    """
+    Vòng lặp của worker: nhận (input_file, output_file, output_options), trả
+    (kết quả, RAM đang dùng); None để thoát.
+    """
+    if log_path:
+        try:
+            sys.stdout = open(log_path, 'a', encoding='utf-8', buffering=1)
+        except OSError:
+            pass
+
+    from docx_processor import DocxProcessor
+    processor = DocxProcessor(**(processor_kwargs or {}))
+    _warm_up(processor)
+    processor.checkpoint = control.checkpoint
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+
+        input_file, output_file, output_options = task
+        try:
+            errors = convert_file(processor, input_file, output_file, output_options)
+            result = ('done', errors)
+        except BatchCancelled:
+            result = ('cancelled',)
+        except Exception as e:
+            result = ('critical', str(e), traceback.format_exc())
+        conn.send((result, _process_rss_mb()))
+
+
+class WorkerDied(Exception):
+    """Worker process kết thúc bất thường khi đang xử lý file"""
+
+
+class FileWorker:
+    """Một worker process, khởi động lại được sau khi bị kill"""
+
+    def __init__(self, control: BatchControl, log_path=None, processor_kwargs=None):
+        self.control = control
+        self.log_path = log_path
+        self.processor_kwargs = processor_kwargs
+        self._ctx = multiprocessing.get_context('spawn')
+        self._process = None
+        self._conn = None
+        # Số file đã xử lý và RAM báo về sau file gần nhất (để WorkerPool quyết định thay worker)
+        self.files_done = 0
+        self.rss_mb = None
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def start(self):
+        parent_conn, child_conn = self._ctx.Pipe()
+        self._process = self._ctx.Process(
+            target=_worker_main, args=(child_conn, self.control, self.log_path, self.processor_kwargs),
+            daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+        self.files_done = 0
+        self.rss_mb = None
+
+    @property
+    def waitable(self):
+        """Đối tượng cho multiprocessing.connection.wait (có kết quả hoặc process chết)"""
+        return self._conn
+
+    def submit(self, input_file, output_file, output_options=None):
+        if not self.alive:
+            self.kill()
+            self.start()
+        self._conn.send((input_file, output_file, output_options))
+
+    def poll(self, timeout):
+        """Kết quả của file đang chạy, None nếu chưa xong; WorkerDied nếu process đã chết"""
+        try:
+            if self._conn.poll(timeout):
+                result, self.rss_mb = self._conn.recv()
+                self.files_done += 1
+                return result
+        except (EOFError, OSError):
+            pass
+        else:
+            if self._process.is_alive():
+                return None
+        self._process.join(1)
+        raise WorkerDied(f"Worker dừng đột ngột (exit code {self._process.exitcode})")
+
+    def kill(self):
+        if self._process is not None:
+            if self._process.is_alive():
+                self._process.kill()
+            self._process.join(5)
+            self._process = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def stop(self):
+        """Dừng worker: yêu cầu thoát, quá hạn thì kill"""
+        if self.alive:
+            try:
+                self._conn.send(None)
+                self._process.join(5)
+            except (OSError, BrokenPipeError):
+                pass
+        self.kill()
+
+
+class WorkerPool:
+    """
+    Các FileWorker sống suốt phiên làm việc, dùng lại cho mọi batch.
+    Worker đã import python-docx / lxml / Pillow / bs4 và chạy warm-up sẵn, nên
+    batch mới không phải chờ khởi động. Worker được thay bằng process mới sau
+    `max_files` file hoặc khi RAM vượt `max_rss_mb`, để rò rỉ bộ nhớ không tích lũy.
+    processor_kwargs: tham số tạo DocxProcessor trong worker (vd. image_options).
+    """
+
+    def __init__(self, size=None, log_path=None, control: BatchControl = None,
+                 max_files=WORKER_MAX_FILES, max_rss_mb=WORKER_MAX_RSS_MB, processor_kwargs=None):
+        self.control = control or BatchControl()
+        self.max_files = max_files
+        self.max_rss_mb = max_rss_mb
+        self.processor_kwargs = processor_kwargs
+        self.workers = [FileWorker(self.control, log_path, processor_kwargs)
+                        for _ in range(max(1, size or default_workers()))]
+
+    def start(self):
+        """Khởi động (hoặc khởi động lại) các worker chưa chạy; không chờ warm-up xong"""
+        for worker in self.workers:
+            if not worker.alive:
+                worker.kill()
+                worker.start()
+
+    def replace(self, worker):
+        """Kill worker (treo / quá thời gian) và chạy process mới thay thế"""
+        worker.kill()
+        worker.start()
+
+    def recycle_if_needed(self, worker) -> Optional[str]:
+        """Thay worker nếu đã xử lý đủ max_files file hoặc dùng quá max_rss_mb; trả về lý do"""
+        if worker.files_done >= self.max_files:
+            reason = f"đã xử lý {worker.files_done} file"
+        elif worker.rss_mb is not None and worker.rss_mb > self.max_rss_mb:
+            reason = f"dùng {worker.rss_mb:.0f} MB RAM"
+        else:
+            return None
+        worker.stop()
+        worker.start()
+        return reason
+
+    def shutdown(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+# ============================================
+# Ước lượng chi phí từng file
+# ============================================
+
+class FileCost:
+    """Chi phí ước lượng của một file, đọc từ central directory của zip (không giải nén document.xml)"""
+
+    __slots__ = ('size', 'document_bytes', 'media_bytes', 'paragraphs', 'cost')
+
+    def __init__(self, size, document_bytes, media_bytes, paragraphs):
+        self.size = size
+        self.document_bytes = document_bytes
+        self.media_bytes = media_bytes
+        self.paragraphs = paragraphs
+        # Đơn vị "byte quy đổi": parse XML tốn nhất, ảnh chủ yếu chỉ đọc + base64
+        self.cost = document_bytes + media_bytes // MEDIA_COST_DIVISOR + paragraphs * PARAGRAPH_COST
+
+    @property
+    def heavy(self) -> bool:
+        return self.cost >= HEAVY_COST
+
+
+def estimate_cost(input_file) -> FileCost:
+    """Kích thước zip, tổng byte ảnh (word/media) và số paragraph của một .docx"""
+    size = os.path.getsize(input_file)
+    try:
+        with zipfile.ZipFile(input_file) as zf:
+            document_bytes = media_bytes = 0
+            paragraphs = 0
+            for info in zf.infolist():
+                if info.filename == 'word/document.xml':
+                    document_bytes = info.file_size
+                elif info.filename.startswith('word/media/'):
+                    media_bytes += info.file_size
+                elif info.filename == 'docProps/app.xml' and info.file_size < 64 * 1024:
+                    match = _APP_PARAGRAPHS.search(zf.read(info))
+                    if match:
+                        paragraphs = int(match.group(1))
+    except (zipfile.BadZipFile, OSError, ValueError):
+        # File hỏng vẫn được đưa vào batch để báo lỗi như bình thường
+        return FileCost(size, size, 0, 0)
+
+    # docProps/app.xml có thể cũ hoặc thiếu, lấy thêm ước lượng theo kích thước document.xml
+    paragraphs = max(paragraphs, document_bytes // AVG_PARAGRAPH_BYTES)
+    return FileCost(size, document_bytes, media_bytes, paragraphs)
+
+
+def format_eta(seconds) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600} giờ {seconds % 3600 // 60} phút"
+    if seconds >= 60:
+        return f"{seconds // 60} phút {seconds % 60} giây"
+    return f"{seconds} giây"
+
+
+# ============================================
+# Điều phối batch
+# ============================================
+
+class _Job:
+    """Một file trong batch và trạng thái watchdog của nó"""
+
+    __slots__ = ('input_file', 'file_name', 'output_file', 'key', 'cost', 'timeout', 'started', 'paused_base',
+                 'cancelled_at', 'arcname', 'bundled')
+
+    def __init__(self, input_file, output_file, key):
+        self.input_file = input_file
+        self.file_name = Path(input_file).stem
+        self.output_file = output_file
+        self.key = key
+        self.cost = estimate_cost(input_file)
+        self.timeout = file_timeout(input_file)
+        self.started = None
+        self.paused_base = 0.0
+        self.cancelled_at = None
+        # Tên trong file zip và đã được đưa vào zip chưa (output_options.bundle)
+        self.arcname = None
+        self.bundled = False
+
+
+class BatchRunner:
+    """
+    Chạy một batch file trên `workers` worker process, log qua `log(message)` và
+    tiến trình qua `set_progress(done_files, total_files, fraction, eta_seconds)`.
+
+    File được xếp theo chi phí ước lượng giảm dần (file lớn chạy trước, file nhỏ
+    lấp chỗ trống ở cuối), tối đa `max_heavy` file nặng chạy cùng lúc để giới hạn
+    RAM. Tiến trình và ETA tính theo chi phí (byte quy đổi) đã xử lý, không theo số file.
+
+    pool: WorkerPool dùng chung giữa các batch (control của batch là pool.control);
+    không truyền thì runner tự tạo pool riêng và tắt nó trong close().
+    processor_kwargs: tham số tạo DocxProcessor (pool riêng / chạy tuần tự).
+    output_options (output_writer.OutputOptions): ghi .xml.gz / .xml.zst, hoặc gom cả
+    batch vào một file zip kèm manifest (bundle).
+    use_processes=False: chạy tuần tự ngay trong thread gọi (vẫn tạm dừng / hủy
+    được, nhưng không có timeout).
+    """
+
+    def __init__(self, control: BatchControl, log, set_progress=None, log_path=None, use_processes=True,
+                 workers=None, max_heavy=MAX_HEAVY_FILES, pool: WorkerPool = None, processor_kwargs=None,
+                 output_options=None):
+        self.control = control
+        self.processor_kwargs = processor_kwargs
+        self.output_options = output_options
+        self.bundle_path = None
+        self._bundle = None
+        self.log = log
+        self.set_progress = set_progress or (lambda *progress: None)
+        self.use_processes = use_processes
+        self.max_heavy = max(1, max_heavy)
+        self.pool = None
+        self._own_pool = False
+        if use_processes:
+            self.pool = pool
+            if pool is None:
+                self.pool = WorkerPool(workers, log_path, control, processor_kwargs=processor_kwargs)
+                self._own_pool = True
+        self.workers = self.pool.workers if self.pool else []
+        self.workers_count = len(self.workers) or 1
+        self._processor = None
+
+        self._paused_total = 0.0
+        self._paused_at = None
+
+    def run(self, input_files, output_dir=None, output_paths=None, bundle_name=None) -> dict:
+        """
+        Xử lý cả batch, trả về file_results {file_name: {'status', 'errors'}} theo thứ tự input.
+        output_paths: {input_file: output_file} thay cho `<output_dir>/<tên file>.xml`;
+        khi có, file_results dùng input_file làm khóa (tránh trùng tên ở các thư mục khác nhau).
+        bundle_name: tên file zip khi output_options.bundle (mặc định theo thời gian chạy).
+        """
+        suffix = self.output_options.suffix if self.output_options else '.xml'
+        if output_paths is not None:
+            jobs = [_Job(input_file, output_paths[input_file], input_file) for input_file in input_files]
+        else:
+            jobs = [_Job(input_file, os.path.join(output_dir, f"{Path(input_file).stem}{suffix}"),
+                         Path(input_file).stem) for input_file in input_files]
+        # Lớn trước; sort ổn định nên file cùng chi phí giữ thứ tự chọn
+        pending = sorted(jobs, key=lambda job: job.cost.cost, reverse=True)
+
+        self._results = {}
+        self._total_files = len(jobs)
+        self._total_cost = sum(job.cost.cost for job in jobs) or 1
+        self._done_cost = 0
+        self._started = time.monotonic()
+        self._paused_total = 0.0
+        self._paused_at = None
+
+        total_mb = sum(job.cost.size for job in jobs) / (1024 * 1024)
+        heavy = sum(1 for job in jobs if job.cost.heavy)
+        self.log(f"📦 {len(jobs)} file ({total_mb:.1f} MB, {heavy} file nặng), "
+                 f"{self.workers_count} worker, xử lý file lớn trước")
+        self._report_progress()
+
+        if self.output_options is not None and self.output_options.bundle:
+            self._open_bundle(jobs, output_dir, bundle_name)
+        try:
+            if self.use_processes:
+                self.pool.start()
+                self._run_scheduled(pending)
+            else:
+                self._run_sequential(pending)
+        finally:
+            if self._bundle is not None:
+                self._close_bundle(jobs)
+
+        return {job.key: self._results[job.key] for job in jobs if job.key in self._results}
+
+    # ---------- gom file đầu ra vào zip ----------
+
+    def _open_bundle(self, jobs, output_dir, bundle_name):
+        base = output_dir or os.path.commonpath([os.path.dirname(job.output_file) for job in jobs])
+        for job in jobs:
+            job.arcname = os.path.relpath(job.output_file, base).replace(os.sep, '/')
+        bundle_name = bundle_name or time.strftime('xml_%Y%m%d_%H%M%S')
+        # File đã nén (.xml.gz / .xml.zst) chỉ lưu vào zip, không nén lại
+        compress = self.output_options.format == 'xml'
+        self._bundle = output_writer.BundleWriter(os.path.join(base, f"{bundle_name}.zip"),
+                                                  self.output_options.level_for('zip'), compress)
+
+    def _close_bundle(self, jobs):
+        entries = []
+        for job in jobs:
+            result = self._results.get(job.key, {'status': 'cancelled', 'errors': []})
+            entries.append({'source': os.path.basename(job.input_file),
+                            'output': job.arcname if job.bundled else None,
+                            'status': result['status'], 'errors': result['errors']})
+        try:
+            self.bundle_path = self._bundle.close(entries)
+            self.log(f"🗜 Đã gom {sum(job.bundled for job in jobs)} file vào {self.bundle_path}")
+        except Exception as e:
+            self.log(f"❌ Không tạo được file zip: {e}")
+        self._bundle = None
+
+    # ---------- tiến trình ----------
+
+    def _paused_now(self, now) -> float:
+        """Tổng thời gian đã tạm dừng tính tới `now`"""
+        if self._paused_at is not None:
+            return self._paused_total + now - self._paused_at
+        return self._paused_total
+
+    def _track_pause(self, now):
+        if self.control.is_paused and not self.control.is_cancelled:
+            if self._paused_at is None:
+                self._paused_at = now
+        elif self._paused_at is not None:
+            self._paused_total += now - self._paused_at
+            self._paused_at = None
+
+    def _report_progress(self):
+        now = time.monotonic()
+        fraction = self._done_cost / self._total_cost
+        eta = None
+        if self._done_cost:
+            elapsed = now - self._started - self._paused_now(now)
+            eta = elapsed * (self._total_cost - self._done_cost) / self._done_cost
+        self.set_progress(len(self._results), self._total_files, fraction, eta)
+
+    def _finish(self, job, status, errors):
+        self._results[job.key] = {'status': status, 'errors': errors}
+        if self._bundle is not None and status in ('success', 'error') and os.path.exists(job.output_file):
+            # Nén vào zip ở thread riêng trong lúc các file khác còn chạy
+            self._bundle.add(job.output_file, job.arcname)
+            job.bundled = True
+        self._done_cost += job.cost.cost
+        self._log_result(job, status, errors)
+        self._report_progress()
+
+    def _cancel_pending(self, pending):
+        for job in pending:
+            self._results[job.key] = {'status': 'cancelled', 'errors': ["Đã hủy trước khi xử lý"]}
+        if pending:
+            self.log(f"⏹ Đã hủy, bỏ qua {len(pending)} file còn lại")
+        pending.clear()
+
+    def _output_name(self, job) -> str:
+        """Tên file đầu ra để log: .xml / .xml.gz / .xml.zst, hoặc tên trong file zip"""
+        if job.bundled:
+            return f"{job.arcname} (trong {os.path.basename(self._bundle.path)})"
+        return os.path.basename(job.output_file)
+
+    def _log_result(self, job, status, errors):
+        file_name = job.file_name
+        if status == 'success':
+            self.log(f"✅ Hoàn thành: {self._output_name(job)}")
+        elif status == 'error':
+            self.log(f"⚠️ Hoàn thành có lỗi: {file_name}.docx")
+            for err in errors:
+                self.log(f"   - {err}")
+        elif status == 'timeout':
+            self.log(f"⏱ Quá thời gian, đã dừng: {file_name}.docx")
+        elif status == 'cancelled':
+            self.log(f"⏹ Đã hủy: {file_name}.docx")
+        else:
+            self.log(f"❌ Lỗi nghiêm trọng khi xử lý {file_name}.docx: {errors[0] if errors else ''}")
+
+    # ---------- chạy tuần tự trong thread ----------
+
+    def _run_sequential(self, pending):
+        while pending:
+            # Checkpoint giữa các file
+            self.control.wait_if_paused()
+            if self.control.is_cancelled:
+                self._cancel_pending(pending)
+                break
+            job = pending.pop(0)
+            self.log(f"🔄 Đang xử lý: {job.file_name}.docx...")
+            status, errors = self._run_inline(job.input_file, job.output_file)
+            self._finish(job, status, errors)
+
+    def _run_inline(self, input_file, output_file):
+        if self._processor is None:
+            from docx_processor import DocxProcessor
+            self._processor = DocxProcessor(**(self.processor_kwargs or {}))
+            self._processor.checkpoint = self.control.checkpoint
+        try:
+            errors = convert_file(self._processor, input_file, output_file, self.output_options)
+        except BatchCancelled:
+            return 'cancelled', ["Đã hủy khi đang xử lý"]
+        except Exception as e:
+            self.log(f"   Chi tiết: {traceback.format_exc()}")
+            return 'critical_error', [str(e)]
+        return ('error' if errors else 'success'), errors
+
+    # ---------- chạy trên worker process ----------
+
+    def _next_job(self, pending, running):
+        """File lớn nhất còn chờ mà không vượt giới hạn file nặng chạy cùng lúc"""
+        heavy_running = sum(1 for job in running.values() if job.cost.heavy)
+        for i, job in enumerate(pending):
+            if not job.cost.heavy or heavy_running < self.max_heavy:
+                return pending.pop(i)
+        return None
+
+    def _run_scheduled(self, pending):
+        running = {}  # FileWorker -> _Job
+
+        while pending or running:
+            now = time.monotonic()
+            self._track_pause(now)
+
+            if self.control.is_cancelled:
+                self._cancel_pending(pending)
+            elif not self.control.is_paused:
+                # Checkpoint giữa các file: chỉ giao file mới khi không tạm dừng / hủy
+                for worker in self.workers:
+                    if worker in running:
+                        continue
+                    job = self._next_job(pending, running)
+                    if job is None:
+                        break
+                    self.log(f"🔄 Đang xử lý: {job.file_name}.docx...")
+                    worker.submit(job.input_file, job.output_file, self.output_options)
+                    job.started = now
+                    job.paused_base = self._paused_now(now)
+                    running[worker] = job
+
+            if not running:
+                if pending:
+                    time.sleep(WATCH_INTERVAL_S)
+                continue
+
+            multiprocessing.connection.wait([worker.waitable for worker in running], WATCH_INTERVAL_S)
+            for worker, job in list(running.items()):
+                status, errors = self._watch(worker, job)
+                if status is not None:
+                    del running[worker]
+                    self._finish(job, status, errors)
+                    reason = self.pool.recycle_if_needed(worker)
+                    if reason:
+                        self.log(f"♻️ Khởi động lại worker ({reason})")
+
+    def _watch(self, worker, job):
+        """Kiểm tra một worker: (status, errors) nếu file đã xong / bị dừng, (None, None) nếu còn chạy"""
+        try:
+            result = worker.poll(0)
+        except WorkerDied as e:
+            self.pool.replace(worker)
+            self._discard_partial(job.output_file)
+            return 'critical_error', [str(e)]
+
+        if result is not None:
+            return self._map_result(result, job.output_file)
+
+        now = time.monotonic()
+        if self.control.is_cancelled:
+            job.cancelled_at = job.cancelled_at or now
+            if now - job.cancelled_at > CANCEL_GRACE_S:
+                self.pool.replace(worker)
+                self._discard_partial(job.output_file)
+                return 'cancelled', ["Đã hủy khi đang xử lý"]
+            return None, None
+
+        # Thời gian chạy không tính lúc tạm dừng
+        elapsed = now - job.started - (self._paused_now(now) - job.paused_base)
+        if elapsed > job.timeout:
+            self.pool.replace(worker)
+            self._discard_partial(job.output_file)
+            return 'timeout', [f"Quá thời gian xử lý ({job.timeout:.0f} giây), file đã bị dừng"]
+        return None, None
+
+    def _map_result(self, result, output_file):
+        kind = result[0]
+        if kind == 'done':
+            errors = result[1]
+            return ('error' if errors else 'success'), errors
+        if kind == 'cancelled':
+            self._discard_partial(output_file)
+            return 'cancelled', ["Đã hủy khi đang xử lý"]
+        self.log(f"   Chi tiết: {result[2]}")
+        return 'critical_error', [result[1]]
+
+    @staticmethod
+    def _discard_partial(output_file):
+        try:
+            os.remove(output_file + '.part')
+        except OSError:
+            pass
+
+    def close(self):
+        if self._own_pool:
+            self.pool.shutdown()
@@ -0,0 +1,52 @@
+# bench_table_tinhoc.py
+"""
+Đo TinHocProcessor.convert_table_tinhoc trên bảng lớn (có ô gộp ngang / dọc), so
+với cách duyệt cũ qua row.cells / cell.paragraphs của python-docx.
+
+    python bench_table_tinhoc.py [rows] [cols] [repeat]
+"""
+
+import sys
+import time
+
+from docx import Document
+
+from tinhoc_processor import TinHocProcessor
+
+
+def build_table(rows: int, cols: int):
+    doc = Document()
+    table = doc.add_table(rows=rows, cols=cols)
+    for r, row in enumerate(table.rows):
+        for c, cell in enumerate(row.cells):
+            cell.text = f'R{r}C{c}'
+    for r in range(0, rows - 1, 10):
+        table.cell(r, 0).merge(table.cell(r + 1, 0))
+        table.cell(r, 2).merge(table.cell(r, 3))
+    return table
+
+
+def legacy(tbl):
+    html = "<table class='table-material-question'>"
+    for row in tbl.rows:
+        html += '<tr>'
+        for cell in row.cells:
+            cell_html = ''.join(f'<p>{p.text.strip()}</p>' for p in cell.paragraphs if p.text.strip())
+            html += f'<td>{cell_html}</td>'
+        html += '</tr>'
+    return html + '</table><br>'
+
+
+def benchmark_table_tinhoc(rows: int = 200, cols: int = 8, repeat: int = 5):
+    table = build_table(rows, cols)
+    processor = TinHocProcessor()
+    for name, func in (('row.cells', legacy), ('get_table_grid', processor.convert_table_tinhoc)):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func(table)
+        elapsed = (time.perf_counter() - start) / repeat
+        print(f"{name}: {elapsed * 1000:.1f} ms / bảng {rows}x{cols}")
+
+
+if __name__ == '__main__':
+    benchmark_table_tinhoc(*(int(arg) for arg in sys.argv[1:4]))
@@ -0,0 +1,474 @@
+# conversion_service.py
+"""
+Dịch vụ chuyển đổi DOCX -> XML chạy trên localhost (chỉ dùng thư viện chuẩn).
+
+    python conversion_service.py --port 8765 --workers 2
+
+API (JSON, trừ kết quả XML):
+    POST   /jobs                 body .docx (?name=abc.docx hoặc header X-File-Name)
+                                 hoặc JSON {"path": "..."} / {"paths": ["...", ...]}
+                                 -> 202 {"job": {...}} / {"jobs": [...]}; 503 khi hàng đợi đầy
+    GET    /jobs                 danh sách job
+    GET    /jobs/<id>            trạng thái job
+    GET    /jobs/<id>/errors     danh sách lỗi của job
+    GET    /jobs/<id>/result     XML kết quả (stream theo từng khối, 409 nếu chưa xong)
+    DELETE /jobs/<id>            hủy job đang chờ / đang chạy, hoặc xóa job đã xong
+    GET    /health               tình trạng worker và hàng đợi
+    GET    /metrics              thông lượng (file/phút, MB/giây, thời gian trung bình)
+
+Job được xếp vào hàng đợi có giới hạn; mỗi worker là một WorkerPool một process
+(batch_runner), nên timeout, thay worker và hủy giống hệt khi chạy từ GUI.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlparse
+
+import image_optimizer
+import xml_validate
+from batch_runner import BatchRunner, WorkerPool, default_workers
+
+
+DEFAULT_PORT = 8765
+DEFAULT_QUEUE_SIZE = 500
+
+# Giới hạn kích thước file upload
+MAX_UPLOAD_BYTES = 512 * 1024 * 1024
+
+# Kích thước khối khi nhận upload / trả kết quả
+CHUNK_SIZE = 256 * 1024
+
+# Số job đã xong giữ lại (job cũ hơn bị xóa cùng thư mục làm việc)
+MAX_FINISHED_JOBS = 1000
+
+# Cửa sổ thời gian (giây) tính thông lượng trong /metrics
+METRICS_WINDOW_S = 60
+
+FINISHED_STATUSES = ('success', 'error', 'critical_error', 'timeout', 'cancelled')
+
+_JOB_PATH = re.compile(r'^/jobs/([0-9a-f]{32})(?:/(errors|result))?$')
+
+
+class QueueFullError(Exception):
+    """Hàng đợi job đã đầy"""
+
+
+class Job:
+    """Một file cần chuyển đổi"""
+
+    __slots__ = ('id', 'name', 'source_path', 'work_dir', 'uploaded', 'size', 'status', 'errors',
+                 'created', 'started', 'finished', 'pool')
+
+    def __init__(self, name, source_path, work_dir, uploaded):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.source_path = source_path
+        self.work_dir = work_dir
+        self.uploaded = uploaded
+        self.size = os.path.getsize(source_path)
+        self.status = 'queued'
+        self.errors = []
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.pool = None
+
+    @property
+    def output_path(self) -> str:
+        return os.path.join(self.work_dir, f"{Path(self.source_path).stem}.xml")
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'size': self.size,
+            'error_count': len(self.errors),
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'seconds': round(self.finished - self.started, 3) if self.finished and self.started else None,
+            'result': f"/jobs/{self.id}/result" if self.done and os.path.exists(self.output_path) else None,
+        }
+
+
+class ConversionService:
+    """Hàng đợi job có giới hạn + các luồng điều phối, mỗi luồng một worker process"""
+
+    def __init__(self, work_dir=None, workers=None, queue_size=DEFAULT_QUEUE_SIZE, processor_kwargs=None):
+        self.work_dir = work_dir or os.path.join(tempfile.gettempdir(), 'docx_xml_service')
+        os.makedirs(self.work_dir, exist_ok=True)
+        self.workers = max(1, workers or default_workers())
+        self.processor_kwargs = processor_kwargs
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._pools = []
+        self._threads = []
+        self._started_at = time.time()
+
+        # Thống kê cho /metrics
+        self._submitted = 0
+        self._status_counts = {status: 0 for status in FINISHED_STATUSES}
+        self._bytes_done = 0
+        self._busy_seconds = 0.0
+        self._recent = deque()  # (thời điểm xong, số byte) trong METRICS_WINDOW_S
+
+    # ---------- vòng đời ----------
+
+    def start(self):
+        for i in range(self.workers):
+            pool = WorkerPool(1, processor_kwargs=self.processor_kwargs)
+            pool.start()
+            thread = threading.Thread(target=self._dispatch, args=(pool,), name=f"dispatch-{i}", daemon=True)
+            thread.start()
+            self._pools.append(pool)
+            self._threads.append(thread)
+
+    def shutdown(self):
+        for pool in self._pools:
+            pool.control.cancel()
+        for _ in self._threads:
+            try:
+                self.queue.put_nowait(None)
+            except queue.Full:
+                pass
+        for thread in self._threads:
+            thread.join(10)
+        for pool in self._pools:
+            pool.shutdown()
+
+    # ---------- nhận job ----------
+
+    def submit_path(self, path) -> Job:
+        """Xếp hàng một file .docx có sẵn trên đĩa"""
+        path = os.path.abspath(path)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Không tìm thấy file: {path}")
+        if not path.lower().endswith('.docx'):
+            raise ValueError(f"Không phải file .docx: {path}")
+        if self.queue.full():
+            raise QueueFullError()
+        job_dir = tempfile.mkdtemp(prefix='job_', dir=self.work_dir)
+        return self._enqueue(Job(os.path.basename(path), path, job_dir, uploaded=False))
+
+    def submit_upload(self, stream, length, name) -> Job:
+        """Ghi body upload ra thư mục làm việc theo từng khối rồi xếp hàng"""
+        if self.queue.full():
+            raise QueueFullError()
+        name = os.path.basename(name or 'upload.docx') or 'upload.docx'
+        if not name.lower().endswith('.docx'):
+            name += '.docx'
+
+        job_dir = tempfile.mkdtemp(prefix='job_', dir=self.work_dir)
+        source_path = os.path.join(job_dir, name)
+        try:
+            with open(source_path, 'wb') as f:
+                remaining = length
+                while remaining > 0:
+                    chunk = stream.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise ValueError("Upload bị ngắt giữa chừng")
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            return self._enqueue(Job(name, source_path, job_dir, uploaded=True))
+        except BaseException:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+
+    def _enqueue(self, job) -> Job:
+        with self._lock:
+            self.jobs[job.id] = job
+            self._submitted += 1
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self.jobs.pop(job.id, None)
+                self._submitted -= 1
+            shutil.rmtree(job.work_dir, ignore_errors=True)
+            raise QueueFullError()
+        return job
+
+    # ---------- xử lý ----------
+
+    def _dispatch(self, pool):
+        runner = BatchRunner(pool.control, print, pool=pool)
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            if job.status != 'queued':  # đã bị hủy khi còn trong hàng đợi
+                continue
+
+            pool.control.reset()
+            with self._lock:
+                job.status = 'running'
+                job.started = time.time()
+                job.pool = pool
+            runner.log = lambda message, job_id=job.id: print(f"[{job_id[:8]}] {message}")
+
+            try:
+                results = runner.run([job.source_path], job.work_dir)
+                result = results.get(Path(job.source_path).stem,
+                                     {'status': 'critical_error', 'errors': ["Không có kết quả"]})
+            except Exception as e:
+                print(f"[ERROR] Job {job.id}: {e}")
+                result = {'status': 'critical_error', 'errors': [str(e)]}
+
+            self._finish(job, result['status'], result['errors'])
+
+    def _finish(self, job, status, errors):
+        now = time.time()
+        with self._lock:
+            job.status = status
+            job.errors = list(errors)
+            job.finished = now
+            job.pool = None
+            self._status_counts[status] += 1
+            if job.started:
+                self._busy_seconds += now - job.started
+            self._bytes_done += job.size
+            self._recent.append((now, job.size))
+            self._evict_finished()
+
+    def _evict_finished(self):
+        finished = [job for job in self.jobs.values() if job.done]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job.id]
+            shutil.rmtree(job.work_dir, ignore_errors=True)
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        with self._lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def delete(self, job_id) -> bool:
+        """Hủy job đang chờ / chạy; job đã xong thì xóa cùng thư mục làm việc"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return False
+            if job.status == 'queued':
+                job.status = 'cancelled'
+                job.errors = ["Đã hủy trước khi xử lý"]
+                job.finished = time.time()
+                self._status_counts['cancelled'] += 1
+                return True
+            if job.status == 'running':
+                job.pool.control.cancel()
+                return True
+            del self.jobs[job_id]
+        shutil.rmtree(job.work_dir, ignore_errors=True)
+        return True
+
+    # ---------- giám sát ----------
+
+    def health(self) -> dict:
+        alive = sum(1 for pool in self._pools for worker in pool.workers if worker.alive)
+        return {
+            'status': 'ok' if alive == len(self._pools) else 'degraded',
+            'workers': len(self._pools),
+            'workers_alive': alive,
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+        }
+
+    def metrics(self) -> dict:
+        now = time.time()
+        with self._lock:
+            while self._recent and self._recent[0][0] < now - METRICS_WINDOW_S:
+                self._recent.popleft()
+            finished = sum(self._status_counts.values())
+            window = min(METRICS_WINDOW_S, now - self._started_at) or 1
+            window_bytes = sum(size for _, size in self._recent)
+            return {
+                'uptime_seconds': round(now - self._started_at, 1),
+                'jobs_submitted': self._submitted,
+                'jobs_finished': finished,
+                'jobs_running': sum(1 for job in self.jobs.values() if job.status == 'running'),
+                'queue_depth': self.queue.qsize(),
+                'status_counts': dict(self._status_counts),
+                'bytes_processed': self._bytes_done,
+                'avg_seconds_per_file': round(self._busy_seconds / finished, 3) if finished else None,
+                'files_per_minute': round(len(self._recent) * 60 / window, 2),
+                'mb_per_second': round(window_bytes / window / (1024 * 1024), 3),
+            }
+
+
+# ============================================
+# HTTP
+# ============================================
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'DocxXmlService/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def service(self) -> ConversionService:
+        return self.server.service
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, code, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, code, message, headers=None):
+        self._send_json(code, {'error': message}, headers)
+
+    def do_GET(self):
+        path = urlparse(self.path).path.rstrip('/') or '/'
+        if path == '/health':
+            return self._send_json(200, self.service.health())
+        if path == '/metrics':
+            return self._send_json(200, self.service.metrics())
+        if path == '/jobs':
+            return self._send_json(200, {'jobs': self.service.list_jobs()})
+
+        match = _JOB_PATH.match(path)
+        if not match:
+            return self._send_error(404, "Không có endpoint này")
+        job = self.service.get(match.group(1))
+        if job is None:
+            return self._send_error(404, "Không tìm thấy job")
+
+        action = match.group(2)
+        if action is None:
+            return self._send_json(200, job.to_dict())
+        if action == 'errors':
+            return self._send_json(200, {'id': job.id, 'status': job.status, 'errors': job.errors})
+        return self._send_result(job)
+
+    def _send_result(self, job):
+        if not job.done:
+            return self._send_error(409, f"Job chưa xong (trạng thái: {job.status})")
+        try:
+            f = open(job.output_path, 'rb')
+        except OSError:
+            return self._send_error(404, f"Job không có kết quả (trạng thái: {job.status})")
+        with f:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/xml; charset=utf-8')
+            self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+            self.send_header('Content-Disposition', f'attachment; filename="{Path(job.output_path).name}"')
+            self.send_header('X-Job-Status', job.status)
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        if parsed.path.rstrip('/') != '/jobs':
+            return self._send_error(404, "Không có endpoint này")
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length <= 0 or length > MAX_UPLOAD_BYTES:
+            # Body chưa đọc, không dùng lại kết nối
+            self.close_connection = True
+            if length > MAX_UPLOAD_BYTES:
+                return self._send_error(413, "File quá lớn")
+            return self._send_error(400, "Thiếu body hoặc Content-Length không hợp lệ")
+
+        retry_headers = {'Retry-After': '5'}
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        try:
+            if content_type == 'application/json':
+                payload = json.loads(self.rfile.read(length).decode('utf-8'))
+                paths = payload.get('paths') or ([payload['path']] if payload.get('path') else [])
+                if not paths:
+                    return self._send_error(400, "Cần 'path' hoặc 'paths'")
+                jobs = [self.service.submit_path(p).to_dict() for p in paths]
+                return self._send_json(202, {'jobs': jobs} if 'paths' in payload else {'job': jobs[0]})
+
+            name = parse_qs(parsed.query).get('name', [None])[0] or self.headers.get('X-File-Name')
+            job = self.service.submit_upload(self.rfile, length, unquote(name) if name else None)
+            return self._send_json(202, {'job': job.to_dict()})
+        except QueueFullError:
+            self.close_connection = True
+            return self._send_error(503, "Hàng đợi đầy, thử lại sau", retry_headers)
+        except (FileNotFoundError, ValueError, KeyError, json.JSONDecodeError) as e:
+            return self._send_error(400, str(e))
+
+    def do_DELETE(self):
+        match = _JOB_PATH.match(urlparse(self.path).path.rstrip('/'))
+        if not match or match.group(2):
+            return self._send_error(404, "Không có endpoint này")
+        if not self.service.delete(match.group(1)):
+            return self._send_error(404, "Không tìm thấy job")
+        return self._send_json(200, {'id': match.group(1), 'deleted': True})
+
+
+class ServiceHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service: ConversionService, verbose=False):
+        super().__init__(address, ServiceRequestHandler)
+        self.service = service
+        self.verbose = verbose
+
+
+def serve(host='127.0.0.1', port=DEFAULT_PORT, workers=None, queue_size=DEFAULT_QUEUE_SIZE, work_dir=None,
+          verbose=False, processor_kwargs=None):
+    """Chạy dịch vụ tới khi Ctrl+C"""
+    service = ConversionService(work_dir, workers, queue_size, processor_kwargs)
+    service.start()
+    httpd = ServiceHTTPServer((host, port), service, verbose)
+    print(f"[DEBUG] Dịch vụ chuyển đổi chạy tại http://{host}:{httpd.server_address[1]} "
+          f"({service.workers} worker, hàng đợi {queue_size}, thư mục {service.work_dir})")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dịch vụ HTTP chuyển đổi DOCX sang XML")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=None, help="Số worker process (mặc định: nửa số CPU, tối đa 4)")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE)
+    parser.add_argument('--work-dir', default=None, help="Thư mục lưu file upload và kết quả")
+    parser.add_argument('--verbose', action='store_true', help="In log từng request")
+    image_optimizer.add_arguments(parser)
+    xml_validate.add_arguments(parser)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.queue_size, args.work_dir, args.verbose,
+          {**image_optimizer.processor_kwargs_from_args(args), **xml_validate.processor_kwargs_from_args(args)})
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,249 @@
+# delta_update.py
+"""
+Bản vá nhị phân (delta) giữa hai bản exe, để cập nhật không phải tải lại cả file.
+
+Exe onefile của PyInstaller đổi rất ít giữa hai release nhỏ (chỉ vài module trong
+archive), nhưng vị trí các phần có thể bị dịch. Cách tạo delta (chỉ cần stdlib):
+- đánh chỉ mục file cũ theo khối BLOCK_BYTES (hash của KEY_BYTES byte đầu mỗi khối);
+- duyệt file mới, gặp đoạn trùng khối cũ thì mở rộng tối đa hai phía -> lệnh COPY
+  (offset, độ dài) từ file cũ; phần còn lại -> lệnh INSERT dữ liệu mới;
+- dãy lệnh được nén lzma.
+
+Header (không nén) ghi SHA-256 của file cũ và file mới: áp dụng delta lên file
+gốc khác bản đã dùng để tạo, hoặc kết quả không khớp hash, đều ném DeltaError để
+nơi gọi quay về tải bản đầy đủ.
+
+    python delta_update.py make  old.exe new.exe patch.delta
+    python delta_update.py apply old.exe patch.delta out.exe
+    python delta_update.py --selftest
+"""
+
+import hashlib
+import json
+import lzma
+import os
+import struct
+import sys
+
+
+MAGIC = b'DXDELTA1'
+
+# Khối chỉ mục trên file cũ / số byte dùng làm khóa; đoạn trùng ngắn hơn
+# BLOCK_BYTES + KEY_BYTES có thể không được phát hiện (ghi thành INSERT)
+BLOCK_BYTES = 64
+KEY_BYTES = 32
+
+# Bước so sánh khi mở rộng đoạn trùng
+EXTEND_STEP = 4096
+
+_COPY = b'C'
+_INSERT = b'I'
+_COPY_STRUCT = struct.Struct('<QQ')
+_LEN_STRUCT = struct.Struct('<Q')
+_HEADER_LEN = struct.Struct('<I')
+
+
+class DeltaError(Exception):
+    """Delta hỏng, không khớp file gốc, hoặc kết quả sai hash"""
+
+
+def delta_asset_name(exe_name: str, from_version: str) -> str:
+    """Tên asset delta trong release: Convert_XML.exe.from-1.0.8.delta"""
+    return f"{exe_name}.from-{from_version.lstrip('vV')}.delta"
+
+
+def _sha256(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _index(old: bytes) -> dict:
+    index = {}
+    for offset in range(0, len(old) - KEY_BYTES + 1, BLOCK_BYTES):
+        index.setdefault(hash(old[offset:offset + KEY_BYTES]), offset)
+    return index
+
+
+def _extend_forward(old, new, o, n):
+    """Độ dài đoạn trùng old[o:] / new[n:]"""
+    length = 0
+    while old[o + length:o + length + EXTEND_STEP] == new[n + length:n + length + EXTEND_STEP] \
+            and o + length + EXTEND_STEP <= len(old) and n + length + EXTEND_STEP <= len(new):
+        length += EXTEND_STEP
+    while o + length < len(old) and n + length < len(new) and old[o + length] == new[n + length]:
+        length += 1
+    return length
+
+
+def diff(old: bytes, new: bytes):
+    """Sinh dãy lệnh (_COPY, offset, length) / (_INSERT, data) tạo new từ old"""
+    index = _index(old)
+    pos = literal_start = 0
+    last = len(new) - KEY_BYTES
+    while pos <= last:
+        key = new[pos:pos + KEY_BYTES]
+        o = index.get(hash(key))
+        if o is None or old[o:o + KEY_BYTES] != key:
+            pos += 1
+            continue
+        # Mở rộng ngược vào phần INSERT đang chờ
+        start, o_start = pos, o
+        while start > literal_start and o_start > 0 and new[start - 1] == old[o_start - 1]:
+            start -= 1
+            o_start -= 1
+        length = (pos - start) + _extend_forward(old, new, o, pos)
+        if start > literal_start:
+            yield _INSERT, new[literal_start:start]
+        yield _COPY, o_start, length
+        pos = literal_start = start + length
+    if literal_start < len(new):
+        yield _INSERT, new[literal_start:]
+
+
+def make_patch(old_path: str, new_path: str, patch_path: str, preset: int = 9) -> dict:
+    """Tạo file delta; trả về thống kê {copied, inserted, patch_size}"""
+    with open(old_path, 'rb') as f:
+        old = f.read()
+    with open(new_path, 'rb') as f:
+        new = f.read()
+
+    header = json.dumps({'old_sha256': _sha256(old), 'new_sha256': _sha256(new),
+                         'old_size': len(old), 'new_size': len(new)}).encode('utf-8')
+    copied = inserted = 0
+    tmp_path = patch_path + '.tmp'
+    with open(tmp_path, 'wb') as out:
+        out.write(MAGIC + _HEADER_LEN.pack(len(header)) + header)
+        with lzma.open(out, 'wb', preset=preset) as stream:
+            for op in diff(old, new):
+                if op[0] == _COPY:
+                    stream.write(_COPY + _COPY_STRUCT.pack(op[1], op[2]))
+                    copied += op[2]
+                else:
+                    stream.write(_INSERT + _LEN_STRUCT.pack(len(op[1])) + op[1])
+                    inserted += len(op[1])
+    os.replace(tmp_path, patch_path)
+    return {'copied': copied, 'inserted': inserted, 'patch_size': os.path.getsize(patch_path)}
+
+
+def read_header(patch_file) -> dict:
+    if patch_file.read(len(MAGIC)) != MAGIC:
+        raise DeltaError("Không phải file delta")
+    (length,) = _HEADER_LEN.unpack(patch_file.read(_HEADER_LEN.size))
+    return json.loads(patch_file.read(length).decode('utf-8'))
+
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise DeltaError("File delta bị cắt cụt")
+    return data
+
+
+def apply_patch(old_path: str, patch_path: str, out_path: str) -> str:
+    """
+    Áp dụng delta lên old_path, ghi ra out_path (qua file tạm).
+    Kiểm tra SHA-256 của file gốc trước và của kết quả sau; trả về SHA-256 kết quả.
+    """
+    with open(patch_path, 'rb') as patch_file:
+        header = read_header(patch_file)
+        with open(old_path, 'rb') as f:
+            old = f.read()
+        if len(old) != header['old_size'] or _sha256(old) != header['old_sha256']:
+            raise DeltaError("File hiện tại không phải bản gốc của delta")
+
+        digest = hashlib.sha256()
+        tmp_path = out_path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as out, lzma.open(patch_file, 'rb') as stream:
+                while True:
+                    op = stream.read(1)
+                    if not op:
+                        break
+                    if op == _COPY:
+                        offset, length = _COPY_STRUCT.unpack(_read_exact(stream, _COPY_STRUCT.size))
+                        if offset + length > len(old):
+                            raise DeltaError("Lệnh COPY vượt quá file gốc")
+                        data = old[offset:offset + length]
+                    elif op == _INSERT:
+                        (length,) = _LEN_STRUCT.unpack(_read_exact(stream, _LEN_STRUCT.size))
+                        data = _read_exact(stream, length)
+                    else:
+                        raise DeltaError(f"Lệnh delta không hợp lệ: {op!r}")
+                    out.write(data)
+                    digest.update(data)
+        except (lzma.LZMAError, EOFError, struct.error) as e:
+            _remove(tmp_path)
+            raise DeltaError(f"File delta hỏng: {e}") from e
+        except BaseException:
+            _remove(tmp_path)
+            raise
+
+    result = digest.hexdigest()
+    if result != header['new_sha256']:
+        _remove(tmp_path)
+        raise DeltaError("Kết quả sau khi áp dụng delta không khớp SHA-256")
+    os.replace(tmp_path, out_path)
+    return result
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _selftest():
+    import random
+    import tempfile
+    import time
+
+    rng = random.Random(0)
+    old = bytearray(rng.randbytes(20 * 1024 * 1024))
+    new = bytearray(old)
+    new[5_000_000:5_000_000] = rng.randbytes(300_000)          # chèn làm dịch phần sau
+    new[12_000_000:12_050_000] = rng.randbytes(50_000)          # sửa tại chỗ
+    del new[16_000_000:16_200_000]                               # xóa
+    new += rng.randbytes(10_000)
+
+    work_dir = tempfile.mkdtemp(prefix='delta_update_')
+    paths = {name: os.path.join(work_dir, name) for name in ('old', 'new', 'patch', 'out', 'other')}
+    for name, data in (('old', old), ('new', new), ('other', rng.randbytes(1024))):
+        with open(paths[name], 'wb') as f:
+            f.write(data)
+
+    started = time.perf_counter()
+    stats = make_patch(paths['old'], paths['new'], paths['patch'])
+    print(f"make: {time.perf_counter() - started:.1f}s, {stats}, full={len(new)}")
+    started = time.perf_counter()
+    apply_patch(paths['old'], paths['patch'], paths['out'])
+    with open(paths['out'], 'rb') as f:
+        ok = f.read() == new
+    assert ok, "apply: sai nội dung"
+    # Chỉ khoảng 360 KB thay đổi: delta phải nhỏ hơn nhiều so với file đầy đủ
+    assert stats['patch_size'] < len(new) // 10, f"delta quá lớn: {stats}"
+    print(f"apply: {time.perf_counter() - started:.1f}s, OK")
+
+    os.remove(paths['out'])
+    try:
+        apply_patch(paths['other'], paths['patch'], paths['out'])
+        raise AssertionError("sai file gốc: không phát hiện")
+    except DeltaError as e:
+        print(f"sai file gốc: {e}")
+    assert not os.path.exists(paths['out']), "sai file gốc: vẫn tạo file đích"
+
+
+def main(argv):
+    if argv[:1] == ['--selftest']:
+        _selftest()
+    elif argv[:1] == ['make'] and len(argv) == 4:
+        print(make_patch(*argv[1:]))
+    elif argv[:1] == ['apply'] and len(argv) == 4:
+        print(apply_patch(*argv[1:]))
+    else:
+        print(__doc__)
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
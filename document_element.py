@@ -8,6 +8,8 @@ from docx.oxml.text.paragraph import CT_P
 from docx.oxml.table import CT_Tbl
 from docx.shape import InlineShape
 from io import BytesIO
+from image_manifest import get_manifest
+import omml_latex
 
 
 class DocumentElement:
@@ -17,7 +19,8 @@ class DocumentElement:
         'PARAGRAPH': 'PARAGRAPH',
         'TEXT': 'TEXT',
         'TABLE': 'TABLE',
-        'INLINE_IMAGE': 'INLINE_IMAGE'
+        'INLINE_IMAGE': 'INLINE_IMAGE',
+        'EQUATION': 'EQUATION'
     }
     
     def __init__(self, element, element_type=None):
@@ -41,6 +44,26 @@ class DocumentElement:
             return 'UNKNOWN'
 
 
+def _image_wrapper(part: Any, drawing: Any) -> Dict:
+    """
+    Build an INLINE_IMAGE wrapper for a w:drawing node using the document's
+    image manifest (blob is read lazily through get_blob)
+    """
+    manifest = get_manifest(part)
+    ref = manifest.make_ref(drawing)
+    info = manifest.get(ref.rId)
+    if info is None or ref.cx is None:
+        raise KeyError(f"No image for drawing (rId={ref.rId})")
+    
+    return {
+        'type': 'INLINE_IMAGE',
+        'rId': ref.rId,
+        'image': info,
+        'width': ref.cx / 9525,  # Convert EMU to pixels (approx)
+        'height': ref.cy / 9525
+    }
+
+
 def get_num_children(element: Any) -> int:
     """Get number of children in element"""
     if isinstance(element, DocumentElement):
@@ -53,6 +76,10 @@ def get_num_children(element: Any) -> int:
         if hasattr(element, '_element') and hasattr(element._element, 'xpath'):
             inline_shapes = element._element.xpath('.//w:drawing')
             count += len(inline_shapes)
+            # Native Word equations (m:oMath / m:oMathPara) directly under the paragraph
+            if omml_latex.has_math(element._element):
+                count += sum(1 for child in element._element
+                             if child.tag in (omml_latex.TAG_OMATH, omml_latex.TAG_OMATH_PARA))
         return count
     elif isinstance(element, Table):
         return len(element.rows)
@@ -84,28 +111,12 @@ def get_child(element: Any, index: int) -> Any:
                         if run._element == child:
                             children.append(DocumentElement(run, 'TEXT'))
                             break
+                elif child.tag in (omml_latex.TAG_OMATH, omml_latex.TAG_OMATH_PARA):  # Equation
+                    children.append(DocumentElement(child, 'EQUATION'))
                 elif child.tag.endswith('drawing'):  # Drawing/Image
                     # Create inline shape wrapper
                     try:
-                        blip = child.xpath('.//a:blip', namespaces={
-                            'a': 'http://schemas.openxmlformats.org/drawingml/2006/main'
-                        })[0]
-                        rId = blip.get('{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed')
-                        image_part = element.part.related_parts[rId]
-                        
-                        # Get image dimensions
-                        extent = child.xpath('.//wp:extent', namespaces={
-                            'wp': 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing'
-                        })[0]
-                        width = int(extent.get('cx')) / 9525  # Convert EMU to pixels (approx)
-                        height = int(extent.get('cy')) / 9525
-                        
-                        img_wrapper = {
-                            'type': 'INLINE_IMAGE',
-                            'blob': image_part.blob,
-                            'width': width,
-                            'height': height
-                        }
+                        img_wrapper = _image_wrapper(element.part, child)
                         children.append(DocumentElement(img_wrapper, 'INLINE_IMAGE'))
                     except:
                         pass
@@ -161,12 +172,25 @@ def get_text(element: Any) -> str:
     return ''
 
 
+def get_math_html(element: Any) -> str:
+    """Get math-tex span (LaTeX) of an EQUATION element"""
+    if isinstance(element, DocumentElement):
+        element = element.element
+    
+    if getattr(element, 'tag', None) in (omml_latex.TAG_OMATH, omml_latex.TAG_OMATH_PARA):
+        return omml_latex.math_html(element)
+    
+    return ''
+
+
 def get_blob(element: Any) -> bytes:
     """Get blob from image element"""
     if isinstance(element, DocumentElement):
         element = element.element
     
     if isinstance(element, dict) and element.get('type') == 'INLINE_IMAGE':
+        if 'image' in element:
+            return element['image'].blob
         return element['blob']
     
     return b''
@@ -285,6 +309,46 @@ def get_cell(row: Any, index: int) -> Any:
     return None
 
 
+def get_table_grid(table: Any) -> List[List[Dict[str, Any]]]:
+    """
+    Build the merged-cell layout of a table in one pass over w:tr / w:tc.
+    
+    Args:
+        table: Table object or CT_Tbl element
+    
+    Returns:
+        One list per row holding a dict for every cell that starts in that row:
+        {'xml': w:tc element, 'col': logical column, 'rowspan': int, 'colspan': int}.
+        Cells continued by vMerge are folded into the rowspan of the cell above,
+        the same way DocxProcessor.convert_table_to_html lays out the grid.
+    """
+    tbl = table._tbl if isinstance(table, Table) else table
+    grid = []
+    # logical column -> (cell dict, last row index) of the cell that may continue downwards
+    open_cells = {}
+    
+    for r_idx, tr in enumerate(tbl.tr_lst):
+        row_cells = []
+        col = 0
+        for tc in tr.tc_lst:
+            colspan = tc.grid_span
+            if tc.vMerge == 'continue':
+                origin = open_cells.get(col)
+                if origin is not None and origin[1] == r_idx - 1:
+                    origin[0]['rowspan'] += 1
+                    open_cells[col] = (origin[0], r_idx)
+                col += colspan
+                continue
+            
+            cell = {'xml': tc, 'col': col, 'rowspan': 1, 'colspan': colspan}
+            open_cells[col] = (cell, r_idx)
+            row_cells.append(cell)
+            col += colspan
+        grid.append(row_cells)
+    
+    return grid
+
+
 # ============================================
 # Document Loading Helper
 # ============================================
@@ -359,26 +423,7 @@ def extract_runs_with_images(paragraph: Paragraph) -> List[DocumentElement]:
         
         elif child.tag.endswith('drawing'):  # Drawing/Image
             try:
-                # Extract image information
-                blip = child.xpath('.//a:blip', namespaces={
-                    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main'
-                })[0]
-                rId = blip.get('{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed')
-                image_part = paragraph.part.related_parts[rId]
-                
-                # Get image dimensions
-                extent = child.xpath('.//wp:extent', namespaces={
-                    'wp': 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing'
-                })[0]
-                width = int(extent.get('cx')) / 9525  # Convert EMU to pixels
-                height = int(extent.get('cy')) / 9525
-                
-                img_data = {
-                    'type': 'INLINE_IMAGE',
-                    'blob': image_part.blob,
-                    'width': width,
-                    'height': height
-                }
+                img_data = _image_wrapper(paragraph.part, child)
                 elements.append(DocumentElement(img_data, 'INLINE_IMAGE'))
             except Exception as e:
                 # Skip if image extraction fails
@@ -0,0 +1,140 @@
+# docx_api.py
+"""
+API thư viện để nhúng converter vào service khác, không cần file tạm.
+
+    from docx_api import convert, iter_items
+
+    # Cả tài liệu: XML hoàn chỉnh + danh sách lỗi
+    result = convert(data)              # data: đường dẫn, bytes hoặc file-like
+    result.xml, result.errors
+
+    # Từng câu hỏi / học liệu ngay khi render xong (chế độ stream, không giữ cả tài liệu)
+    stream = iter_items('de_thi.docx')
+    for item in stream:
+        item.kind, item.index, item.errors
+        item.xml          # đoạn XML của riêng phần tử
+        item.to_dict()    # dict {thẻ con: nội dung}
+    stream.errors         # toàn bộ lỗi, đầy đủ sau khi duyệt hết
+"""
+
+import io
+import os
+from typing import Iterator, List
+
+from xml_builder import HTML_MARK, clean_html, to_string
+
+
+def _as_source(source):
+    """Đường dẫn giữ nguyên; bytes / file-like chuyển thành file-like seek được (zip cần seek)"""
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(bytes(source))
+    if hasattr(source, 'read'):
+        seekable = getattr(source, 'seekable', None)
+        if seekable is not None and seekable():
+            return source
+        return io.BytesIO(source.read())
+    raise TypeError(f"Không hỗ trợ nguồn kiểu {type(source).__name__}")
+
+
+def _new_processor(processor, processor_kwargs):
+    if processor is not None:
+        return processor
+    from docx_processor import DocxProcessor
+    return DocxProcessor(**processor_kwargs)
+
+
+def element_to_dict(element):
+    """
+    Phần tử lá -> nội dung (HTML đã làm sạch như khi ghi XML); phần tử có con -> dict
+    {thẻ: giá trị}, thẻ lặp lại gom thành list.
+    """
+    children = list(element)
+    if not children:
+        text = element.text or ''
+        return clean_html(text) if element.get(HTML_MARK) is not None else text
+
+    result = {}
+    for child in children:
+        value = element_to_dict(child)
+        if child.tag in result:
+            if not isinstance(result[child.tag], list):
+                result[child.tag] = [result[child.tag]]
+            result[child.tag].append(value)
+        else:
+            result[child.tag] = value
+    return result
+
+
+class ConversionResult:
+    """Kết quả chuyển đổi cả tài liệu"""
+
+    __slots__ = ('xml', 'errors')
+
+    def __init__(self, xml: str, errors: List[str]):
+        self.xml = xml
+        self.errors = errors
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+class ConvertedItem:
+    """Một <question> hoặc <itemDocument> đã render xong"""
+
+    __slots__ = ('kind', 'index', 'element', 'errors')
+
+    def __init__(self, kind: str, index: int, element, errors: List[str]):
+        self.kind = kind          # 'question' | 'itemDocument'
+        self.index = index        # thứ tự trong tài liệu, từ 0
+        self.element = element    # phần tử lxml
+        self.errors = errors      # lỗi phát sinh từ sau phần tử trước tới phần tử này
+
+    @property
+    def xml(self) -> str:
+        return to_string(self.element, declaration=False)
+
+    def to_dict(self) -> dict:
+        return element_to_dict(self.element)
+
+
+class ItemStream:
+    """Iterable các ConvertedItem; root_tag biết ngay, errors đầy đủ sau khi duyệt hết"""
+
+    def __init__(self, root_tag: str, items: Iterator, errors: List[str]):
+        self.root_tag = root_tag
+        self.errors = errors
+        self._items = items
+
+    @property
+    def kind(self) -> str:
+        return 'itemDocument' if self.root_tag == 'itemDocuments' else 'question'
+
+    def __iter__(self) -> Iterator[ConvertedItem]:
+        kind = self.kind
+        seen = 0
+        for index, element in enumerate(self._items):
+            item_errors = self.errors[seen:]
+            seen = len(self.errors)
+            yield ConvertedItem(kind, index, element, item_errors)
+
+
+def convert(source, processor=None, **processor_kwargs) -> ConversionResult:
+    """Chuyển cả tài liệu (đường dẫn, bytes hoặc file-like) sang XML"""
+    processor = _new_processor(processor, processor_kwargs)
+    xml, errors = processor.process_docx(_as_source(source))
+    return ConversionResult(xml, errors)
+
+
+def iter_items(source, processor=None, **processor_kwargs) -> ItemStream:
+    """
+    Duyệt tài liệu ở chế độ stream, yield từng câu hỏi / học liệu ngay khi render
+    xong (phần tử đã dùng được giải phóng, bộ nhớ không tăng theo độ dài tài liệu).
+    """
+    processor = _new_processor(processor, processor_kwargs)
+    errors = []
+    root_tag, items = processor.stream_items(_as_source(source), errors)
+    return ItemStream(root_tag, items, errors)
+
@@ -0,0 +1,343 @@
+# docx_lint.py
+"""
+Kiểm tra nhanh (pre-flight) cấu trúc file DOCX trước khi chuyển đổi.
+
+    python docx_lint.py D:/de_thi/file.docx
+    python docx_lint.py D:/de_thi --workers 4 --json
+
+Chỉ chạy phần phân loại của DocxProcessor (header / "HL:" / "Câu N" trong
+classify_body, gom câu trong group_questions, tách "Lời giải" / "###" như
+protocol_of_q) và kiểm tra hình dạng đáp án giống các hàm dang_* / *_tinhoc:
+- không dựng HTML, không đọc / nén ảnh, không dựng IR nên mỗi file chỉ mất
+  vài chục ms;
+- lỗi kèm vị trí "dòng" (số thứ tự phần tử trong body, cùng cách đếm với lỗi
+  "Sai format header tại dòng N" của process_docx) và số thứ tự câu trong nhóm;
+- nhiều file thì chạy song song trên các process (mỗi process giữ một processor).
+Exit code 1 nếu có file bị lỗi.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from docx.oxml.table import CT_Tbl
+from docx.oxml.text.paragraph import CT_P
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+
+from batch_runner import default_workers
+from document_element import get_child, get_element_type, get_num_children, get_text
+
+
+_RE_TN_CHOICE = re.compile(r'^[A-Z]\.')
+_RE_TN_CORRECT = re.compile(r'\b([1-9]|1[0-9]|2[0-6])\b')
+_RE_DS_STATEMENT = re.compile(r'^[a-z]\s*[\.\)]', re.IGNORECASE)
+_RE_DT_BLANK = re.compile(r'\[\[.*?\]\]')
+_RE_TINHOC_CHOICE = re.compile(r'^[A-Za-z]\.')
+_RE_TINHOC_DS = re.compile(r'^[a-d]\)|^\d+\)|^-\s*[a-d]\)')
+
+# Processor dùng lại trong mỗi process (inline hoặc worker của lint_files)
+_processor = None
+
+
+class LintIssue:
+    """Một lỗi cấu trúc: dòng (1-based, có thể None), câu (số thứ tự trong nhóm) và nội dung"""
+
+    __slots__ = ('line', 'question', 'message')
+
+    def __init__(self, line, question, message):
+        self.line = line
+        self.question = question
+        self.message = message
+
+    def __str__(self):
+        where = []
+        if self.line is not None:
+            where.append(f"Dòng {self.line}")
+        if self.question is not None:
+            where.append(f"câu {self.question}")
+        return f"{', '.join(where)}: {self.message}" if where else self.message
+
+    def to_dict(self) -> dict:
+        return {'line': self.line, 'question': self.question, 'message': self.message}
+
+
+def _get_processor():
+    global _processor
+    if _processor is None:
+        from docx_processor import DocxProcessor
+        _processor = DocxProcessor()
+    return _processor
+
+
+def _first_text(para) -> str:
+    """Text của phần tử con đầu tiên (run) như các hàm *_tinhoc đọc"""
+    child = get_child(para, 0)
+    return get_text(child).strip() if get_element_type(child) == 'TEXT' else ''
+
+
+class _Linter:
+    """Kiểm tra một tài liệu đã phân loại, ghi lỗi vào self.issues"""
+
+    def __init__(self, processor, lines):
+        self.processor = processor
+        self.lines = lines  # phần tử XML -> dòng
+        self.issues = []
+
+    def add(self, para, question, message):
+        line = self.lines.get(para._element) if para is not None else None
+        self.issues.append(LintIssue(line, question, message))
+
+    def check_group(self, group):
+        questions = group['questions']
+        group_of_q = self.processor.group_questions(group)
+        if questions and not group_of_q:
+            self.add(questions[0], None, f"Nhóm [{group['tag']}] không có dòng 'Câu N' nào, nội dung bị bỏ qua")
+        elif group_of_q and questions[0] is not group_of_q[0]['items'][0]:
+            self.add(questions[0], None, "Nội dung nằm trước 'Câu' đầu tiên của nhóm bị bỏ qua")
+        for idx, question in enumerate(group_of_q):
+            try:
+                self.check_question(group, question['items'], idx + 1)
+            except Exception as e:
+                self.add(question['items'][0], idx + 1, f"Không kiểm tra được câu hỏi: {e}")
+        return len(group_of_q)
+
+    def check_question(self, group, items, index):
+        processor = self.processor
+        head = items[0]
+        parts = processor.split_solution(items)
+        if len(parts) < 2:
+            self.add(head, index, "Thiếu 'Lời giải'")
+            return
+        if len(parts) > 2:
+            self.add(head, index, "Có nhiều dòng 'Lời giải', phần sau dòng thứ hai bị bỏ qua")
+        if not parts[1]:
+            self.add(head, index, "'Lời giải' trống, không xác định được đáp án")
+            return
+
+        hdg = processor.split_hdg(parts[1])[0]
+        answer_para = hdg[0][0] if hdg[0] else None
+        answer = processor.memo.stripped(answer_para) if isinstance(answer_para, Paragraph) else ''
+        kind = processor.question_kind(answer)
+        tinhoc = processor.is_tinhoc_subject(group['subject'])
+
+        if kind == 'tn':
+            if tinhoc:
+                self.check_tn_tinhoc(parts[0], answer_para, head, index)
+            else:
+                self.check_tn(parts[0], hdg[0], head, index)
+        elif kind == 'ds':
+            if tinhoc:
+                self.check_ds_tinhoc(parts[0], answer_para, head, index)
+            else:
+                self.check_ds(parts[0], answer, head, index)
+        elif kind == 'dt':
+            texts = [processor.memo.stripped(p) for p in parts[0] if isinstance(p, Paragraph)]
+            if not any(_RE_DT_BLANK.search(text) for text in texts):
+                self.add(head, index, "Dạng điền từ nhưng không có ô trống [[...]]")
+
+    def check_tn(self, content, first_hdg, head, index):
+        memo = self.processor.memo
+        choices = [p for p in content if isinstance(p, Paragraph) and _RE_TN_CHOICE.match(memo.stripped(p))]
+        if not choices:
+            self.add(head, index, "Dạng trắc nghiệm nhưng không có phương án 'A.', 'B.', ...")
+            return
+        letters = [memo.stripped(p)[0] for p in choices]
+        expected = [chr(ord('A') + i) for i in range(len(choices))]
+        if letters != expected:
+            self.add(choices[0], index, f"Phương án không theo thứ tự A, B, C...: {', '.join(letters)}")
+
+        # Giống dang_tn: số đầu tiên trong đoạn đầu của lời giải
+        correct = None
+        for p in first_hdg:
+            if isinstance(p, Paragraph):
+                m = _RE_TN_CORRECT.search(memo.stripped(p))
+                if m:
+                    correct = int(m.group(1))
+                    break
+        if correct is None:
+            self.add(head, index, "Không tìm thấy số thứ tự đáp án đúng trong 'Lời giải'")
+        elif correct > len(choices):
+            self.add(head, index, f"Đáp án đúng {correct} vượt quá số phương án ({len(choices)})")
+
+    def check_ds(self, content, answer, head, index):
+        memo = self.processor.memo
+        statements = [p for p in content if isinstance(p, Paragraph) and _RE_DS_STATEMENT.match(memo.stripped(p))]
+        if not statements:
+            self.add(head, index, "Dạng đúng/sai nhưng không có phát biểu 'a)', 'b)', ...")
+        elif len(answer) != len(statements):
+            self.add(head, index, f"Đáp án '{answer}' có {len(answer)} ký tự nhưng có {len(statements)} phát biểu")
+        if set(answer) - {'0', '1'}:
+            self.add(head, index, f"Đáp án đúng/sai '{answer}' chỉ được gồm 0 và 1")
+
+    def check_tn_tinhoc(self, content, answer_para, head, index):
+        # Giống dang_tn_tinhoc: phương án là paragraph có run bắt đầu bằng 'A.' / 'a.'
+        choices = 0
+        for para in content[1:]:
+            for i in range(get_num_children(para)):
+                child = get_child(para, i)
+                if get_element_type(child) == 'TEXT' and _RE_TINHOC_CHOICE.match(get_text(child).strip()):
+                    choices += 1
+                    break
+        if not choices:
+            self.add(head, index, "Dạng trắc nghiệm (Tin học) nhưng không có phương án 'A.', 'B.', ...")
+            return
+        numbers = [int(ch) for ch in _first_text(answer_para) if ch.isdigit()]
+        if not numbers:
+            self.add(head, index, "Không tìm thấy số thứ tự đáp án đúng trong 'Lời giải'")
+        elif max(numbers) > choices:
+            self.add(head, index, f"Đáp án đúng {max(numbers)} vượt quá số phương án ({choices})")
+
+    def check_ds_tinhoc(self, content, answer_para, head, index):
+        # Giống dang_ds_tinhoc: phát biểu là paragraph có run đầu 'a)', '1)' hoặc '- a)'
+        statements = sum(1 for para in content[1:] if _RE_TINHOC_DS.match(_first_text(para)))
+        answers = _first_text(answer_para)
+        if not statements:
+            self.add(head, index, "Không đúng dạng ĐS (Tin học): không có phát biểu 'a)', 'b)', ...")
+        elif len(answers) != statements:
+            self.add(head, index, f"Không đúng số lượng đáp án dạng ĐS: '{answers}' cho {statements} phát biểu")
+
+
+def lint_docx(file_path, processor=None):
+    """
+    Kiểm tra cấu trúc một file DOCX.
+    Trả về (danh sách LintIssue, thời gian chạy tính bằng ms).
+    """
+    start = time.perf_counter()
+    processor = processor or _get_processor()
+    errors = []
+    issues = []
+    # Processor in log debug cho từng paragraph, chế độ lint không cần
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            doc = processor.load_document(file_path)
+        except Exception as e:
+            return [LintIssue(None, None, f"Không mở được file: {e}")], (time.perf_counter() - start) * 1000
+        processor.doc = doc
+        processor.tinhoc_processor.doc = doc
+        processor.memo.clear()
+
+        try:
+            paragraphs = []
+            lines = {}
+            for child in doc.element.body:
+                if isinstance(child, CT_P):
+                    paragraphs.append(Paragraph(child, doc))
+                elif isinstance(child, CT_Tbl):
+                    paragraphs.append(Table(child, doc))
+                else:
+                    continue
+                lines[child] = len(paragraphs)
+
+            list_hl, group_of_questions = processor.classify_body(paragraphs, errors)
+            issues.extend(LintIssue(None, None, error) for error in errors)
+
+            linter = _Linter(processor, lines)
+            if list_hl:
+                for hoc_lieu in list_hl:
+                    count = sum(linter.check_group(group) for group in hoc_lieu['groupOfQ'] if group['questions'])
+                    if not count:
+                        linter.add(hoc_lieu['content'][0], None, "Học liệu không có câu hỏi nào")
+            else:
+                if not group_of_questions:
+                    linter.add(None, None, "Không tìm thấy header [tag, posttype, level] nào")
+                for group in group_of_questions:
+                    linter.check_group(group)
+            issues.extend(linter.issues)
+        finally:
+            processor.close_document(doc)
+
+    return issues, (time.perf_counter() - start) * 1000
+
+
+def _lint_one(file_path):
+    """Chạy trong worker: kết quả dạng dict (picklable)"""
+    issues, elapsed_ms = lint_docx(file_path)
+    return {'issues': [issue.to_dict() for issue in issues], 'ms': elapsed_ms}
+
+
+def lint_files(files, workers=None, on_result=None):
+    """
+    Kiểm tra nhiều file, song song theo process khi workers > 1.
+    Trả về {file: {'issues': [dict], 'ms'}} theo thứ tự đầu vào;
+    on_result(file, result) được gọi ngay khi mỗi file xong.
+    """
+    workers = workers or default_workers()
+    results = {}
+    if workers <= 1 or len(files) < 2:
+        for file_path in files:
+            results[file_path] = _lint_one(file_path)
+            if on_result:
+                on_result(file_path, results[file_path])
+        return results
+
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(min(workers, len(files)), mp_context=ctx) as executor:
+        futures = {executor.submit(_lint_one, file_path): file_path for file_path in files}
+        for future in as_completed(futures):
+            file_path = futures[future]
+            try:
+                results[file_path] = future.result()
+            except Exception as e:
+                results[file_path] = {'issues': [LintIssue(None, None, f"Lỗi khi kiểm tra: {e}").to_dict()],
+                                      'ms': 0.0}
+            if on_result:
+                on_result(file_path, results[file_path])
+    return {file_path: results[file_path] for file_path in files}
+
+
+def collect_files(inputs):
+    """Danh sách file .docx từ các đường dẫn file / thư mục (quét đệ quy, bỏ file tạm ~$)"""
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(root, name) for name in sorted(names)
+                             if name.lower().endswith('.docx') and not name.startswith('~$'))
+        else:
+            files.append(path)
+    return files
+
+
+def format_issue(issue: dict) -> str:
+    return str(LintIssue(issue['line'], issue['question'], issue['message']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kiểm tra nhanh cấu trúc file DOCX (không chuyển đổi)")
+    parser.add_argument('inputs', nargs='+', help="File .docx hoặc thư mục")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--json', action='store_true', help="In kết quả dạng JSON")
+    args = parser.parse_args()
+
+    files = collect_files(args.inputs)
+    start = time.perf_counter()
+    results = lint_files(files, args.workers)
+    total_ms = (time.perf_counter() - start) * 1000
+    failed = sum(1 for result in results.values() if result['issues'])
+
+    if args.json:
+        json.dump([{'file': file_path, **result} for file_path, result in results.items()],
+                  sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        for file_path, result in results.items():
+            status = f"{len(result['issues'])} lỗi" if result['issues'] else "OK"
+            print(f"{file_path}: {status} ({result['ms']:.0f} ms)")
+            for issue in result['issues']:
+                print(f"    {format_issue(issue)}")
+        print(f"Tổng: {len(files)} file, {failed} file có lỗi, {total_ms:.0f} ms")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,252 @@
+# docx_loader.py
+"""
+Loader DOCX nhẹ, đọc thẳng từ file zip.
+
+python-docx `Document()` giải nén và parse mọi part (header, footer, styles,
+numbering, comments, theme, settings) và nạp toàn bộ ảnh vào RAM. Converter chỉ
+cần word/document.xml, file rels của nó và các ảnh được tham chiếu qua rId, nên
+loader này:
+- chỉ parse [Content_Types].xml, word/_rels/document.xml.rels và word/document.xml
+  (parse dạng stream từ entry zip, dùng parser của python-docx để giữ các class
+  CT_P / CT_Tbl / CT_R);
+- đọc ảnh trong word/media theo tên entry, chỉ khi ảnh thực sự được render.
+
+LightDocument / LightDocumentPart cung cấp đúng các thuộc tính mà Paragraph,
+Table, _Cell và DocxProcessor cần (element, part, rels, related_parts), nên có
+thể dùng thay cho Document ở mọi chỗ.
+"""
+
+import posixpath
+import threading
+import zipfile
+from io import BytesIO
+from typing import Dict, Iterator
+
+from lxml import etree
+from docx.oxml.ns import qn
+from docx.oxml.parser import element_class_lookup
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+
+
+NS_CT = 'http://schemas.openxmlformats.org/package/2006/content-types'
+NS_PR = 'http://schemas.openxmlformats.org/package/2006/relationships'
+RT_OFFICE_DOCUMENT = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument'
+
+DOCUMENT_PART = '/word/document.xml'
+
+
+def _make_parser(huge_tree=False):
+    """Parser giống oxml_parser của python-docx (cùng element class lookup)"""
+    parser = etree.XMLParser(remove_blank_text=True, resolve_entities=False, huge_tree=huge_tree)
+    parser.set_element_class_lookup(element_class_lookup)
+    return parser
+
+
+class DocxPackage:
+    """File zip .docx mở sẵn, đọc entry theo tên (thread-safe)"""
+
+    def __init__(self, source):
+        if isinstance(source, (bytes, bytearray)):
+            source = BytesIO(source)
+        self._zip = zipfile.ZipFile(source)
+        self._lock = threading.Lock()
+        self._content_types = None
+
+    def has(self, partname) -> bool:
+        try:
+            self._zip.getinfo(partname.lstrip('/'))
+            return True
+        except KeyError:
+            return False
+
+    def size(self, partname) -> int:
+        return self._zip.getinfo(partname.lstrip('/')).file_size
+
+    def read(self, partname) -> bytes:
+        with self._lock:
+            return self._zip.read(partname.lstrip('/'))
+
+    def open(self, partname):
+        """File-like đọc dạng stream (không nạp cả entry vào RAM)"""
+        return self._zip.open(partname.lstrip('/'))
+
+    def content_type(self, partname) -> str:
+        if self._content_types is None:
+            self._content_types = self._parse_content_types()
+        overrides, defaults = self._content_types
+        if partname in overrides:
+            return overrides[partname]
+        ext = posixpath.splitext(partname)[1].lstrip('.').lower()
+        return defaults.get(ext, 'application/octet-stream')
+
+    def _parse_content_types(self):
+        overrides, defaults = {}, {}
+        root = etree.fromstring(self.read('[Content_Types].xml'))
+        for node in root:
+            if node.tag == f'{{{NS_CT}}}Override':
+                overrides[node.get('PartName')] = node.get('ContentType')
+            elif node.tag == f'{{{NS_CT}}}Default':
+                defaults[node.get('Extension', '').lower()] = node.get('ContentType')
+        return overrides, defaults
+
+    def close(self):
+        self._zip.close()
+
+
+class LazyPart:
+    """Part (thường là ảnh trong word/media) chỉ đọc bytes khi truy cập .blob"""
+
+    def __init__(self, package: DocxPackage, partname: str):
+        self.package = package
+        self.partname = partname
+        self.content_type = package.content_type(partname)
+
+    @property
+    def blob(self) -> bytes:
+        return self.package.read(self.partname)
+
+    @property
+    def size(self) -> int:
+        return self.package.size(self.partname)
+
+
+class LightRelationship:
+    """Quan hệ rId trong document.xml.rels"""
+
+    def __init__(self, rId, reltype, target_ref, is_external, target_part=None):
+        self.rId = rId
+        self.reltype = reltype
+        self.target_ref = target_ref
+        self.is_external = is_external
+        self._target_part = target_part
+
+    @property
+    def target_part(self):
+        if self.is_external:
+            raise ValueError("target_part không xác định với quan hệ External")
+        return self._target_part
+
+
+class LightRelationships(Dict[str, LightRelationship]):
+    """dict rId -> LightRelationship, thêm related_parts như python-docx"""
+
+    @property
+    def related_parts(self):
+        return {rId: rel.target_part for rId, rel in self.items()
+                if not rel.is_external and rel.target_part is not None}
+
+
+class LightDocumentPart:
+    """Thay cho docx.parts.document.DocumentPart: element + rels"""
+
+    content_type = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml'
+    partname = DOCUMENT_PART
+
+    def __init__(self, package: DocxPackage, partname=DOCUMENT_PART):
+        self.package = package
+        self.partname = partname
+        self.element = None
+        self.rels = self._load_rels()
+        self._related_parts = None
+
+    @property
+    def related_parts(self):
+        if self._related_parts is None:
+            self._related_parts = self.rels.related_parts
+        return self._related_parts
+
+    def _load_rels(self) -> LightRelationships:
+        rels = LightRelationships()
+        base_dir = posixpath.dirname(self.partname)
+        rels_name = posixpath.join(base_dir, '_rels', posixpath.basename(self.partname) + '.rels')
+        if not self.package.has(rels_name):
+            return rels
+
+        root = etree.fromstring(self.package.read(rels_name))
+        for node in root.iter(f'{{{NS_PR}}}Relationship'):
+            rId = node.get('Id')
+            target = node.get('Target')
+            if node.get('TargetMode') == 'External':
+                rels[rId] = LightRelationship(rId, node.get('Type'), target, True)
+                continue
+
+            if target.startswith('/'):
+                partname = posixpath.normpath(target)
+            else:
+                partname = posixpath.normpath(posixpath.join(base_dir, target))
+            target_part = LazyPart(self.package, partname) if self.package.has(partname) else None
+            rels[rId] = LightRelationship(rId, node.get('Type'), target, False, target_part)
+        return rels
+
+
+class LightDocument:
+    """Adapter tối thiểu thay cho docx.document.Document"""
+
+    def __init__(self, package: DocxPackage, part: LightDocumentPart):
+        self.package = package
+        self.part = part
+
+    @property
+    def element(self):
+        return self.part.element
+
+    @property
+    def paragraphs(self):
+        return [Paragraph(p, self) for p in self.element.body.iterchildren(qn('w:p'))]
+
+    @property
+    def tables(self):
+        return [Table(tbl, self) for tbl in self.element.body.iterchildren(qn('w:tbl'))]
+
+    def close(self):
+        self.package.close()
+
+
+def _document_partname(package: DocxPackage) -> str:
+    """Tên part chính (thường là /word/document.xml), đọc từ _rels/.rels"""
+    if package.has('_rels/.rels'):
+        root = etree.fromstring(package.read('_rels/.rels'))
+        for node in root.iter(f'{{{NS_PR}}}Relationship'):
+            if node.get('Type') == RT_OFFICE_DOCUMENT:
+                return '/' + node.get('Target').lstrip('/')
+    return DOCUMENT_PART
+
+
+def open_document(source, parse_body=True, huge_tree=False) -> LightDocument:
+    """
+    Mở .docx từ đường dẫn, bytes hoặc file-like.
+    parse_body=False: chỉ đọc rels, để duyệt body bằng iter_body_elements().
+    """
+    package = DocxPackage(source)
+    part = LightDocumentPart(package, _document_partname(package))
+    if parse_body:
+        with package.open(part.partname) as stream:
+            part.element = etree.parse(stream, _make_parser(huge_tree)).getroot()
+    return LightDocument(package, part)
+
+
+def iter_body_elements(doc: LightDocument, huge_tree=True) -> Iterator:
+    """
+    Duyệt từng phần tử con trực tiếp của w:body (w:p, w:tbl, ...) bằng iterparse,
+    không dựng cả cây. Phần tử chỉ được yield khi đã parse xong; bên gọi dùng
+    release() khi không cần phần tử nữa để bộ nhớ không tăng theo độ dài tài liệu.
+    """
+    body_tag = qn('w:body')
+    with doc.package.open(doc.part.partname) as stream:
+        context = etree.iterparse(stream, events=('end',), remove_blank_text=True,
+                                  resolve_entities=False, huge_tree=huge_tree)
+        context.set_element_class_lookup(element_class_lookup)
+
+        for _, element in context:
+            parent = element.getparent()
+            if parent is not None and parent.tag == body_tag:
+                yield element
+
+
+def release(element):
+    """Xóa phần tử đã xử lý khỏi cây đang iterparse để giải phóng bộ nhớ"""
+    element.clear()
+    parent = element.getparent()
+    if parent is not None:
+        parent.remove(element)
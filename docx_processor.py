@@ -2,7 +2,6 @@
 # docx_processor.py
 
 import re
-import base64
 from io import BytesIO
 from docx import Document
 from docx.oxml.text.paragraph import CT_P
@@ -11,14 +10,21 @@ from docx.oxml.ns import qn
 from docx.table import Table as DocxTable, _Cell
 from docx.table import Table 
 from docx.text.paragraph import Paragraph
-from xml.etree.ElementTree import Element, SubElement, tostring
-from xml.dom import minidom
+from xml_builder import Element, SubElement, set_html, html_element, to_string
 # from tinhoc_processor import TinHocProcessor # Bỏ import nếu chưa có
 from typing import List, Union, Any, Optional
 import traceback
-from PIL import Image
-from io import BytesIO
 from bs4 import BeautifulSoup
+from image_manifest import get_manifest
+from image_optimizer import ImageOptimizer
+import vector_image
+import omml_latex
+import question_pool
+import xml_validate
+from output_writer import open_output
+import docx_loader
+from paragraph_memo import ParagraphMemo
+from document_element import get_table_grid
 
 
 try:
@@ -34,7 +40,8 @@ except ImportError:
 
 class DocxProcessor:
     """Class chính xử lý DOCX"""
-    def __init__(self):
+    def __init__(self, question_workers=1, parallel_min_questions=50, fast_loader=True,
+                 image_options=None, validate_output=None):
         self.subjects_with_default_titles = [
             "TOANTHPT", "VATLITHPT2", "HOATHPT2", "SINHTHPT2",
             "LICHSUTHPT", "DIALITHPT", "GDCDTHPT2", "NGUVANTHPT","VATLYTHPT2",
@@ -42,6 +49,22 @@ class DocxProcessor:
         ]
         self.tinhoc_subjects = ['TINHOCTHPT', 'TINHOC3']
         self.index_question = 0
+        # Số process render câu hỏi trong một tài liệu (1 = tuần tự)
+        self.question_workers = question_workers
+        self.parallel_min_questions = parallel_min_questions
+        self._question_pool = None
+        # Đọc DOCX bằng docx_loader (chỉ parse document.xml, ảnh đọc khi cần)
+        self.fast_loader = fast_loader
+        self.doc = None
+        # Text / hyperlink / cờ phân loại của từng paragraph, tính một lần cho mỗi tài liệu
+        self.memo = ParagraphMemo()
+        # Hàm gọi giữa các câu hỏi / học liệu để tạm dừng hoặc hủy (batch_runner.BatchControl.checkpoint)
+        self.checkpoint = None
+        # Thu nhỏ / nén lại ảnh nhúng (image_optimizer.ImageOptions); None = giữ nguyên ảnh gốc
+        self.image_options = image_options
+        self.image_optimizer = ImageOptimizer(image_options) if image_options is not None else None
+        # Kiểm tra lại file XML sau khi ghi (xml_validate); None = theo biến môi trường DOCX_XML_VALIDATE
+        self.validate_output = xml_validate.is_enabled(validate_output)
         self.tinhoc_processor = TinHocProcessor()
         self.nsmap = {
         'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
@@ -58,9 +81,14 @@ class DocxProcessor:
         
         try:
             print(f">>>>> Debug file path {file_path}")
-            doc = Document(file_path)
+            doc = self.load_document(file_path)
             self.doc = doc
             self.tinhoc_processor.doc = self.doc
+            # Quét ảnh một lần cho cả tài liệu, các renderer chỉ tra theo rId
+            self.images = get_manifest(doc.part)
+            if self.image_optimizer is not None:
+                self.image_optimizer.prefetch(self.images.images.values())
+            self.memo.clear()
             body = doc.element.body
             
             # Parse các elements theo thứ tự trong body
@@ -75,107 +103,7 @@ class DocxProcessor:
                 errors.append(f"Lỗi khi đọc cấu trúc body của DOCX: {str(e)}")
                 return "", errors
             
-            # Biến trạng thái
-            list_hl = []
-            group_of_questions = []
-            current_tag = None
-            current_table = None
-            content_hl = False
-            
-            for idx, para in enumerate(paragraphs):
-                try:
-                    is_table = isinstance(para, Table)
-                    
-                    # Xử lý table
-                    if is_table:
-                        current_table = para
-                        
-                        # ✅ SỬA: Thêm table vào học liệu nếu đang trong chế độ HL
-                        if content_hl and list_hl:
-                            list_hl[-1]['content'].append(current_table)
-                            print(f"[DEBUG] ✓ Thêm table vào học liệu tại idx={idx}")
-                            continue
-                        
-                        # Thêm vào câu hỏi thường
-                        if group_of_questions and group_of_questions[-1]['questions']:
-                            group_of_questions[-1]['questions'].append(current_table)
-                        continue
-                    
-                    # Bỏ qua paragraph rỗng
-                    if len(para.runs) == 0:
-                        continue
-                    
-                    text = para.text.strip()
-                    
-                    # ——— ƯU TIÊN 1: XỬ LÝ HEADER [tag, posttype, level] ———
-                    if re.match(r'^\[.*\]$', text):
-                        header = text.replace('[', '').replace(']', '')
-                        fields = [f.strip() for f in header.split(',')]
-                        
-                        if len(fields) != 3:
-                            errors.append(f"Sai format header tại dòng {idx + 1}: {text}")
-                            continue
-                        
-                        dvkt, posttype, knowledge = fields
-                        current_tag = dvkt
-                        cap_do = ['NB', 'TH', 'VD', 'VDC']
-                        knowledge_upper = knowledge.upper()
-                        level = cap_do.index(knowledge_upper) if knowledge_upper in cap_do else 0
-                        
-                        group = {
-                            'subject': dvkt.split('_')[0],
-                            'tag': dvkt,
-                            'original_tag': dvkt,
-                            'posttype': posttype,
-                            'knowledgelevel': knowledge_upper if knowledge_upper in cap_do else 'NB',
-                            'level': level,
-                            'questions': []
-                        }
-                        group_of_questions.append(group)
-                        content_hl = False
-                        continue
-                    
-                    # ——— ƯU TIÊN 2: XỬ LÝ DÒNG BẮT ĐẦU BẰNG "HL:" ———
-                    if text.startswith('HL:'):
-                        if list_hl:
-                            prev_group = group_of_questions[-1]
-                            group_of_questions = [{
-                                'subject': prev_group['subject'],
-                                'tag': prev_group['tag'],
-                                'posttype': prev_group['posttype'],
-                                'knowledgelevel': prev_group['knowledgelevel'],
-                                'level': prev_group['level'],
-                                'questions': []
-                            }]
-                        
-                        hoc_lieu = {
-                            'content': [para],  # Bắt đầu với paragraph "HL:"
-                            'groupOfQ': group_of_questions
-                        }
-                        content_hl = True
-                        list_hl.append(hoc_lieu)
-                        print(f"[DEBUG] ✓ Tạo học liệu mới tại idx={idx}")
-                        continue
-                    
-                    # ——— ƯU TIÊN 3: PHÁT HIỆN CÂU HỎI MỚI ———
-                    if re.match(r'^C[âa]u\s*\d', text, re.IGNORECASE):
-                        content_hl = False
-                    
-                    # ——— THÊM VÀO NỘI DUNG HỌC LIỆU (NẾU ĐANG TRONG CHẾ ĐỘ HL) ———
-                    if content_hl and list_hl:
-                        list_hl[-1]['content'].append(para)
-                        print(f"[DEBUG] ✓ Thêm paragraph vào học liệu tại idx={idx}")
-                        continue
-                    
-                    # ——— THÊM VÀO CÂU HỎI THƯỜNG ———
-                    if group_of_questions:
-                        para.current_tag = current_tag
-                        group_of_questions[-1]['questions'].append(para)
-                        
-                except Exception as e:
-                    import traceback
-                    errors.append(f"Lỗi khi xử lý paragraph #{idx} (text: {getattr(para, 'text', 'N/A')[:50]}...): {str(e)}")
-                    continue
+            list_hl, group_of_questions = self.classify_body(paragraphs, errors)
             
             # Tạo XML
             try:
@@ -195,8 +123,7 @@ class DocxProcessor:
                 return "", errors
             
             try:
-                xml_str = self.prettify_xml(root)
-                xml_str = self.post_process_xml(xml_str)
+                xml_str = to_string(root)
             except Exception as e:
                 errors.append(f"Lỗi khi định dạng XML: {str(e)}")
                 return "", errors
@@ -208,9 +135,433 @@ class DocxProcessor:
             import traceback
             traceback.print_exc()
             return "", errors
+        finally:
+            self.close_document(doc)
+
+    def classify_body(self, paragraphs, errors):
+        """
+        Máy trạng thái phân loại các phần tử body (Paragraph / Table) theo header,
+        "HL:" và "Câu N". Trả về (list_hl, group_of_questions); lỗi ghi vào errors.
+        """
+        # Biến trạng thái
+        list_hl = []
+        group_of_questions = []
+        current_tag = None
+        current_table = None
+        content_hl = False
+        
+        for idx, para in enumerate(paragraphs):
+            try:
+                is_table = isinstance(para, Table)
+                
+                # Xử lý table
+                if is_table:
+                    current_table = para
+                    
+                    # ✅ SỬA: Thêm table vào học liệu nếu đang trong chế độ HL
+                    if content_hl and list_hl:
+                        list_hl[-1]['content'].append(current_table)
+                        print(f"[DEBUG] ✓ Thêm table vào học liệu tại idx={idx}")
+                        continue
+                    
+                    # Thêm vào câu hỏi thường
+                    if group_of_questions and group_of_questions[-1]['questions']:
+                        group_of_questions[-1]['questions'].append(current_table)
+                    continue
+                
+                # Bỏ qua paragraph rỗng
+                if len(para.runs) == 0 and not omml_latex.has_math(para._p):
+                    continue
+                
+                text = self.memo.stripped(para)
+                
+                # ——— ƯU TIÊN 1: XỬ LÝ HEADER [tag, posttype, level] ———
+                if re.match(r'^\[.*\]$', text):
+                    group = self.parse_header(text)
+                    if group is None:
+                        errors.append(f"Sai format header tại dòng {idx + 1}: {text}")
+                        continue
+                    
+                    current_tag = group['tag']
+                    group_of_questions.append(group)
+                    content_hl = False
+                    continue
+                
+                # ——— ƯU TIÊN 2: XỬ LÝ DÒNG BẮT ĐẦU BẰNG "HL:" ———
+                if text.startswith('HL:'):
+                    if list_hl:
+                        prev_group = group_of_questions[-1]
+                        group_of_questions = [{
+                            'subject': prev_group['subject'],
+                            'tag': prev_group['tag'],
+                            'posttype': prev_group['posttype'],
+                            'knowledgelevel': prev_group['knowledgelevel'],
+                            'level': prev_group['level'],
+                            'questions': []
+                        }]
+                    
+                    hoc_lieu = {
+                        'content': [para],  # Bắt đầu với paragraph "HL:"
+                        'groupOfQ': group_of_questions
+                    }
+                    content_hl = True
+                    list_hl.append(hoc_lieu)
+                    print(f"[DEBUG] ✓ Tạo học liệu mới tại idx={idx}")
+                    continue
+                
+                # ——— ƯU TIÊN 3: PHÁT HIỆN CÂU HỎI MỚI ———
+                if re.match(r'^C[âa]u\s*\d', text, re.IGNORECASE):
+                    content_hl = False
+                
+                # ——— THÊM VÀO NỘI DUNG HỌC LIỆU (NẾU ĐANG TRONG CHẾ ĐỘ HL) ———
+                if content_hl and list_hl:
+                    list_hl[-1]['content'].append(para)
+                    print(f"[DEBUG] ✓ Thêm paragraph vào học liệu tại idx={idx}")
+                    continue
+                
+                # ——— THÊM VÀO CÂU HỎI THƯỜNG ———
+                if group_of_questions:
+                    para.current_tag = current_tag
+                    group_of_questions[-1]['questions'].append(para)
+                    
+            except Exception as e:
+                errors.append(f"Lỗi khi xử lý paragraph #{idx} (text: {getattr(para, 'text', 'N/A')[:50]}...): {str(e)}")
+                continue
+
+        return list_hl, group_of_questions
+
+    def parse_header(self, text):
+        """Header dạng [tag, posttype, level] -> group mới, None nếu sai format"""
+        header = text.replace('[', '').replace(']', '')
+        fields = [f.strip() for f in header.split(',')]
+        
+        if len(fields) != 3:
+            return None
+        
+        dvkt, posttype, knowledge = fields
+        cap_do = ['NB', 'TH', 'VD', 'VDC']
+        knowledge_upper = knowledge.upper()
+        level = cap_do.index(knowledge_upper) if knowledge_upper in cap_do else 0
+        
+        return {
+            'subject': dvkt.split('_')[0],
+            'tag': dvkt,
+            'original_tag': dvkt,
+            'posttype': posttype,
+            'knowledgelevel': knowledge_upper if knowledge_upper in cap_do else 'NB',
+            'level': level,
+            'questions': []
+        }
+
+    # ============================================
+    # Chế độ stream cho tài liệu rất lớn
+    # ============================================
+
+    def process_docx_stream(self, file_path, output_path, output_options=None):
+        """
+        Xử lý DOCX rất lớn mà không giữ cả tài liệu trong RAM.
+        Duyệt word/document.xml bằng iterparse, chạy cùng máy trạng thái header / HL /
+        câu hỏi như process_docx, ghi mỗi câu hỏi (hoặc học liệu) ra `output_path` ngay
+        khi nó kết thúc rồi giải phóng các phần tử đã dùng. Trả về danh sách lỗi.
+        output_options (output_writer.OutputOptions): nén dần trong lúc ghi.
+        """
+        errors = []
+
+        try:
+            root_tag, items = self.stream_items(file_path, errors)
+
+            with open_output(output_path, output_options) as out:
+                out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+                written = 0
+                for item in items:
+                    if written == 0:
+                        out.write(f'<{root_tag}>\n')
+                    out.write(self._stream_fragment(item))
+                    written += 1
+                out.write(f'</{root_tag}>\n' if written else f'<{root_tag}/>\n')
+
+        except Exception as e:
+            errors.append(f"Lỗi nghiêm trọng khi xử lý file '{file_path}': {str(e)}")
+            traceback.print_exc()
+        finally:
+            # items chưa duyệt tới (lỗi khi mở file đầu ra) thì generator không tự đóng tài liệu
+            self.close_document()
+
+        return errors
+
+    def stream_items(self, file_path, errors):
+        """
+        Mở tài liệu (đường dẫn, bytes hoặc file-like) ở chế độ stream.
+        Trả về (root_tag, items): root_tag là 'itemDocuments' hoặc 'questions', items là
+        generator yield từng phần tử <itemDocument> / <question> ngay khi render xong.
+        Lỗi được ghi thêm vào `errors` trong lúc duyệt items.
+        """
+        print(f">>>>> Debug file path (stream) {file_path}")
+        self.close_document()
+        doc = docx_loader.open_document(file_path, parse_body=False)
+        try:
+            self.doc = doc
+            self.tinhoc_processor.doc = self.doc
+            # Ảnh được đánh chỉ mục dần theo từng phần tử body khi đọc tới
+            self.images = get_manifest(doc.part, scan_body=False)
+            self.memo.clear()
+
+            # Chế độ học liệu quyết định thẻ gốc, nên cần biết trước khi ghi
+            if self._stream_has_hoc_lieu(doc):
+                root_tag, items = 'itemDocuments', self._stream_hoc_lieu(doc, errors)
+            else:
+                root_tag, items = 'questions', self._stream_questions(doc, errors)
+        except BaseException:
+            self.close_document(doc)
+            raise
+        return root_tag, self._close_after(doc, items)
+
+    def _close_after(self, doc, items):
+        """Yield các phần tử của `items`, đóng tài liệu khi duyệt xong (hoặc generator bị đóng giữa chừng)"""
+        try:
+            yield from items
+        finally:
+            self.close_document(doc)
+
+    def _stream_has_hoc_lieu(self, doc):
+        """Quét nhanh một lượt: tài liệu có đoạn nào bắt đầu bằng 'HL:' không"""
+        for element in docx_loader.iter_body_elements(doc):
+            found = (isinstance(element, CT_P) and len(element.r_lst) > 0
+                     and element.text.strip().startswith('HL:'))
+            docx_loader.release(element)
+            if found:
+                return True
+        return False
+
+    def _stream_paragraphs(self, doc):
+        """(idx, Paragraph | Table) theo thứ tự body, giống danh sách `paragraphs` của process_docx"""
+        idx = 0
+        for element in docx_loader.iter_body_elements(doc):
+            if isinstance(element, CT_P):
+                para = Paragraph(element, doc)
+            elif isinstance(element, CT_Tbl):
+                para = Table(element, doc)
+            else:
+                docx_loader.release(element)
+                continue
+            refs = self.images.index(element)
+            if self.image_optimizer is not None:
+                for ref in refs:
+                    info = self.images.get(ref.rId)
+                    if info is not None:
+                        self.image_optimizer.submit(info, ref.extent)
+            yield idx, para
+            idx += 1
+
+    def _stream_release(self, items):
+        """Giải phóng các paragraph/table đã render xong"""
+        for item in items:
+            self.images.discard(item._element)
+            self.memo.discard(item._element)
+            docx_loader.release(item._element)
+
+    def _stream_fragment(self, elem):
+        """Chuỗi XML của một phần tử con của thẻ gốc, thụt lề như khi ghi cả tài liệu"""
+        return to_string(elem, declaration=False, level=1)
+
+    def _stream_questions(self, doc, errors):
+        """Chế độ câu hỏi thường: yield từng phần tử <question> khi khối 'Câu' kết thúc"""
+        self.index_question = 0
+        group = None
+        group_started = False  # nhóm hiện tại đã có phần tử nào chưa
+        question = None
+        question_idx = -1
+
+        def close_question():
+            each_question_xml = self.render_question(group, question, question_idx, errors)
+            self._stream_release(question['items'])
+            if each_question_xml is None:
+                return None
+            self.index_question += 1
+            return each_question_xml
+
+        for idx, para in self._stream_paragraphs(doc):
+            try:
+                if isinstance(para, Table):
+                    if group_started and question is not None:
+                        question['items'].append(para)
+                    else:
+                        self._stream_release([para])
+                    continue
+
+                if len(para.runs) == 0 and not omml_latex.has_math(para._p):
+                    self._stream_release([para])
+                    continue
+
+                text = self.memo.stripped(para)
+
+                if re.match(r'^\[.*\]$', text):
+                    new_group = self.parse_header(text)
+                    self._stream_release([para])
+                    if new_group is None:
+                        errors.append(f"Sai format header tại dòng {idx + 1}: {text}")
+                        continue
+                    # Câu cuối của nhóm trước kết thúc tại header mới
+                    if question is not None:
+                        item = close_question()
+                        question = None
+                        if item is not None:
+                            yield item
+                    group = new_group
+                    group_started = False
+                    question_idx = -1
+                    continue
+
+                if group is None:
+                    self._stream_release([para])
+                    continue
+
+                group_started = True
+                if re.match(r'^c[ââ]u.\d', text.lower()):
+                    if question is not None:
+                        item = close_question()
+                        if item is not None:
+                            yield item
+                    question_idx += 1
+                    question = {
+                        'items': [para],
+                        'question_tag': group['tag'],
+                    }
+                elif question is not None:
+                    question['items'].append(para)
+                else:
+                    self._stream_release([para])
+
+            except Exception as e:
+                errors.append(f"Lỗi khi xử lý paragraph #{idx} (text: {getattr(para, 'text', 'N/A')[:50]}...): {str(e)}")
+                continue
+
+        if question is not None:
+            item = close_question()
+            if item is not None:
+                yield item
+
+    def _stream_hoc_lieu(self, doc, errors):
+        """Chế độ học liệu: yield từng phần tử <itemDocument> khi gặp 'HL:' kế tiếp hoặc hết tài liệu"""
+        hoc_lieu = None
+        index_hl = 0
+        group_of_questions = []
+        current_tag = None
+        content_hl = False
+
+        def close_hoc_lieu(hoc_lieu, index_hl):
+            try:
+                return self.create_hoc_lieu_xml(hoc_lieu, index_hl)
+            except Exception as e:
+                errors.append(f"Lỗi khi tạo XML: {str(e)}")
+                return None
+            finally:
+                self._stream_release(hoc_lieu['content'])
+                for group in hoc_lieu['groupOfQ']:
+                    self._stream_release(group['questions'])
+
+        for idx, para in self._stream_paragraphs(doc):
+            try:
+                if isinstance(para, Table):
+                    if content_hl and hoc_lieu is not None:
+                        hoc_lieu['content'].append(para)
+                    elif group_of_questions and group_of_questions[-1]['questions']:
+                        group_of_questions[-1]['questions'].append(para)
+                    else:
+                        self._stream_release([para])
+                    continue
+
+                if len(para.runs) == 0 and not omml_latex.has_math(para._p):
+                    self._stream_release([para])
+                    continue
+
+                text = self.memo.stripped(para)
+
+                if re.match(r'^\[.*\]$', text):
+                    group = self.parse_header(text)
+                    self._stream_release([para])
+                    if group is None:
+                        errors.append(f"Sai format header tại dòng {idx + 1}: {text}")
+                        continue
+                    current_tag = group['tag']
+                    group_of_questions.append(group)
+                    content_hl = False
+                    continue
+
+                if text.startswith('HL:'):
+                    if hoc_lieu is not None:
+                        prev_group = group_of_questions[-1]
+                        item = close_hoc_lieu(hoc_lieu, index_hl)
+                        index_hl += 1
+                        if item is not None:
+                            yield item
+                        group_of_questions = [{
+                            'subject': prev_group['subject'],
+                            'tag': prev_group['tag'],
+                            'posttype': prev_group['posttype'],
+                            'knowledgelevel': prev_group['knowledgelevel'],
+                            'level': prev_group['level'],
+                            'questions': []
+                        }]
+
+                    hoc_lieu = {
+                        'content': [para],
+                        'groupOfQ': group_of_questions
+                    }
+                    content_hl = True
+                    continue
+
+                if re.match(r'^C[âa]u\s*\d', text, re.IGNORECASE):
+                    content_hl = False
+
+                if content_hl and hoc_lieu is not None:
+                    hoc_lieu['content'].append(para)
+                elif group_of_questions:
+                    para.current_tag = current_tag
+                    group_of_questions[-1]['questions'].append(para)
+                else:
+                    self._stream_release([para])
+
+            except Exception as e:
+                errors.append(f"Lỗi khi xử lý paragraph #{idx} (text: {getattr(para, 'text', 'N/A')[:50]}...): {str(e)}")
+                continue
+
+        if hoc_lieu is not None:
+            item = close_hoc_lieu(hoc_lieu, index_hl)
+            if item is not None:
+                yield item
+
+    def load_document(self, file_path):
+        """Mở DOCX bằng loader nhẹ, lỗi thì quay về python-docx Document"""
+        self.close_document()
+
+        if self.fast_loader:
+            try:
+                return docx_loader.open_document(file_path)
+            except Exception as e:
+                print(f"[WARN] docx_loader không đọc được '{file_path}', dùng python-docx: {e}")
+        return Document(file_path)
+
+    def close_document(self, doc=None):
+        """
+        Đóng tài liệu `doc` (mặc định tài liệu đang xử lý): loader nhẹ giữ file .docx mở
+        để đọc ảnh khi cần, nên phải đóng ngay khi xong, không đợi tới file sau (Windows
+        khóa file đang mở). Bỏ luôn các tham chiếu của processor tới tài liệu.
+        """
+        doc = doc if doc is not None else self.doc
+        if doc is None:
+            return
+        if doc is self.doc:
+            self.doc = None
+            self.tinhoc_processor.doc = None
+            self.memo.clear()
+        if isinstance(doc, docx_loader.LightDocument):
+            doc.close()
 
     def create_hoc_lieu_xml(self, hoc_lieu, index_hl):
         """Tạo XML cho học liệu"""
+        if self.checkpoint is not None:
+            self.checkpoint()
         item_doc = Element('itemDocument')
 
         questions_hl = [g for g in hoc_lieu['groupOfQ'] if g['questions']]
@@ -227,11 +578,9 @@ class DocxProcessor:
 
         group_material.text = str(index_hl)
 
-        content_html = SubElement(item_doc, 'contentHtml')
-
         html_content = self.xu_ly_hl(hoc_lieu['content'])
 
-        content_html.text = html_content
+        html_element(item_doc, 'contentHtml', html_content)
 
         list_question = SubElement(item_doc, 'listQuestion')
         for group in questions_hl:
@@ -444,15 +793,22 @@ class DocxProcessor:
 
             try:
                 # 1. CẮT 'HL:' nếu có
-                full_text = p.text
+                full_text = self.memo.text(p)
                 hl_match = re.match(r"^\s*(H\s*L\s*[:：\-]\s*)", full_text, re.IGNORECASE)
                 hl_cut_pos = hl_match.end() if hl_match else 0
                 
                 # 2. XÂY DỰNG HTML từ runs (sau khi cắt HL:)
                 html = ""
                 current_pos = 0
+                # Công thức Word (OMML) giữa các run: (số run đứng trước, span math-tex)
+                math_slots = omml_latex.math_slots(p._p)
                 
-                for run in p.runs:
+                for run_index, run in enumerate(p.runs):
+                    while math_slots and math_slots[0][0] == run_index:
+                        if current_pos >= hl_cut_pos:
+                            html += math_slots[0][1]
+                        math_slots.pop(0)
+
                     run_text = run.text or ""
                     if not run_text:
                         continue
@@ -492,6 +848,9 @@ class DocxProcessor:
                     
                     html += seg
 
+                for _, math_html in math_slots:
+                    html += math_html
+
                 # 3. XỬ LÝ ẢNH từ runs
                 for run in p.runs:
                     try:
@@ -503,16 +862,10 @@ class DocxProcessor:
 
                 # 4. XỬ LÝ ẢNH DRAWING TRỰC TIẾP
                 try:
-                    drawings = p._element.findall('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}drawing')
-                    for drawing in drawings:
-                        blip = drawing.find('.//{http://schemas.openxmlformats.org/drawingml/2006/main}blip')
-                        if blip is not None:
-                            rId = blip.get('{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed')
-                            if rId:
-                                width_emu, height_emu = self.lay_kich_thuoc_tu_word_xml(drawing)
-                                img_tag = self._make_img_tag_from_rid(rId, width_emu, height_emu)
-                                if img_tag:
-                                    html += img_tag
+                    for ref in self.images.refs_for(p._element, 'blip'):
+                        img_tag = self._make_img_tag_from_rid(ref.rId, ref.cx, ref.cy, ref.extent)
+                        if img_tag:
+                            html += img_tag
                 except Exception as e:
                     print(f"[ERROR] Lỗi xử lý drawing trực tiếp: {e}")
                     import traceback
@@ -594,109 +947,23 @@ class DocxProcessor:
     def convert_table_to_html(self, table: DocxTable, is_hoc_lieu=False) -> str:
         # Thêm border, cellpadding, cellspacing như HTML "đúng"
         html = '<table class="table-material-question">'
-        grid = []  # grid[r][c] = dict (ô gốc) hoặc "OCCUPIED"
 
         try:
-            rows = table.rows
-            n_rows = len(rows)
-
-            # Giai đoạn 1: Phân tích từng dòng với con trỏ cột logic
-            for r_idx in range(n_rows):
-                row = rows[r_idx]
-                while len(grid) <= r_idx:
-                    grid.append([])
-
-                logical_col = 0  # Con trỏ cột logic, bắt đầu từ 0 mỗi dòng
-
-                for cell_xml in row._element:
-                    if cell_xml.tag != qn('w:tc'):
-                        continue
-
-                    tc_pr = cell_xml.find(qn('w:tcPr'))
-
-                    # --- COLSPAN ---
-                    grid_span = tc_pr.find(qn('w:gridSpan')) if tc_pr is not None else None
-                    colspan = int(grid_span.get(qn('w:val'))) if grid_span is not None else 1
-
-                    # --- Kiểm tra vMerge ---
-                    vmerge_val = self.get_vmerge_value(tc_pr)
-
-                    if vmerge_val == "continue":
-                        # Đánh dấu các ô bị chiếm trong grid
-                        for dc in range(colspan):
-                            c = logical_col + dc
-                            while len(grid[r_idx]) <= c:
-                                grid[r_idx].append(None)
-                            grid[r_idx][c] = "OCCUPIED"
-                        logical_col += colspan
-                        continue
-
-                    # --- Tính ROWSPAN bằng cách dò xuống dưới ---
-                    rowspan = 1
-                    for rr in range(r_idx + 1, n_rows):
-                        next_row = rows[rr]
-                        next_logical_col = 0
-                        found = False
-
-                        for next_cell in next_row._element:
-                            if next_cell.tag != qn('w:tc'):
-                                continue
-
-                            next_tc_pr = next_cell.find(qn('w:tcPr'))
-                            next_grid_span = next_tc_pr.find(qn('w:gridSpan')) if next_tc_pr is not None else None
-                            next_colspan = int(next_grid_span.get(qn('w:val'))) if next_grid_span is not None else 1
-
-                            # Nếu đúng cột logic cần kiểm tra
-                            if next_logical_col == logical_col:
-                                next_vmerge = self.get_vmerge_value(next_tc_pr)
-                                if next_vmerge == "continue":
-                                    rowspan += 1
-                                    found = True
-                                break
-
-                            next_logical_col += next_colspan
-
-                        if not found:
-                            break
-
-                    # Tạo cell object
-                    cell_obj = _Cell(cell_xml, row)
-                    cell_data = {
-                        "cell": cell_obj,
-                        "xml": cell_xml,
-                        "rowspan": rowspan,
-                        "colspan": colspan,
-                    }
-
-                    # Đánh dấu vào grid
-                    for dr in range(rowspan):
-                        tr = r_idx + dr
-                        while len(grid) <= tr:
-                            grid.append([])
-                        for dc in range(colspan):
-                            tc = logical_col + dc
-                            while len(grid[tr]) <= tc:
-                                grid[tr].append(None)
-                            if dr == 0 and dc == 0:
-                                grid[tr][tc] = cell_data
-                            else:
-                                grid[tr][tc] = "OCCUPIED"
-
-                    logical_col += colspan
+            # Giai đoạn 1: Dựng lưới ô gốc (colspan / rowspan) trong một lượt qua w:tr / w:tc
+            grid = get_table_grid(table)
 
             # Giai đoạn 2: Render HTML từ grid
             for row in grid:
                 html += "<tr>"
                 for cell in row:
-                    if not isinstance(cell, dict):
-                        continue
+                    cell_obj = _Cell(cell["xml"], table)
                     parts = []
                     for child in cell["xml"]:
                         if child.tag == qn("w:tbl"):
-                            nested = DocxTable(child, cell["cell"])
+                            nested = DocxTable(child, cell_obj)
                             parts.append(self.convert_table_to_html(nested, is_hoc_lieu))
                         elif child.tag == qn("w:p"):
-                            p = Paragraph(child, cell["cell"])
+                            p = Paragraph(child, cell_obj)
                             content = (
                                 self.convert_paragraph_for_hl(p) if is_hoc_lieu
                                 else self.convert_content_to_html(p)
@@ -749,15 +1016,15 @@ class DocxProcessor:
 
         return text
 
-    def format_questions(self, group, questions_xml, errors):
-        """Format các câu hỏi, nhận thêm danh sách errors để ghi lỗi"""
+    def group_questions(self, group):
+        """Gom các paragraph của nhóm thành từng câu {'items', 'question_tag'} theo dòng 'Câu N'"""
         group_of_q = []
         for para in group['questions']:
             if isinstance(para, Table):
                 if group_of_q and group_of_q[-1]:
                     group_of_q[-1]['items'].append(para)
                 continue
-            text = para.text.strip().lower()
+            text = self.memo.lower(para)
             # Phát hiện câu hỏi mới
             if re.match(r'^c[ââ]u.\d', text):
                 question_tag = getattr(para, 'current_tag', None) or group.get('original_tag') or group['tag']
@@ -768,39 +1035,90 @@ class DocxProcessor:
                 group_of_q.append(question)
             elif group_of_q:
                 group_of_q[-1]['items'].append(para)
+        return group_of_q
+
+    def format_questions(self, group, questions_xml, errors):
+        """Format các câu hỏi, nhận thêm danh sách errors để ghi lỗi"""
+        group_of_q = self.group_questions(group)
+
+        # Xử lý từng câu hỏi (song song theo worker nếu nhóm đủ lớn)
+        rendered = None
+        if self.question_workers > 1 and len(group_of_q) >= self.parallel_min_questions:
+            rendered = self._render_questions_parallel(group, group_of_q)
 
-        # Xử lý từng câu hỏi
         for idx, question_dict in enumerate(group_of_q):
-            each_question_xml = Element('question')
-            # Metadata
-            SubElement(each_question_xml, 'indexGroupQuestionMaterial').text = str(self.index_question)
+            if rendered is None:
+                each_question_xml = self.render_question(group, question_dict, idx, errors)
+            else:
+                # Lỗi của từng câu được nối lại đúng thứ tự, số thứ tự gán ở process chính
+                each_question_xml, question_errors = rendered[idx]
+                errors.extend(question_errors)
+                if each_question_xml is not None:
+                    each_question_xml.find('indexGroupQuestionMaterial').text = str(self.index_question)
 
-            SubElement(each_question_xml, 'subject').text = group['subject']
+            if each_question_xml is None:
+                continue # Bỏ qua câu hỏi lỗi, tiếp tục với câu tiếp theo
 
-            question_tag = question_dict['question_tag']
+            self.index_question += 1
+            questions_xml.append(each_question_xml)
 
-            SubElement(each_question_xml, 'tag').text = question_tag
+    def render_question(self, group, question_dict, idx, errors):
+        """Render một câu hỏi thành <question>, trả về None nếu câu hỏi lỗi"""
+        if self.checkpoint is not None:
+            self.checkpoint()
+        each_question_xml = Element('question')
+        # Metadata
+        SubElement(each_question_xml, 'indexGroupQuestionMaterial').text = str(self.index_question)
 
-            SubElement(each_question_xml, 'posttype').text = group['posttype']
+        SubElement(each_question_xml, 'subject').text = group['subject']
 
-            SubElement(each_question_xml, 'knowledgelevel').text = group['knowledgelevel']
+        question_tag = question_dict['question_tag']
 
-            SubElement(each_question_xml, 'levelquestion').text = str(group['level'])
-            # Xử lý nội dung câu hỏi
-            try:
-                # Gọi protocol_of_q với danh sách lỗi
-                self.protocol_of_q(question_dict['items'], each_question_xml, group['subject'], errors, idx + 1) # idx+1 là số thứ tự câu hỏi
-            except Exception as e:
-                # Nếu protocol_of_q ném lỗi không bắt được (nên ít xảy ra sau khi sửa)
-                # thì vẫn ghi vào danh sách lỗi và tiếp tục
-                error_msg = f"Lỗi không xử lý được khi phân tích câu hỏi {idx + 1}: {str(e)}"
-                errors.append(error_msg)
-                print(f"[ERROR] format_questions: {error_msg}")
-                traceback.print_exc()
-                continue # Bỏ qua câu hỏi lỗi, tiếp tục với câu tiếp theo
+        SubElement(each_question_xml, 'tag').text = question_tag
 
-            self.index_question += 1
-            questions_xml.append(each_question_xml)
+        SubElement(each_question_xml, 'posttype').text = group['posttype']
+
+        SubElement(each_question_xml, 'knowledgelevel').text = group['knowledgelevel']
+
+        SubElement(each_question_xml, 'levelquestion').text = str(group['level'])
+        # Xử lý nội dung câu hỏi
+        try:
+            # Gọi protocol_of_q với danh sách lỗi
+            self.protocol_of_q(question_dict['items'], each_question_xml, group['subject'], errors, idx + 1) # idx+1 là số thứ tự câu hỏi
+        except Exception as e:
+            # Nếu protocol_of_q ném lỗi không bắt được (nên ít xảy ra sau khi sửa)
+            # thì vẫn ghi vào danh sách lỗi và tiếp tục
+            error_msg = f"Lỗi không xử lý được khi phân tích câu hỏi {idx + 1}: {str(e)}"
+            errors.append(error_msg)
+            print(f"[ERROR] format_questions: {error_msg}")
+            traceback.print_exc()
+            return None
+
+        return each_question_xml
+
+    def _render_questions_parallel(self, group, group_of_q):
+        """
+        Gửi XML gốc của từng câu hỏi (kèm ảnh/link cần dùng) sang worker process.
+        Trả về list (question_xml | None, errors) theo đúng thứ tự, hoặc None nếu
+        pool lỗi để format_questions quay về xử lý tuần tự.
+        """
+        try:
+            if self._question_pool is None:
+                self._question_pool = question_pool.create_pool(self.question_workers,
+                                                                {'image_options': self.image_options})
+            return question_pool.render_questions(self._question_pool, self.doc, group, group_of_q,
+                                                  self.question_workers)
+        except Exception as e:
+            print(f"[WARN] Render song song lỗi, chuyển sang tuần tự: {e}")
+            traceback.print_exc()
+            self.close_question_pool()
+            return None
+
+    def close_question_pool(self):
+        """Tắt pool worker render câu hỏi (nếu có)"""
+        if self._question_pool is not None:
+            self._question_pool.shutdown(cancel_futures=True)
+            self._question_pool = None
 
    
 
@@ -812,64 +1130,33 @@ class DocxProcessor:
         imgs = []
         try:
             r = run._r
-            from lxml import etree
-            nsmap = {
-                'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
-                'wp': 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing',
-                'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
-                'v': 'urn:schemas-microsoft-com:vml'
-            }
 
             # --- 1. DrawingML: blip + extent ---
-            blips = r.findall('.//a:blip', nsmap)
-            extents = r.findall('.//wp:extent', nsmap)
-
-            for idx, blip in enumerate(blips):
-                rId = blip.get('{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed')
-                if not rId:
-                    continue
-
+            for ref in self.images.refs_for(r, 'blip'):
                 display_width_px, display_height_px = None, None
 
                 # Dùng extent để tính KÍCH THƯỚC HIỂN THỊ (pixel trong Google Docs)
-                if idx < len(extents):
-                    extent = extents[idx]
-                    cx = extent.get('cx')  # EMU
-                    cy = extent.get('cy')  # EMU
-                    if cx and cy:
-                        # Google Docs dùng DPI ≈ 220 cho hiển thị
-                        # 1 inch = 220 pixel (GAS), 1 inch = 914400 EMU
-                        # → 1 EMU = 220 / 914400 pixel
-                        display_width_px = int(int(cx) * 220 / 914400)
-                        display_height_px = int(int(cy) * 220 / 914400)
-
-                img_tag = self._make_img_tag_from_rid(rId, display_width_px, display_height_px)
+                if ref.cx is not None and ref.cy is not None:
+                    # Google Docs dùng DPI ≈ 220 cho hiển thị
+                    # 1 inch = 220 pixel (GAS), 1 inch = 914400 EMU
+                    # → 1 EMU = 220 / 914400 pixel
+                    display_width_px = int(ref.cx * 220 / 914400)
+                    display_height_px = int(ref.cy * 220 / 914400)
+
+                img_tag = self._make_img_tag_from_rid(ref.rId, display_width_px, display_height_px, ref.extent)
                 if img_tag:
                     imgs.append(img_tag)
 
             # --- 2. VML (hiếm, nhưng xử lý nếu có) ---
-            picts = r.findall('.//v:imagedata', nsmap)
-            for pict in picts:
-                rId = pict.get('{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id')
-                if not rId:
-                    continue
-
+            for ref in self.images.refs_for(r, 'vml'):
                 display_width_px, display_height_px = None, None
-                shape = pict.getparent()
-                if shape is not None:
-                    style = shape.get('style', '')
-                    import re
-                    width_match = re.search(r'width:\s*(\d+(?:\.\d+)?)pt', style)
-                    height_match = re.search(r'height:\s*(\d+(?:\.\d+)?)pt', style)
-                    if width_match and height_match:
-                        # Chuyển pt → inch → pixel (220 DPI)
-                        width_pt = float(width_match.group(1))
-                        height_pt = float(height_match.group(1))
-                        # 1 pt = 1/72 inch → pixel = (pt / 72) * 220
-                        display_width_px = int(width_pt * 220 / 72)
-                        display_height_px = int(height_pt * 220 / 72)
-
-                img_tag = self._make_img_tag_from_rid(rId, display_width_px, display_height_px)
+                if ref.width_pt is not None and ref.height_pt is not None:
+                    # Chuyển pt → inch → pixel (220 DPI)
+                    # 1 pt = 1/72 inch → pixel = (pt / 72) * 220
+                    display_width_px = int(ref.width_pt * 220 / 72)
+                    display_height_px = int(ref.height_pt * 220 / 72)
+
+                img_tag = self._make_img_tag_from_rid(ref.rId, display_width_px, display_height_px, ref.extent)
                 if img_tag:
                     imgs.append(img_tag)
 
@@ -917,7 +1204,7 @@ class DocxProcessor:
             traceback.print_exc()
             return None, None
 
-    def _make_img_tag_from_rid(self, rId, display_width_emu=None, display_height_emu=None):
+    def _make_img_tag_from_rid(self, rId, display_width_emu=None, display_height_emu=None, extent=None):
         print(f">>>>>>>> chiều rộng emu {display_width_emu}")
 
         print(f">>>>>>>>> chiều dài emu {display_height_emu}")
@@ -935,29 +1222,13 @@ class DocxProcessor:
         - HTML style: width = (cx / 12700)px
         """
         try:
-            part = self.doc.part.related_parts.get(rId)
-            if not part:
-                for rel in self.doc.part.rels.values():
-                    try:
-                        target = getattr(rel, 'target_part', None)
-
-                        if target and 'image' in getattr(target, 'content_type', ''):
-
-                            if rel.rId == rId:
+            info = self.images.get(rId)
 
-                                part = target
-
-                                break
-                    except Exception:
-                        continue
-
-            if not part:
+            if info is None:
                 print(f"[DEBUG] Không tìm thấy part cho rId={rId}")
                 return None
 
-            img_bytes = part.blob
-
-            content_type = getattr(part, 'content_type', 'image/png')
+            content_type = info.content_type
             
             # === TÍNH KÍCH THƯỚC TỪ WORD XML EMU ===
             if display_width_emu is not None and display_height_emu is not None:
@@ -973,11 +1244,11 @@ class DocxProcessor:
                 print(f"[DEBUG] GAS output: {final_width}x{final_height} pt")
             else:
                 # FALLBACK: Dùng kích thước ảnh gốc (KHÔNG KHUYẾN NGHỊ)
-                img = Image.open(BytesIO(img_bytes))
-
-                pixel_width, pixel_height = img.size
+                # Đọc từ header ảnh (không giải mã), cache theo hash nội dung
+                pixel_width, pixel_height, dpi_info = info.dimensions
 
-                dpi_info = img.info.get('dpi', (96, 96))
+                if dpi_info is None:
+                    dpi_info = (96, 96)
 
                 dpi = dpi_info[0] if isinstance(dpi_info, tuple) else dpi_info
                 
@@ -991,18 +1262,23 @@ class DocxProcessor:
 
                 print(f"[DEBUG] Fallback: {final_width}x{final_height} pt")
 
-            # KHÔNG RESIZE - giữ nguyên ảnh gốc
-            output = BytesIO()
-
-            img = Image.open(BytesIO(img_bytes))
-
-            img_format = img.format or 'PNG'
-
-            img.save(output, format=img_format, optimize=False)
-
-            b64 = base64.b64encode(output.getvalue()).decode('ascii')
+            # Mặc định KHÔNG RESIZE - giữ nguyên ảnh gốc (base64 được cache theo hash nội dung).
+            # Bật image_options: ảnh được thu nhỏ theo kích thước hiển thị và nén lại
+            # extent: (cx, cy) EMU của chính lần xuất hiện này (ảnh có thể hiển thị ở nhiều kích thước)
+            optimized = self.image_optimizer.encode(info, extent) if self.image_optimizer is not None else None
+            if optimized is None and vector_image.is_vector(info):
+                # EMF/WMF: trình duyệt không hiển thị được -> vẽ ra PNG theo kích thước hiển thị
+                extent = (final_width * 9525, final_height * 9525) if final_width and final_height else None
+                png_b64 = vector_image.encode_png(info, extent)
+                if png_b64 is not None:
+                    optimized = ('image/png', png_b64)
+            if optimized is not None:
+                content_type, b64 = optimized
+            else:
+                b64 = self.images.encode(rId)
 
-            output.close()
+            if b64 is None:
+                return None
 
             return f'<center><img style="width:{final_width}px; height:{final_height}px;" src="data:{content_type};base64,{b64}" /></center>'
 
@@ -1013,16 +1289,7 @@ class DocxProcessor:
             return None
         
     def get_hyperlinks_from_paragraph(self,paragraph: Paragraph):
-        links = []
-        part = paragraph.part
-
-        for hyperlink in paragraph._p.findall(qn('w:hyperlink')):
-            r_id = hyperlink.get(qn('r:id'))
-            if r_id:
-                url = part.rels[r_id].target_ref
-                links.append(url)
-
-        return links
+        return list(self.memo.hyperlinks(paragraph))
 
     # def protocol_of_q(self, question, each_question_xml, subject, errors, question_index):
     #     """Phân tích cấu trúc câu hỏi, nhận danh sách errors và số thứ tự câu hỏi question_index"""
@@ -1232,9 +1499,8 @@ class DocxProcessor:
     #         self.route_to_default_module(cau_sau_xu_ly, each_question_xml, audio, answer, subject, errors, question_index,has_sharpened)
    
 
-    def protocol_of_q(self, question, each_question_xml, subject, errors, question_index):
-        """Phân tích cấu trúc câu hỏi, nhận danh sách errors và số thứ tự câu hỏi question_index"""
-        # Chia thành phần: nội dung câu hỏi và lời giải
+    def split_solution(self, question):
+        """Tách câu hỏi thành [nội dung câu hỏi, lời giải, ...] theo dòng 'Lời giải'"""
         thanh_phan_1q = []
 
         for idx, para in enumerate(question):
@@ -1242,12 +1508,59 @@ class DocxProcessor:
                 thanh_phan_1q.append([para])
                 continue
             if isinstance(para, Paragraph):
-                text = para.text.strip().lower()
+                text = self.memo.lower(para)
                 if re.match(r'^\s*l[ờơ]i\s+gi[ảẩ]i\s*[:：]?', text, re.IGNORECASE):
                     thanh_phan_1q.append([])
                     continue
             if thanh_phan_1q:
                 thanh_phan_1q[-1].append(para)
+        return thanh_phan_1q
+
+    def split_hdg(self, solution_paras):
+        """Tách lời giải theo dòng '###' -> (thanh_phan_hdg, link_speech_explain, has_sharpened)"""
+        thanh_phan_hdg = []
+        link_speech_explain = []
+        has_sharpened = False
+
+        for idx, para in enumerate(solution_paras):
+            if idx == 0:
+                thanh_phan_hdg.append([para])
+                continue
+
+            if isinstance(para, Paragraph):
+                text = self.memo.stripped(para)
+                print(f">>>>>> debug text loi giai: {text}")
+
+                if text.startswith('###'):
+                    has_sharpened = True
+                    thanh_phan_hdg.append([])
+                    continue
+                
+                # URLs trong HDG
+                urls = re.findall(r'https?://[^\s]+', text)
+                for url in urls:
+                    link_speech_explain.append(url)
+                    continue
+
+            if thanh_phan_hdg:
+                thanh_phan_hdg[-1].append(para)
+        return thanh_phan_hdg, link_speech_explain, has_sharpened
+
+    @staticmethod
+    def question_kind(answer):
+        """Dạng câu hỏi theo dòng đầu của lời giải: 'ds', 'tn', 'dt' hoặc 'tl'"""
+        if re.match(r'^\d+', answer):
+            if len(answer) > 1 and re.match(r'^[01]+', answer):
+                return 'ds'
+            return 'tn'
+        if answer.startswith('##'):
+            return 'dt'
+        return 'tl'
+
+    def protocol_of_q(self, question, each_question_xml, subject, errors, question_index):
+        """Phân tích cấu trúc câu hỏi, nhận danh sách errors và số thứ tự câu hỏi question_index"""
+        # Chia thành phần: nội dung câu hỏi và lời giải
+        thanh_phan_1q = self.split_solution(question)
 
         if len(thanh_phan_1q) < 2:
             error_msg = f"Thiếu 'Lời giải' trong câu hỏi {question_index}"
@@ -1264,7 +1577,7 @@ class DocxProcessor:
 
         for idx, para in enumerate(thanh_phan_1q[0]):
             if isinstance(para, Paragraph):
-                text = para.text.strip()
+                text = self.memo.stripped(para)
                 print(f">>>>>> debug text cau hoi: {text}")
                 
                 # ===== FIX: DETECT HYPERLINK TRƯỚC TIÊN =====
@@ -1275,22 +1588,11 @@ class DocxProcessor:
                         link_cau_hoi.append(link)
                         print(f">>>>>> [HYPERLINK VIA METHOD] {link}")
                 
-                # 2. Detect hyperlink trực tiếp từ XML structure
-                for run in para.runs:
-                    # Tìm hyperlink element trong run
-                    hyperlink_elements = run._element.xpath('.//w:hyperlink', 
-                        namespaces={'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'})
-                    
-                    for hyperlink_elem in hyperlink_elements:
-                        r_id = hyperlink_elem.get('{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id')
-                        if r_id and r_id in para.part.rels:
-                            rel = para.part.rels[r_id]
-                            if rel.reltype == 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/hyperlink':
-                                url = rel.target_ref
-                                if url and url.startswith('http'):
-                                    if url not in link_cau_hoi:
-                                        link_cau_hoi.append(url)
-                                        print(f">>>>>> [HYPERLINK VIA XML] {url}")
+                # 2. Hyperlink nằm bên trong run (w:r chứa w:hyperlink)
+                for url in self.memo.run_hyperlinks(para):
+                    if url not in link_cau_hoi:
+                        link_cau_hoi.append(url)
+                        print(f">>>>>> [HYPERLINK VIA XML] {url}")
 
                 # ===== XỬ LÝ DÒNG "Audio:" =====
                 if text.startswith('Audio:'):
@@ -1305,7 +1607,7 @@ class DocxProcessor:
                         if idx + 1 < len(thanh_phan_1q[0]):
                             next_para = thanh_phan_1q[0][idx + 1]
                             if isinstance(next_para, Paragraph):
-                                next_text = next_para.text.strip()
+                                next_text = self.memo.stripped(next_para)
                                 if next_text.startswith('http'):
                                     if f'Audio:{next_text}' not in link_cau_hoi:
                                         link_cau_hoi.append(f'Audio:{next_text}')
@@ -1348,48 +1650,23 @@ class DocxProcessor:
         self.xu_ly_link_cau_hoi(link_cau_hoi, each_question_xml)
 
         # Phân tích lời giải
-        thanh_phan_hdg = []
-        link_speech_explain = []
-        has_sharpened = False
-
-        for idx, para in enumerate(thanh_phan_1q[1]):
-            if idx == 0:
-                thanh_phan_hdg.append([para])
-                continue
-
-            if isinstance(para, Paragraph):
-                text = para.text.strip()
-                print(f">>>>>> debug text loi giai: {text}")
-
-                if text.startswith('###'):
-                    has_sharpened = True
-                    thanh_phan_hdg.append([])
-                    continue
-                
-                # URLs trong HDG
-                urls = re.findall(r'https?://[^\s]+', text)
-                for url in urls:
-                    link_speech_explain.append(url)
-                    continue
-
-            if thanh_phan_hdg:
-                thanh_phan_hdg[-1].append(para)
+        thanh_phan_hdg, link_speech_explain, has_sharpened = self.split_hdg(thanh_phan_1q[1])
 
         # Xử lý urlSpeechExplain
         if link_speech_explain:
             for link in link_speech_explain:
                 if link.endswith(('.mp3', '.mp4')):
-                    SubElement(each_question_xml, 'urlSpeechExplain').text = link
+                    html_element(each_question_xml, 'urlSpeechExplain', link)
 
         # Xác định dạng câu hỏi
-        answer = thanh_phan_hdg[0][0].text.strip() if thanh_phan_hdg[0] else ''
+        answer = self.memo.stripped(thanh_phan_hdg[0][0]) if thanh_phan_hdg[0] else ''
         cau_sau_xu_ly = [thanh_phan_cau_hoi, thanh_phan_hdg]
 
         # Detect audio từ question list
         audio = []
         for item in question:
             if isinstance(item, Paragraph):
-                txt = item.text.strip()
+                txt = self.memo.stripped(item)
                 if txt.startswith('Audio:') or txt.startswith('https://mathplay.onluyen.vn'):
                     print(f">>>>>> debug txt have audio {txt}")
                     audio.append(txt)
@@ -1412,26 +1689,26 @@ class DocxProcessor:
     def route_to_tinhoc_module(self, cau_sau_xu_ly, xml, audio, answer, subject, errors, question_index):
         """Xử lý cho môn Tin học, nhận danh sách lỗi và số câu hỏi"""
         # ✅ Gọi từ instance tinhoc_processor
-        if re.match(r'^\d+', answer):
-            if len(answer) > 1 and re.match(r'^[01]+', answer):
-                self.tinhoc_processor.dang_ds_tinhoc(cau_sau_xu_ly, xml, audio, self.doc)
-            else:
-                self.tinhoc_processor.dang_tn_tinhoc(cau_sau_xu_ly, xml, audio, self.doc)
-        elif answer.startswith('##'):
+        kind = self.question_kind(answer)
+        if kind == 'ds':
+            self.tinhoc_processor.dang_ds_tinhoc(cau_sau_xu_ly, xml, audio, self.doc)
+        elif kind == 'tn':
+            self.tinhoc_processor.dang_tn_tinhoc(cau_sau_xu_ly, xml, audio, self.doc)
+        elif kind == 'dt':
             self.dang_dt(cau_sau_xu_ly, xml, subject)
         else:
             self.dang_tl(cau_sau_xu_ly, xml, audio)
 
     def route_to_default_module(self, cau_sau_xu_ly, xml, audio, answer, subject, errors, question_index,has_sharpened):
         """Xử lý cho môn thông thường, nhận danh sách lỗi và số câu hỏi"""
-        if re.match(r'^\d+', answer):
-            if len(answer) > 1 and re.match(r'^[01]+', answer):
-                print(f">>>>>  Default → Dang Dung/Sai")
-                self.dang_ds(cau_sau_xu_ly, xml, audio)
-            else:
-                print(f">>>>>  Default → Dang Trac Nghiem")
-                self.dang_tn(cau_sau_xu_ly, xml, audio)
-        elif answer.startswith('##'):
+        kind = self.question_kind(answer)
+        if kind == 'ds':
+            print(f">>>>>  Default → Dang Dung/Sai")
+            self.dang_ds(cau_sau_xu_ly, xml, audio)
+        elif kind == 'tn':
+            print(f">>>>>  Default → Dang Trac Nghiem")
+            self.dang_tn(cau_sau_xu_ly, xml, audio)
+        elif kind == 'dt':
             print(f">>>>>  Default → Dang Dien Tu")
             self.dang_dt(cau_sau_xu_ly, xml, subject)
         else:
@@ -1563,7 +1840,7 @@ class DocxProcessor:
                 if one_tts:
                     print(f"[WARN] Có nhiều hơn 1 link TTS trong câu hỏi, bỏ qua: {clean_link}")
                     continue
-                SubElement(xml, 'urlSpeechContent').text = clean_link
+                html_element(xml, 'urlSpeechContent', clean_link)
                 one_tts = True
             else:
                 if one_media:
@@ -1576,7 +1853,7 @@ class DocxProcessor:
                         code = f"{parts[0]}?h={parts[1].split('?share')[0]}"
                     else:
                         code = parts[0]
-                    SubElement(xml, 'contentMedia').text = code
+                    html_element(xml, 'contentMedia', code)
                     SubElement(xml, 'typeContentMedia').text = 'CodeVimeo'
                     one_media = True
                 elif 'youtu' in clean_link:
@@ -1586,7 +1863,7 @@ class DocxProcessor:
                         code = clean_link.split('youtu.be/')[1].split('?')[0]
                     else:
                         continue
-                    SubElement(xml, 'contentMedia').text = code
+                    html_element(xml, 'contentMedia', code)
                     SubElement(xml, 'typeContentMedia').text = 'CodeYouTuBe'
                     one_media = True
 
@@ -1675,10 +1952,8 @@ class DocxProcessor:
                 # Fallback robust: chuyển thành str(para)
                 string_content += str(para)
             string_content += "<br>"
-        # Xử lý math-latex
-        import re
-        math_latex = re.compile(r"\$[^$]*\$")
-        string_content = math_latex.sub(lambda m: f'<span class="math-tex">{m.group()}</span>', string_content)
+        # Xử lý math-latex (giữ nguyên công thức OMML đã bọc sẵn)
+        string_content = omml_latex.wrap_dollar_math(string_content)
         return string_content.strip()
 
     # def convert_content_to_html(self, paragraphs):
@@ -1803,7 +2078,7 @@ class DocxProcessor:
         for para in cau_sau_xu_ly[0]:
             if isinstance(para, Paragraph):
 
-                text = para.text.strip()
+                text = self.memo.stripped(para)
 
                 # Nhận diện các dòng A. B. C. D.
                 if re.match(r'^[A-Z]\.', text):
@@ -1822,7 +2097,7 @@ class DocxProcessor:
 
             content_html += f'<audio controls=""><source src="{link}" type="audio/mpeg"></audio>'
 
-        SubElement(xml, 'contentquestion').text = content_html.strip()
+        html_element(xml, 'contentquestion', content_html.strip())
         # ===== 2️⃣ Tìm đáp án đúng từ phần Lời giải =====
         correct_index = None  # chỉ số 0-based của đáp án đúng
         if len(cau_sau_xu_ly) > 1 and cau_sau_xu_ly[1]:
@@ -1839,7 +2114,7 @@ class DocxProcessor:
 
                         # m = re.search(r'\b([1-4])\b', p.text.strip())
 
-                        m = re.search(r'\b([1-9]|1[0-9]|2[0-6])\b', p.text.strip())
+                        m = re.search(r'\b([1-9]|1[0-9]|2[0-6])\b', self.memo.stripped(p))
 
                         if m:
 
@@ -1849,7 +2124,7 @@ class DocxProcessor:
             elif hasattr(first, 'text'):
 
                 # m = re.search(r'\b([1-4])\b', first.text.strip())
-                m = re.search(r'\b([1-9]|1[0-9]|2[0-6])\b', first.text.strip())
+                m = re.search(r'\b([1-9]|1[0-9]|2[0-6])\b', self.memo.stripped(first))
 
                 if m:
 
@@ -1870,7 +2145,7 @@ class DocxProcessor:
 
             SubElement(answer_el, 'index').text = str(i)
 
-            SubElement(answer_el, 'content').text = content_html
+            html_element(answer_el, 'content', content_html)
 
             SubElement(answer_el, 'isanswer').text = 'TRUE' if i == correct_index else 'FALSE'
         # ===== 4️⃣ Gọi hdg_tn() để xử lý phần giải thích chi tiết =====
@@ -1894,9 +2169,9 @@ class DocxProcessor:
             # Lấy đáp án đúng
             if isinstance(answer_para, list) and len(answer_para) > 0:
 
-                answer_text = answer_para[0].text.strip()
+                answer_text = self.memo.stripped(answer_para[0])
             else:
-                answer_text = answer_para.text.strip()
+                answer_text = self.memo.stripped(answer_para)
 
             number_of_answer = [c for c in answer_text if c.isdigit()]
             listanswers = SubElement(xml, 'listanswers')
@@ -1907,10 +2182,8 @@ class DocxProcessor:
 
                 SubElement(answer, 'index').text = str(i)
 
-                content_elem = SubElement(answer, 'content')
-
                 # Không bọc <div> nữa, chỉ giữ nội dung HTML thuần
-                content_elem.text = choice
+                html_element(answer, 'content', choice)
 
                 is_correct = 'TRUE' if str(i + 1) in number_of_answer else 'FALSE'
 
@@ -1946,11 +2219,11 @@ class DocxProcessor:
         if isinstance(array_hdg, list):
             for part in array_hdg:
                 if hasattr(part, "text"):
-                    hdg_raw += part.text.strip() + " "
+                    hdg_raw += self.memo.stripped(part) + " "
                 elif isinstance(part, list):
                     for p in part:
                         if hasattr(p, "text"):
-                            hdg_raw += p.text.strip() + " "
+                            hdg_raw += self.memo.stripped(p) + " "
         # Chuyển sang HTML (giữ nguyên tag ảnh/table)
         hdg_html = self.convert_content_to_html(array_hdg)
         plain = re.sub(r'<[^>]+>', '', hdg_html).strip()
@@ -1976,7 +2249,7 @@ class DocxProcessor:
             ).strip()
             # Chỉ thêm thẻ nếu còn nội dung sau khi làm sạch
             if explain_text:
-                SubElement(xml, 'explainquestion').text = explain_text.strip()
+                html_element(xml, 'explainquestion', explain_text.strip())
 
     def dang_ds(self, cau_sau_xu_ly, xml, audio):
         """Xử lý dạng Đúng/Sai, tách đúng phần phát biểu và HDG"""
@@ -1992,7 +2265,7 @@ class DocxProcessor:
         intro_paras = []
         # ✅ Phân loại phần mở đầu và các phát biểu
         for para in paragraphs:
-            if isinstance(para, Paragraph) and re.match(r'^[a-z]\s*[\.\)]', para.text.strip(), re.IGNORECASE):
+            if isinstance(para, Paragraph) and re.match(r'^[a-z]\s*[\.\)]', self.memo.stripped(para), re.IGNORECASE):
 
                 statements.append(para)
             else:
@@ -2006,7 +2279,7 @@ class DocxProcessor:
             link = audio[0].replace('Audio:', '').strip()
 
             content_html += f'<audio controls=""><source src="{link}" type="audio/mpeg"></audio>'
-        SubElement(xml, 'contentquestion').text = content_html
+        html_element(xml, 'contentquestion', content_html)
         # ✅ Danh sách phát biểu a/b/c/d
         listanswers = SubElement(xml, 'listanswers')
         for i, para in enumerate(statements):
@@ -2033,18 +2306,18 @@ class DocxProcessor:
 
             SubElement(answer, 'index').text = str(i)
 
-            SubElement(answer, 'content').text = ans_html
+            html_element(answer, 'content', ans_html)
 
             SubElement(answer, 'isanswer').text = 'FALSE'  # tạm thời FALSE, sẽ cập nhật sau
         # ✅ Lấy chuỗi đáp án đúng/sai (ví dụ: 0111, 1010, ...)
         if len(cau_sau_xu_ly[1]) > 0:
             if isinstance(cau_sau_xu_ly[1][0], list):
 
-                ans_text = cau_sau_xu_ly[1][0][0].text.strip()
+                ans_text = self.memo.stripped(cau_sau_xu_ly[1][0][0])
 
             else:
 
-                ans_text = cau_sau_xu_ly[1][0].text.strip()
+                ans_text = self.memo.stripped(cau_sau_xu_ly[1][0])
 
             for i, ch in enumerate(ans_text):
 
@@ -2062,10 +2335,9 @@ class DocxProcessor:
             hdg_html = self.convert_content_to_html(flat_hdg)
         else:
             hdg_html = ''
-        SubElement(xml, 'explainquestion').text = hdg_html
+        html_element(xml, 'explainquestion', hdg_html)
 
     def dang_dt(self, cau_sau_xu_ly, xml, subject):
-        from xml.etree.ElementTree import SubElement
         import re
         from bs4 import BeautifulSoup
 
@@ -2077,7 +2349,7 @@ class DocxProcessor:
         # ===== HINT =====
         if len(cau_sau_xu_ly) > 1 and isinstance(cau_sau_xu_ly[1], list) and len(cau_sau_xu_ly[1]) > 1:
             hint_html = self.convert_b4_add_dt(cau_sau_xu_ly[1][1])
-            SubElement(xml, 'hintQuestion').text = hint_html
+            html_element(xml, 'hintQuestion', hint_html)
 
         # ===== RAW HTML =====
         raw_html = self.convert_b4_add_dt(cau_sau_xu_ly[0])  # <-- PHẢI KHÔNG CÓ <p>!
@@ -2149,12 +2421,12 @@ class DocxProcessor:
         if final_title:
             title_div = SubElement(cq, 'div')
             title_div.set('class', 'title')
-            title_div.text = final_title
+            set_html(title_div, final_title)
 
         # --- content ---
         content_div = SubElement(cq, 'div')
         content_div.set('class', 'content')
-        content_div.text = content_html
+        set_html(content_div, content_html)
 
         # --- answer-input ---
         if answer_html_processed.strip():
@@ -2165,7 +2437,7 @@ class DocxProcessor:
                 if line.strip():
                     line_block = SubElement(ans_block, 'div')
                     line_block.set('class', 'line')
-                    line_block.text = line
+                    set_html(line_block, line)
 
         # ===== LIST ANSWERS =====
         listanswers = SubElement(xml, 'listanswers')
@@ -2173,7 +2445,7 @@ class DocxProcessor:
             ans_clean = ans.replace('‘', "'").replace('’', "'").replace('|', '[-]')
             ans_tag = SubElement(listanswers, 'answer')
             SubElement(ans_tag, 'index').text = str(i)
-            SubElement(ans_tag, 'content').text = ans_clean
+            html_element(ans_tag, 'content', ans_clean)
             SubElement(ans_tag, 'isanswer').text = 'TRUE'
 
         # ===== EXPLAIN =====
@@ -2187,9 +2459,9 @@ class DocxProcessor:
 
         exp = SubElement(xml, 'explainquestion')
         if len(hdg_plain) > 4:
-            exp.text = hdg_html
+            set_html(exp, hdg_html)
         else:
-            exp.text = f"Đáp án đúng theo thứ tự là: {', '.join(dap_an_dt)}"
+            set_html(exp, f"Đáp án đúng theo thứ tự là: {', '.join(dap_an_dt)}")
 
 
     def dang_tl(self, cau_sau_xu_ly, xml, audio):
@@ -2208,7 +2480,7 @@ class DocxProcessor:
 
                 content_html += f'<audio controls=""><source src="{link}" type="audio/mpeg"></audio>'
 
-            SubElement(xml, 'contentquestion').text = content_html
+            html_element(xml, 'contentquestion', content_html)
 
             # List answers placeholder
             listanswers = SubElement(xml, 'listanswers')
@@ -2217,13 +2489,13 @@ class DocxProcessor:
 
             SubElement(answer, 'index').text = '0'
 
-            SubElement(answer, 'content').text = 'REPLACELATER'
+            html_element(answer, 'content', 'REPLACELATER')
 
             SubElement(answer, 'isanswer').text = 'TRUE'
             # HDG
             hdg_html = self.convert_content_to_html(cau_sau_xu_ly[1]) if len(cau_sau_xu_ly) > 1 else ''
 
-            SubElement(xml, 'explainquestion').text = hdg_html
+            html_element(xml, 'explainquestion', hdg_html)
 
     def convert_b4_add_dt(self, paragraphs):
         """Trả về HTML giống GAS: không có <p>, chỉ nối bằng <br>"""
@@ -2245,10 +2517,8 @@ class DocxProcessor:
         else:
             string_content = new_children_all[0] if new_children_all else ''
 
-        # Xử lý math-latex
-        import re
-        math_latex = re.compile(r"\$[^$]*\$")
-        string_content = math_latex.sub(lambda m: f' <span class="math-tex">{m.group()}</span>', string_content)
+        # Xử lý math-latex (giữ nguyên công thức OMML đã bọc sẵn)
+        string_content = omml_latex.wrap_dollar_math(string_content, ' ')
 
         return string_content        
 
@@ -2274,11 +2544,8 @@ class DocxProcessor:
             string_content += f"{new_content}<br>"
         # string_content += "</div>"
         string_content += "</p>"
-        # Xử lý math-latex: $...$
-        import re
-        math_latex = re.compile(r"\$[^$]*\$")
-
-        string_content = math_latex.sub(lambda m: f' <span class="math-tex">{m.group()}</span>', string_content)
+        # Xử lý math-latex: $...$ (giữ nguyên công thức OMML đã bọc sẵn)
+        string_content = omml_latex.wrap_dollar_math(string_content, ' ')
 
         return string_content
 
@@ -2286,6 +2553,23 @@ class DocxProcessor:
         """Chuyển 1 paragraph sang HTML, bỏ phần đầu (Câu, HL, A/B/C/D) và giữ format,
         xử lý cả trường hợp các phần đó bị chia nhỏ qua nhiều run."""
         import re
+        # ✅ (text, style, ảnh) của từng run, đọc một lần qua python-docx
+        runs = [
+            (
+                run.text,
+                (
+                    bool(run.bold),
+                    bool(run.italic),
+                    bool(run.underline),
+                    bool(getattr(run.font, 'superscript', False)),
+                    bool(getattr(run.font, 'subscript', False)),
+                    bool(getattr(run.font, 'strike', False))
+                ),
+                self.images.refs_for(run._element, 'blip'),
+            )
+            for run in paragraph.runs
+        ]
+
         # ✅ Gom từng run để dò pattern, kể cả khi chia nhỏ
         progressive_text = ""
 
@@ -2302,10 +2586,10 @@ class DocxProcessor:
         patterns.append(r"^HL:\s*")
         patterns.append(r"^([A-Z])\.\s*")
         # Dò dần theo run
-        for run in paragraph.runs:
+        for run_text, _, _ in runs:
             if detected:
                 break
-            full_text = run.text or ""
+            full_text = run_text or ""
             progressive_text += full_text
             for pat in patterns:
                 m = re.match(pat, progressive_text, re.IGNORECASE)
@@ -2313,14 +2597,25 @@ class DocxProcessor:
                     content_start_pos = m.end()
                     detected = True
                     break
+        # ✅ Công thức Word (OMML) nằm giữa các run: (số run đứng trước, span math-tex)
+        math_slots = omml_latex.math_slots(paragraph._p)
         # ✅ Sau khi có content_start_pos, xử lý như cũ
         html_content = ""
         prev_style = None
         buffer = ""
         current_text_pos = 0
-        for run in paragraph.runs:
+        for run_index, (run_text, style, _) in enumerate(runs):
+
+            if math_slots and math_slots[0][0] == run_index:
+                if buffer:
+                    html_content += self.wrap_style(self.escape_html(buffer), prev_style)
+                    buffer = ""
+                while math_slots and math_slots[0][0] == run_index:
+                    if current_text_pos >= content_start_pos:
+                        html_content += math_slots[0][1]
+                    math_slots.pop(0)
 
-            full_text = run.text or ""
+            full_text = run_text or ""
 
             text_start = current_text_pos
 
@@ -2341,14 +2636,6 @@ class DocxProcessor:
             else:
 
                 segment_text = full_text
-            style = (
-                bool(run.bold),
-                bool(run.italic),
-                bool(run.underline),
-                bool(getattr(run.font, 'superscript', False)),
-                bool(getattr(run.font, 'subscript', False)),
-                bool(getattr(run.font, 'strike', False))
-            )
             if prev_style is not None and style != prev_style:
                 html_content += self.wrap_style(self.escape_html(buffer), prev_style)
                 buffer = ""
@@ -2357,53 +2644,19 @@ class DocxProcessor:
             current_text_pos = text_end
         if buffer:
             html_content += self.wrap_style(self.escape_html(buffer), prev_style)
-        # ✅ Giữ logic thêm ảnh cũ
-        # for run in paragraph.runs:
-        #     blips = run._element.xpath(
-        #         './/*[local-name()="blip" and namespace-uri()="http://schemas.openxmlformats.org/drawingml/2006/main"]'
-        #     )
-        #     if blips:
-        #         try:
-        #             rId_nodes = run._element.xpath(
-        #                 './/*[local-name()="blip"]/@*[local-name()="embed"]'
-        #             )
-        #             if rId_nodes:
-        #                 rId = rId_nodes[0]
-        #                 img_tag = self._make_img_tag_from_rid(rId)
-        #                 if img_tag:
-        #                     html_content += img_tag
-        #         except Exception:
-        #             pass
-
-        for run in paragraph.runs:
-            # Tìm tất cả drawing elements trong run
-            drawings = run._element.findall(
-                './/{http://schemas.openxmlformats.org/wordprocessingml/2006/main}drawing'
-            )
-            
-            for drawing in drawings:
+        for _, math_html in math_slots:
+            html_content += math_html
+
+        for _, _, image_refs in runs:
+            # Ảnh trong run đã được ghi nhận sẵn (rId + extent EMU)
+            for ref in image_refs:
                 try:
-                    # 1. Lấy rId từ blip
-                    blip = drawing.find(
-                        './/{http://schemas.openxmlformats.org/drawingml/2006/main}blip'
-                    )
-                    
-                    if blip is not None:
-                        # Lấy r:embed attribute
-                        rId = blip.get(
-                            '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}embed'
-                        )
-                        
-                        if rId:
-                            # 2. Lấy kích thước từ Word XML (EMU units)
-                            width_emu, height_emu = self.lay_kich_thuoc_tu_word_xml(drawing)
-                            
-                            # 3. Tạo HTML img tag với kích thước chính xác
-                            img_tag = self._make_img_tag_from_rid(rId, width_emu, height_emu)
-                            
-                            if img_tag:
-                                html_content += img_tag
-                                
+                    # Tạo HTML img tag với kích thước chính xác từ Word XML
+                    img_tag = self._make_img_tag_from_rid(ref.rId, ref.cx, ref.cy, ref.extent)
+
+                    if img_tag:
+                        html_content += img_tag
+
                 except Exception as e:
                     print(f"[ERROR] Xử lý ảnh trong run: {e}")
                     import traceback
@@ -2420,157 +2673,3 @@ class DocxProcessor:
             .replace('>', '>')
             .replace('"', '&quot;')
             .replace("'", '&#039;'))
-
-    def prettify_xml(self, elem):
-        """Tạo XML đẹp với indentation"""
-        rough_string = tostring(elem, encoding='utf-8')
-        reparsed = minidom.parseString(rough_string)
-        return reparsed.toprettyxml(indent="  ", encoding='UTF-8').decode('utf-8')
-
-
-    def post_process_xml(self, xml_str):
-        """
-        Sửa lại hàm post_process_xml:
-        - Di chuyển second_correction ra khỏi vòng lặp đầu
-        - Thay đổi cách xử lý math-tex để lấy nội dung bên trong span
-        - Thêm các regex để unescape các thẻ có attribute như <table class='...'>
-        - Một số sửa nhỏ khác để tránh phá hỏng XML quá sớm
-        """
-        import re
-        from xml.dom import minidom
-        import html
-
-        # đảm bảo header
-        xml_str = xml_str.replace('<?xml version="1.0" ?>', '<?xml version="1.0" encoding="UTF-8"?>')
-
-        # các thay thế cố định (dùng re.escape khi cần)
-        correction = {
-            'REPLACELATER': '',
-            '&lt;br&gt;': '<br>',
-            '&lt;br/&gt;': '<br/>',
-            '&lt;em&gt;': '<em>',
-            '&lt;/em&gt;': '</em>',
-            '&lt;u&gt;': '<u>',
-            '&lt;/u&gt;': '</u>',
-            '&lt;strong&gt;': '<strong>',
-            '&lt;/strong&gt;': '</strong>',
-            '&lt;/font&gt;': '</font>',
-            '&lt;font': '<font',
-            '&lt;span': '<span',
-            '&lt;/span&gt;': '</span>',
-            '&lt;input': '<input',
-            '"&gt;': '">',
-            '&lt;/div&gt;': '</div>',
-            '&lt;div': '<div',
-            '&#xD;': '',
-            '&lt;label': '<label',
-            '&lt;select': '<select',
-            '&lt;option': '<option',
-            'hidden&gt;': 'hidden>',
-            '&lt;/option&gt;': '</option>',
-            '&lt;/select&gt;': '</select>',
-            '&lt;/label&gt;': '</label>',
-            '&quot;': '"',
-            '&lt;center&gt;': '<center>',
-            '&lt;/center&gt;': '</center>',
-            '&lt;p&gt;': '<p>',
-            '&lt;/p&gt;': '</p>',
-            '&lt;img': '<img',
-            ' /&gt;': ' />',
-            '/&gt;': '/>',
-            '&lt;audio': '<audio',
-            '&lt;/audio&gt;': '</audio>',
-            '&lt;source': '<source',
-            '&lt;blockquote&gt;': '<blockquote>',
-            '&lt;/blockquote&gt;': '</blockquote>',
-            '&lt;table&gt;': '<table>',
-            '&lt;/table&gt;': '</table>',
-            '&lt;tr&gt;': '<tr>',
-            '&lt;/tr&gt;': '</tr>',
-            '&lt;td&gt;': '<td>',
-            '&lt;/td&gt;': '</td>',
-            '&lt;li&gt;': '<li>',
-            '&lt;/li&gt;': '</li>',
-            '&lt;i&gt;': '<i>',
-            '&lt;/i&gt;': '</i>',
-            '&lt;sub&gt;': '<sub>',
-            '&lt;/sub&gt;': '</sub>',
-            '&lt;sup&gt;': '<sup>',
-            '&lt;/sup&gt;': '</sup>',
-        }
-
-        # first pass of simple replacements
-        for key, val in correction.items():
-            xml_str = re.sub(re.escape(key), val, xml_str, flags=re.IGNORECASE)
-
-        # second set of corrections (ensure it is NOT nested inside the previous loop)
-        second_correction = {
-            '&lt;i&gt;': '<i>',
-            '&lt;/i&gt;': '</i>',
-            '&lt;u&gt;': '<u>',
-            '&lt;/u&gt;': '</u>',
-            '&lt;strong&gt;': '<strong>',
-            '&lt;/strong&gt;': '</strong>',
-            '&lt;sub&gt;': '<sub>',
-            '&lt;/sub&gt;': '</sub>',
-            '&lt;sup&gt;': '<sup>',
-            '&lt;/sup&gt;': '</sup>',
-        }
-        for key, val in second_correction.items():
-            xml_str = re.sub(re.escape(key), val, xml_str, flags=re.IGNORECASE)
-
-        # === XỬ LÝ CÁC THẺ CÓ ATTR (ví dụ: &lt;table class='...'&gt;) ===
-        tags_with_attrs = [
-            'table', 'tr', 'td', 'th', 'tbody', 'thead', 'tfoot',
-            'img', 'div', 'span', 'p', 'sup', 'sub', 'input', 'label',
-            'select', 'option', 'audio', 'source', 'blockquote', 'li', 'center', 'font'
-        ]
-        for tag in tags_with_attrs:
-            xml_str = re.sub(r'&lt;(' + tag + r'\b)', r'<\1', xml_str, flags=re.IGNORECASE)
-            xml_str = re.sub(r'&lt;\/(' + tag + r')\s*&gt;', r'</\1>', xml_str, flags=re.IGNORECASE)
-
-        # chuyển các thực thể HTML phổ biến sang ký tự thật (an toàn hơn là unescape toàn bộ)
-        xml_str = html.unescape(xml_str)
-
-        # === XỬ LÝ MATHLATEX ===
-        def clean_mathlatex(match):
-            inner = match.group(1)
-            inner = (
-                inner
-                .replace('<strong>', '')
-                .replace('</strong>', '')
-                .replace('<i>', '')
-                .replace('</i>', '')
-                .replace('<u>', '')
-                .replace('</u>', '')
-                .replace('<br>', '')
-                .replace('<br/>', '')
-                .replace('%', '\\%')
-                .replace('\\frac', '\\dfrac')
-            )
-            return inner
-
-        xml_str = re.sub(
-            r'<span\s+class=["\']math-tex["\']\s*>(.*?)</span>',
-            clean_mathlatex,
-            xml_str,
-            flags=re.DOTALL | re.IGNORECASE
-        )
-
-        # === LÀM ĐẸP LẠI XML ===
-        try:
-            xml_str = minidom.parseString(xml_str.encode('utf-8')).toprettyxml(indent="  ", encoding="UTF-8").decode("utf-8")
-        except Exception:
-            pass
-
-        # === LƯU FILE ===
-        # file_name = "docXML.xml"
-        # if "<itemDocuments>" in xml_str:
-        #     file_name = "docHL.xml"
-        # try:
-        #     with open(file_name, "w", encoding="utf-8") as f:
-        #         f.write(xml_str)
-        # except Exception:
-        #     pass
-
-        return xml_str
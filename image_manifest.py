@@ -0,0 +1,279 @@
+# image_manifest.py
+"""
+Manifest ảnh cho một tài liệu DOCX.
+
+Quét một lần toàn bộ quan hệ ảnh (word/media) của document part và các node
+w:drawing / v:imagedata trong body, ghi lại rId, hash nội dung, kích thước byte,
+định dạng và kích thước hiển thị. Base64 của mỗi ảnh chỉ được tạo một lần, khi
+cần, thông qua cache dùng chung giữa các tài liệu.
+"""
+
+import base64
+import hashlib
+import re
+import weakref
+from collections import OrderedDict
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+import image_probe
+
+
+NS_W = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+NS_A = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+NS_WP = 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing'
+NS_V = 'urn:schemas-microsoft-com:vml'
+NS_R = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+TAG_P = f'{{{NS_W}}}p'
+TAG_R = f'{{{NS_W}}}r'
+TAG_DRAWING = f'{{{NS_W}}}drawing'
+TAG_BLIP = f'{{{NS_A}}}blip'
+TAG_EXTENT = f'{{{NS_WP}}}extent'
+TAG_IMAGEDATA = f'{{{NS_V}}}imagedata'
+ATTR_EMBED = f'{{{NS_R}}}embed'
+ATTR_ID = f'{{{NS_R}}}id'
+
+EMU_PER_PT = 12700
+
+# Cache base64 dùng chung cho mọi tài liệu trong process: (sha1, mode) -> str | None
+_ENCODE_CACHE_LIMIT = 64 * 1024 * 1024  # tổng số ký tự base64 tối đa giữ lại
+_encode_cache: "OrderedDict[Tuple[str, str], Optional[str]]" = OrderedDict()
+_encode_cache_size = 0
+
+# Kích thước / DPI đọc từ header, theo hash nội dung: sha1 -> (width, height, dpi | None)
+_PROBE_CACHE_LIMIT = 4096
+_probe_cache: "OrderedDict[str, Tuple[int, int, Optional[tuple]]]" = OrderedDict()
+
+_manifests = weakref.WeakKeyDictionary()
+
+
+class ImageInfo:
+    """Thông tin một ảnh trong word/media, được tham chiếu qua rId"""
+
+    __slots__ = ('rId', '_part', 'content_type', 'format', 'extent', 'extents', '_sha1', '_size')
+
+    def __init__(self, rId, part):
+        self.rId = rId
+        # Tham chiếu yếu: manifest nằm trong registry theo document part, giữ part mạnh
+        # thì tài liệu (và toàn bộ media) không bao giờ được giải phóng
+        self._part = weakref.ref(part)
+        self.content_type = getattr(part, 'content_type', '') or 'image/png'
+        self.format = self.content_type.split('/')[-1].lower()
+        self.extent = None  # (cx, cy) EMU của lần xuất hiện đầu tiên trong body
+        self.extents = []  # mọi (cx, cy) EMU khác nhau mà ảnh được hiển thị trong body
+        self._sha1 = None
+        self._size = None
+
+    @property
+    def part(self):
+        return self._part()
+
+    @property
+    def blob(self) -> bytes:
+        return self.part.blob
+
+    @property
+    def sha1(self) -> str:
+        if self._sha1 is None:
+            self._sha1 = hashlib.sha1(self.blob).hexdigest()
+        return self._sha1
+
+    @property
+    def size(self) -> int:
+        if self._size is None:
+            size = getattr(self.part, 'size', None)
+            self._size = size if size is not None else len(self.blob)
+        return self._size
+
+    @property
+    def dimensions(self) -> Tuple[int, int, Optional[tuple]]:
+        """
+        (width, height, dpi | None) theo px của ảnh gốc, đọc từ header (image_probe),
+        Pillow chỉ dùng khi header không nhận ra được. Cache theo hash nội dung.
+        """
+        key = self.sha1
+        if key in _probe_cache:
+            _probe_cache.move_to_end(key)
+            return _probe_cache[key]
+        result = image_probe.probe(self.blob)
+        if result is None:
+            result = image_probe.probe_with_pillow(self.blob)
+        _probe_cache[key] = result
+        if len(_probe_cache) > _PROBE_CACHE_LIMIT:
+            _probe_cache.popitem(last=False)
+        return result
+
+
+class ImageRef:
+    """Một lần xuất hiện của ảnh trong body (w:drawing hoặc v:imagedata)"""
+
+    __slots__ = ('kind', 'rId', 'cx', 'cy', 'width_pt', 'height_pt')
+
+    def __init__(self, kind, rId, cx=None, cy=None, width_pt=None, height_pt=None):
+        self.kind = kind  # 'blip' hoặc 'vml'
+        self.rId = rId
+        self.cx = cx
+        self.cy = cy
+        self.width_pt = width_pt
+        self.height_pt = height_pt
+
+    @property
+    def extent(self) -> Optional[Tuple[int, int]]:
+        """(cx, cy) EMU hiển thị của lần xuất hiện này (VML: đổi từ pt), None nếu không rõ"""
+        if self.cx is not None:
+            return self.cx, self.cy
+        if self.width_pt is not None:
+            return int(self.width_pt * EMU_PER_PT), int(self.height_pt * EMU_PER_PT)
+        return None
+
+
+class ImageManifest:
+    """Manifest ảnh của một document part, tra cứu theo rId hoặc theo run/paragraph"""
+
+    def __init__(self, part, scan_body=True):
+        # part là khóa của registry _manifests: chỉ giữ tham chiếu yếu
+        self._part = weakref.ref(part)
+        self.images: Dict[str, ImageInfo] = {}
+        self._refs: Dict[object, List[ImageRef]] = {}
+
+        for rel in part.rels.values():
+            if getattr(rel, 'is_external', False):
+                continue
+            try:
+                target = rel.target_part
+            except Exception:
+                continue
+            if 'image' in (getattr(target, 'content_type', '') or ''):
+                self.images[rel.rId] = ImageInfo(rel.rId, target)
+
+        body = getattr(getattr(part, 'element', None), 'body', None)
+        if scan_body and body is not None:
+            self.index(body)
+
+    # ------------------------------------------------------------------
+    # Xây dựng chỉ mục
+    # ------------------------------------------------------------------
+
+    def index(self, root) -> List[ImageRef]:
+        """Ghi nhận mọi ảnh nằm dưới `root`, gắn vào từng w:r / w:p chứa nó; trả về các ảnh tìm thấy."""
+        found = []
+        for node in root.iter(TAG_DRAWING, TAG_IMAGEDATA):
+            ref = self.make_ref(node)
+            if ref is None:
+                continue
+            found.append(ref)
+
+            info = self.images.get(ref.rId)
+            extent = ref.extent
+            if info is not None and extent is not None:
+                if info.extent is None:
+                    info.extent = extent
+                if extent not in info.extents:
+                    info.extents.append(extent)
+
+            for anc in node.iterancestors(TAG_R, TAG_P):
+                self._refs.setdefault(anc, []).append(ref)
+                if anc is root:
+                    break
+        return found
+
+    def discard(self, root):
+        """Bỏ chỉ mục ảnh dưới `root` (gọi trước khi phần tử bị giải phóng)"""
+        if not self._refs:
+            return
+        for node in root.iter(TAG_R, TAG_P):
+            self._refs.pop(node, None)
+
+    def make_ref(self, node) -> Optional[ImageRef]:
+        """Đọc rId và kích thước từ một node w:drawing hoặc v:imagedata"""
+        if node.tag == TAG_DRAWING:
+            blip = node.find(f'.//{TAG_BLIP}')
+            rId = blip.get(ATTR_EMBED) if blip is not None else None
+            if not rId:
+                return None
+            extent = node.find(f'.//{TAG_EXTENT}')
+            cx = cy = None
+            if extent is not None:
+                cx = int(extent.get('cx', 0))
+                cy = int(extent.get('cy', 0))
+            return ImageRef('blip', rId, cx=cx, cy=cy)
+
+        rId = node.get(ATTR_ID)
+        if not rId:
+            return None
+        width_pt = height_pt = None
+        shape = node.getparent()
+        if shape is not None:
+            style = shape.get('style', '')
+            width_match = re.search(r'width:\s*(\d+(?:\.\d+)?)pt', style)
+            height_match = re.search(r'height:\s*(\d+(?:\.\d+)?)pt', style)
+            if width_match and height_match:
+                width_pt = float(width_match.group(1))
+                height_pt = float(height_match.group(1))
+        return ImageRef('vml', rId, width_pt=width_pt, height_pt=height_pt)
+
+    # ------------------------------------------------------------------
+    # Tra cứu
+    # ------------------------------------------------------------------
+
+    def get(self, rId) -> Optional[ImageInfo]:
+        return self.images.get(rId)
+
+    def refs_for(self, element, kind=None) -> List[ImageRef]:
+        """Các ảnh nằm trong run/paragraph `element` (lxml), theo thứ tự tài liệu"""
+        refs = self._refs.get(element, ())
+        if kind is None:
+            return list(refs)
+        return [ref for ref in refs if ref.kind == kind]
+
+    def encode(self, rId, transcode=True) -> Optional[str]:
+        """
+        Base64 của ảnh `rId`, tính một lần và dùng lại qua cache chung.
+        transcode=True: lưu lại qua Pillow theo định dạng gốc (như DocxProcessor);
+        transcode=False: mã hóa thẳng bytes gốc (như module Tin học).
+        """
+        info = self.images.get(rId)
+        if info is None:
+            return None
+
+        key = (info.sha1, 'pil' if transcode else 'raw')
+        if key in _encode_cache:
+            _encode_cache.move_to_end(key)
+            return _encode_cache[key]
+
+        try:
+            if transcode:
+                output = BytesIO()
+                img = Image.open(BytesIO(info.blob))
+                img.save(output, format=img.format or 'PNG', optimize=False)
+                data = output.getvalue()
+            else:
+                data = info.blob
+            b64 = base64.b64encode(data).decode('ascii')
+        except Exception as e:
+            print(f"[ERROR] ImageManifest.encode({rId}): {e}")
+            b64 = None
+
+        _remember(key, b64)
+        return b64
+
+
+def _remember(key, b64):
+    global _encode_cache_size
+    _encode_cache[key] = b64
+    _encode_cache_size += len(b64) if b64 else 0
+    while _encode_cache_size > _ENCODE_CACHE_LIMIT and len(_encode_cache) > 1:
+        _, old = _encode_cache.popitem(last=False)
+        _encode_cache_size -= len(old) if old else 0
+
+
+def get_manifest(part, scan_body=True) -> ImageManifest:
+    """Manifest của `part`, tạo ở lần gọi đầu tiên và dùng lại cho cả tài liệu"""
+    manifest = _manifests.get(part)
+    if manifest is None:
+        manifest = ImageManifest(part, scan_body=scan_body)
+        _manifests[part] = manifest
+    return manifest
@@ -0,0 +1,231 @@
+# image_optimizer.py
+"""
+Tối ưu ảnh nhúng (tùy chọn): thu nhỏ theo kích thước hiển thị và nén lại.
+
+Ảnh chụp điện thoại 4000x3000 chỉ hiển thị ~300 px nhưng vẫn được nhúng nguyên
+bản làm XML phình thêm vài MB. Khi DocxProcessor được tạo với image_options:
+- kích thước đích = kích thước hiển thị (EMU của wp:extent -> px 96 DPI) x dpi_factor;
+- ảnh lớn hơn đích thì thu nhỏ, rồi nén lại theo format / quality cấu hình
+  (WebP, JPEG, hoặc PNG lượng tử hóa 256 màu);
+- ảnh đã đủ nhỏ (không cần thu nhỏ và dưới min_bytes), ảnh động, ảnh vector
+  (EMF/WMF/SVG) và kết quả không nhỏ hơn bản gốc đều giữ nguyên;
+- ảnh hiển thị ở nhiều kích thước khác nhau được tối ưu riêng cho từng kích thước;
+- việc nén chạy trên thread pool (Pillow nhả GIL khi resize / encode): ảnh được
+  gửi đi ngay khi manifest biết kích thước hiển thị, renderer chỉ chờ kết quả;
+- kết quả (base64) được cache theo hash nội dung + tham số, dùng chung trong process.
+"""
+
+import base64
+import math
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Optional, Tuple
+
+from PIL import Image, features
+
+
+# 1 px CSS (96 DPI) = 9525 EMU, giống cách DocxProcessor tính width/height của thẻ <img>
+EMU_PER_PX = 9525
+
+# Định dạng không xử lý bằng Pillow (vector) -> giữ nguyên
+_SKIP_FORMATS = ('emf', 'x-emf', 'wmf', 'x-wmf', 'svg+xml', 'svg')
+
+_CONTENT_TYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg', 'png': 'image/png'}
+
+# Cache kết quả dùng chung cho mọi tài liệu trong process: key -> (content_type, b64) | None
+_CACHE_LIMIT = 64 * 1024 * 1024  # tổng số ký tự base64 tối đa giữ lại
+_cache: "OrderedDict[tuple, Optional[Tuple[str, str]]]" = OrderedDict()
+_cache_size = 0
+_cache_lock = threading.Lock()
+
+
+class ImageOptions:
+    """Tham số tối ưu ảnh (picklable, để truyền sang worker process)"""
+
+    __slots__ = ('format', 'quality', 'dpi_factor', 'min_bytes', 'max_dimension')
+
+    def __init__(self, format='webp', quality=80, dpi_factor=2.0, min_bytes=64 * 1024, max_dimension=4096):
+        format = format.lower().replace('jpg', 'jpeg')
+        if format not in _CONTENT_TYPES:
+            raise ValueError(f"Định dạng ảnh không hỗ trợ: {format}")
+        if format == 'webp' and not features.check('webp'):
+            print("[WARN] Pillow không hỗ trợ WebP, dùng JPEG")
+            format = 'jpeg'
+        self.format = format
+        self.quality = quality
+        self.dpi_factor = dpi_factor
+        self.min_bytes = min_bytes
+        self.max_dimension = max_dimension
+
+    @property
+    def key(self) -> tuple:
+        return (self.format, self.quality, self.dpi_factor, self.min_bytes, self.max_dimension)
+
+
+def add_arguments(parser):
+    """Tùy chọn dòng lệnh cho các entrypoint (conversion_service, watch_folder)"""
+    parser.add_argument('--optimize-images', choices=sorted(_CONTENT_TYPES), default=None,
+                        help="Thu nhỏ ảnh theo kích thước hiển thị và nén lại theo định dạng này")
+    parser.add_argument('--image-quality', type=int, default=80, help="Chất lượng nén ảnh (WebP / JPEG)")
+    parser.add_argument('--image-dpi-factor', type=float, default=2.0,
+                        help="Độ phân giải giữ lại = kích thước hiển thị x hệ số này")
+
+
+def processor_kwargs_from_args(args) -> dict:
+    """Tham số DocxProcessor tương ứng với add_arguments()"""
+    if not args.optimize_images:
+        return {}
+    return {'image_options': ImageOptions(args.optimize_images, args.image_quality, args.image_dpi_factor)}
+
+
+def target_size(extent, options: ImageOptions) -> Tuple[int, int]:
+    """Kích thước đích (px) từ extent (cx, cy) EMU; không có extent thì chỉ giới hạn max_dimension"""
+    if not extent or not extent[0] or not extent[1]:
+        return options.max_dimension, options.max_dimension
+    width = math.ceil(extent[0] / EMU_PER_PX * options.dpi_factor)
+    height = math.ceil(extent[1] / EMU_PER_PX * options.dpi_factor)
+    return min(width, options.max_dimension), min(height, options.max_dimension)
+
+
+def _has_alpha(img) -> bool:
+    return img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+
+
+def optimize_bytes(blob: bytes, size: Tuple[int, int], options: ImageOptions) -> Optional[Tuple[str, bytes]]:
+    """
+    Thu nhỏ (nếu lớn hơn size) và nén lại blob.
+    Trả về (content_type, bytes mới), hoặc None nếu nên giữ nguyên ảnh gốc.
+    """
+    img = Image.open(BytesIO(blob))
+    if getattr(img, 'n_frames', 1) > 1:
+        return None  # ảnh động (GIF/WebP nhiều frame)
+
+    width, height = img.size
+    scale = min(1.0, size[0] / width, size[1] / height)
+    if scale >= 1.0 and len(blob) <= options.min_bytes:
+        return None
+
+    new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if scale < 1.0:
+        # JPEG: giải mã thẳng ở độ phân giải thấp hơn (nhanh hơn nhiều)
+        img.draft('RGB', new_size)
+        img = img.resize(new_size, Image.LANCZOS, reducing_gap=3.0)
+
+    exif = img.info.get('exif')
+    alpha = _has_alpha(img)
+    output = BytesIO()
+    if options.format == 'webp':
+        img = img.convert('RGBA' if alpha else 'RGB')
+        img.save(output, format='WEBP', quality=options.quality, method=4, **({'exif': exif} if exif else {}))
+    elif options.format == 'jpeg':
+        if alpha:
+            rgba = img.convert('RGBA')
+            img = Image.new('RGB', rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel('A'))
+        else:
+            img = img.convert('RGB')
+        img.save(output, format='JPEG', quality=options.quality, optimize=True, progressive=True,
+                 **({'exif': exif} if exif else {}))
+    else:
+        img = img.convert('RGBA' if alpha else 'RGB')
+        method = Image.Quantize.FASTOCTREE if alpha else Image.Quantize.MEDIANCUT
+        img.quantize(colors=256, method=method).save(output, format='PNG', optimize=True)
+
+    data = output.getvalue()
+    if len(data) >= len(blob):
+        return None
+    return _CONTENT_TYPES[options.format], data
+
+
+def _remember(key, value):
+    global _cache_size
+    with _cache_lock:
+        if key in _cache:
+            return
+        _cache[key] = value
+        _cache_size += len(value[1]) if value else 0
+        while _cache_size > _CACHE_LIMIT and len(_cache) > 1:
+            _, old = _cache.popitem(last=False)
+            _cache_size -= len(old[1]) if old else 0
+
+
+def _lookup(key):
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return True, _cache[key]
+    return False, None
+
+
+class ImageOptimizer:
+    """Tối ưu ảnh của ImageManifest trên thread pool, kết quả lấy qua encode()"""
+
+    def __init__(self, options: ImageOptions, workers: Optional[int] = None):
+        self.options = options
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self._executor = None
+        self._pending = {}  # key -> Future đang chạy
+        self._lock = threading.Lock()
+
+    def _key(self, info, extent=None):
+        return (info.sha1, target_size(extent or info.extent, self.options), self.options.key)
+
+    def _run(self, key, blob, size):
+        try:
+            result = optimize_bytes(blob, size, self.options)
+            value = None if result is None else (result[0], base64.b64encode(result[1]).decode('ascii'))
+        except Exception as e:
+            print(f"[WARN] Không tối ưu được ảnh {key[0][:8]}: {e}")
+            value = None
+        _remember(key, value)
+        with self._lock:
+            self._pending.pop(key, None)
+        return value
+
+    def submit(self, info, extent=None):
+        """
+        Gửi ảnh đi tối ưu ở nền cho kích thước hiển thị extent (EMU, mặc định extent của
+        ảnh trong manifest); bỏ qua nếu đã có trong cache / đang chạy
+        """
+        if info.format in _SKIP_FORMATS:
+            return None
+        key = self._key(info, extent)
+        if _lookup(key)[0]:
+            return None
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='image-optimizer')
+                future = self._executor.submit(self._run, key, info.blob, key[1])
+                self._pending[key] = future
+        return future
+
+    def prefetch(self, infos):
+        """Gửi đi mọi kích thước hiển thị đã biết của các ảnh"""
+        for info in infos:
+            if info is not None:
+                for extent in info.extents:
+                    self.submit(info, extent)
+
+    def encode(self, info, extent=None) -> Optional[Tuple[str, str]]:
+        """
+        (content_type, base64) của ảnh đã tối ưu cho kích thước hiển thị extent (EMU của
+        lần xuất hiện đang render), hoặc None nếu giữ nguyên ảnh gốc
+        """
+        if info.format in _SKIP_FORMATS:
+            return None
+        key = self._key(info, extent)
+        found, value = _lookup(key)
+        if found:
+            return value
+        future = self.submit(info, extent)
+        return future.result() if future is not None else _lookup(key)[1]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
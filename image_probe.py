@@ -0,0 +1,202 @@
+# image_probe.py
+"""
+Đọc kích thước (px) và DPI của ảnh chỉ từ header, không giải mã dữ liệu ảnh.
+
+Hỗ trợ PNG, JPEG, GIF, BMP, WebP và TIFF. Giá trị DPI theo đúng quy ước của
+Pillow (img.info['dpi']) để kết quả tính kích thước hiển thị không đổi:
+- PNG: chunk pHYs đơn vị mét -> px/m x 0.0254;
+- JPEG: mật độ JFIF (inch / cm), không có thì lấy XResolution trong EXIF
+  (EXIF không đọc được -> 72), không có cả hai thì không có DPI;
+- BMP: px/m / 39.3701; TIFF: XResolution / YResolution theo ResolutionUnit;
+- GIF / WebP: không có DPI.
+Định dạng khác hoặc header lạ -> probe() trả về None, nơi gọi dùng Pillow.
+"""
+
+import struct
+from io import BytesIO
+from typing import Optional, Tuple
+
+# Marker SOF của JPEG (chứa kích thước), trừ DHT (C4), JPG (C8), DAC (CC)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+_TIFF_WIDTH = 0x0100
+_TIFF_HEIGHT = 0x0101
+_TIFF_XRES = 0x011A
+_TIFF_YRES = 0x011B
+_TIFF_RESUNIT = 0x0128
+
+# Kích thước (byte) của từng kiểu dữ liệu TIFF
+_TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+
+
+class _NoDpi(Exception):
+    """Header hợp lệ nhưng không ghi DPI"""
+
+
+def probe(blob: bytes) -> Optional[Tuple[int, int, Optional[tuple]]]:
+    """(width, height, dpi | None) đọc từ header, None nếu không nhận ra định dạng"""
+    try:
+        if blob[:8] == b'\x89PNG\r\n\x1a\n':
+            return _probe_png(blob)
+        if blob[:2] == b'\xff\xd8':
+            return _probe_jpeg(blob)
+        if blob[:6] in (b'GIF87a', b'GIF89a'):
+            width, height = struct.unpack_from('<HH', blob, 6)
+            return width, height, None
+        if blob[:2] == b'BM':
+            return _probe_bmp(blob)
+        if blob[:4] == b'RIFF' and blob[8:12] == b'WEBP':
+            return _probe_webp(blob)
+        if blob[:4] in (b'II*\x00', b'MM\x00*'):
+            return _probe_tiff(blob)
+    except (struct.error, IndexError, ValueError, ZeroDivisionError):
+        return None
+    return None
+
+
+def _probe_png(blob):
+    width, height = struct.unpack_from('>II', blob, 16)
+    dpi = None
+    pos = 8
+    while pos + 8 <= len(blob):
+        length, chunk_type = struct.unpack_from('>I4s', blob, pos)
+        if chunk_type in (b'IDAT', b'IEND'):
+            break
+        if chunk_type == b'pHYs' and length >= 9:
+            px, py, unit = struct.unpack_from('>IIB', blob, pos + 8)
+            if unit == 1:
+                dpi = (px * 0.0254, py * 0.0254)
+        pos += 12 + length
+    return width, height, dpi
+
+
+def _probe_jpeg(blob):
+    pos = 2
+    dpi = None
+    exif = None
+    while pos + 4 <= len(blob):
+        if blob[pos] != 0xFF:
+            return None
+        marker = blob[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in (0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7):
+            pos += 2
+            continue
+        (length,) = struct.unpack_from('>H', blob, pos + 2)
+        segment = blob[pos + 4:pos + 2 + length]
+        if marker == 0xE0 and segment[:5] == b'JFIF\x00' and dpi is None:
+            unit = segment[7]
+            density = struct.unpack_from('>HH', segment, 8)
+            if unit == 1:
+                dpi = density
+            elif unit == 2:
+                dpi = tuple(d * 2.54 for d in density)
+        elif marker == 0xE1 and segment[:6] == b'Exif\x00\x00' and exif is None:
+            exif = segment[6:]
+        elif marker in _JPEG_SOF:
+            height, width = struct.unpack_from('>HH', segment, 1)
+            if dpi is None and exif is not None:
+                dpi = _exif_dpi(exif)
+            return width, height, dpi
+        elif marker == 0xDA:
+            return None
+        pos += 2 + length
+    return None
+
+
+def _exif_dpi(exif):
+    """DPI từ EXIF như Pillow: thiếu / lỗi -> (72, 72)"""
+    try:
+        tags = _read_ifd(exif)
+        unit = tags[_TIFF_RESUNIT]
+        dpi = tags[_TIFF_XRES]
+        if dpi != dpi:  # NaN
+            raise ValueError
+        if unit == 3:
+            dpi *= 2.54
+        return dpi, dpi
+    except (KeyError, ValueError, struct.error, IndexError, ZeroDivisionError):
+        return 72, 72
+
+
+def _probe_bmp(blob):
+    (header_size,) = struct.unpack_from('<I', blob, 14)
+    if header_size not in (40, 52, 56, 64, 108, 124):
+        return None
+    width, height, _, _, _, _, ppm_x, ppm_y = struct.unpack_from('<iiHHIIii', blob, 18)
+    return width, abs(height), (ppm_x / 39.3701, ppm_y / 39.3701)
+
+
+def _probe_webp(blob):
+    chunk = blob[12:16]
+    if chunk == b'VP8X':
+        width = int.from_bytes(blob[24:27], 'little') + 1
+        height = int.from_bytes(blob[27:30], 'little') + 1
+    elif chunk == b'VP8 ':
+        if blob[23:26] != b'\x9d\x01\x2a':
+            return None
+        width, height = struct.unpack_from('<HH', blob, 26)
+        width &= 0x3FFF
+        height &= 0x3FFF
+    elif chunk == b'VP8L':
+        if blob[20] != 0x2F:
+            return None
+        bits = int.from_bytes(blob[21:25], 'little')
+        width = (bits & 0x3FFF) + 1
+        height = ((bits >> 14) & 0x3FFF) + 1
+    else:
+        return None
+    return width, height, None
+
+
+def _probe_tiff(blob):
+    tags = _read_ifd(blob)
+    width, height = tags[_TIFF_WIDTH], tags[_TIFF_HEIGHT]
+    xres = tags.get(_TIFF_XRES, 1)
+    yres = tags.get(_TIFF_YRES, 1)
+    dpi = None
+    if xres and yres:
+        unit = tags.get(_TIFF_RESUNIT)
+        if unit == 2 or unit is None:
+            dpi = (xres, yres)
+        elif unit == 3:
+            dpi = (xres * 2.54, yres * 2.54)
+    return width, height, dpi
+
+
+def _read_ifd(data, wanted=(_TIFF_WIDTH, _TIFF_HEIGHT, _TIFF_XRES, _TIFF_YRES, _TIFF_RESUNIT)):
+    """Giá trị (số đơn) của các tag trong IFD đầu tiên của một cấu trúc TIFF"""
+    order = '<' if data[:2] == b'II' else '>'
+    if data[:2] not in (b'II', b'MM'):
+        raise ValueError("Không phải TIFF")
+    (offset,) = struct.unpack_from(order + 'I', data, 4)
+    (count,) = struct.unpack_from(order + 'H', data, offset)
+    tags = {}
+    for i in range(count):
+        tag, typ, n = struct.unpack_from(order + 'HHI', data, offset + 2 + 12 * i)
+        if tag not in wanted or typ not in _TIFF_TYPE_SIZES:
+            continue
+        value_pos = offset + 2 + 12 * i + 8
+        if _TIFF_TYPE_SIZES[typ] * n > 4:
+            (value_pos,) = struct.unpack_from(order + 'I', data, value_pos)
+        if typ == 3:
+            (value,) = struct.unpack_from(order + 'H', data, value_pos)
+        elif typ == 4:
+            (value,) = struct.unpack_from(order + 'I', data, value_pos)
+        elif typ in (5, 10):
+            num, den = struct.unpack_from(order + ('II' if typ == 5 else 'ii'), data, value_pos)
+            value = num / den if den else float('nan')
+        else:
+            continue
+        tags[tag] = value
+    return tags
+
+
+def probe_with_pillow(blob: bytes) -> Tuple[int, int, Optional[tuple]]:
+    """Phương án cuối: Pillow (chỉ mở, không load dữ liệu ảnh)"""
+    from PIL import Image
+    with Image.open(BytesIO(blob)) as img:
+        width, height = img.size
+        return width, height, img.info.get('dpi')
@@ -0,0 +1,140 @@
+# log_buffer.py
+"""
+Bộ đệm log giữa thread xử lý và giao diện.
+
+Trước đây ProcessingThread emit một signal Qt cho mỗi dòng log (kể cả từng dòng
+lỗi), MainWindow append vào QTextEdit và cuộn xuống mỗi lần: batch nhiều lỗi làm
+UI giật và worker chậm vì lưu lượng signal giữa hai thread. LogBuffer gom log lại:
+- worker chỉ write() vào list trong bộ nhớ (có lock), không gửi signal;
+- timer phía UI gọi drain() định kỳ (~100 ms) để lấy cả lô text và tiến trình
+  mới nhất, nên tiến trình tự được giới hạn tần suất theo chu kỳ timer;
+- toàn bộ log (kể cả print của processor, qua spill_stdout()) được ghi ra file.
+"""
+
+import contextlib
+import os
+import sys
+import threading
+import time
+from typing import Optional, Tuple
+
+
+# Số file log giữ lại trong thư mục logs
+MAX_LOG_FILES = 20
+
+
+def get_log_dir() -> str:
+    """Thư mục logs cạnh exe / main.py, hoặc thư mục tạm nếu không ghi được"""
+    if getattr(sys, "frozen", False):
+        base_path = os.path.dirname(sys.executable)
+    else:
+        base_path = os.path.dirname(os.path.abspath(__file__))
+    log_dir = os.path.join(base_path, "logs")
+    try:
+        os.makedirs(log_dir, exist_ok=True)
+        return log_dir
+    except OSError:
+        import tempfile
+        log_dir = os.path.join(tempfile.gettempdir(), "docx_xml_converter_logs")
+        os.makedirs(log_dir, exist_ok=True)
+        return log_dir
+
+
+def new_log_path() -> str:
+    """Đường dẫn file log cho phiên chạy mới, dọn bớt file log cũ"""
+    log_dir = get_log_dir()
+    old_logs = sorted(f for f in os.listdir(log_dir) if f.endswith('.log'))
+    for name in old_logs[:max(0, len(old_logs) - MAX_LOG_FILES + 1)]:
+        try:
+            os.remove(os.path.join(log_dir, name))
+        except OSError:
+            pass
+    return os.path.join(log_dir, time.strftime("convert_%Y%m%d_%H%M%S.log"))
+
+
+class _StdoutTee:
+    """File-like cho redirect_stdout: ghi vào file log và stdout gốc (nếu có)"""
+
+    def __init__(self, buffer: 'LogBuffer', stream):
+        self._buffer = buffer
+        self._stream = stream
+
+    def write(self, s):
+        self._buffer.spill(s)
+        if self._stream is not None:
+            self._stream.write(s)
+        return len(s)
+
+    def flush(self):
+        if self._stream is not None:
+            self._stream.flush()
+
+
+class LogBuffer:
+    """Log thread-safe: worker write(), UI drain() theo timer, file log nhận mọi dòng"""
+
+    def __init__(self, log_path: Optional[str] = None, max_lines: int = 2000):
+        self.log_path = log_path
+        self.max_lines = max_lines
+        self._lock = threading.Lock()
+        self._pending = []
+        self._progress = None
+        self._file = None
+        if log_path:
+            try:
+                self._file = open(log_path, 'a', encoding='utf-8')
+            except OSError as e:
+                print(f"[WARN] Không mở được file log {log_path}: {e}")
+                self.log_path = None
+
+    def write(self, message: str):
+        """Thêm một dòng log (gọi được từ bất kỳ thread nào)"""
+        with self._lock:
+            self._pending.append(message)
+            if self._file is not None:
+                self._file.write(message + '\n')
+
+    def spill(self, text: str):
+        """Chỉ ghi vào file log, không hiển thị trên UI"""
+        if self._file is None or not text:
+            return
+        with self._lock:
+            self._file.write(text)
+
+    def set_progress(self, *progress):
+        """Ghi nhận tiến trình (current, total, ...); UI chỉ nhận giá trị mới nhất ở lần drain() kế tiếp"""
+        with self._lock:
+            self._progress = progress
+
+    def drain(self) -> Tuple[str, int, Optional[tuple]]:
+        """
+        Lấy lô log đang chờ.
+        Trả về (text, skipped, progress): text gồm tối đa max_lines dòng cuối,
+        skipped là số dòng cũ hơn bị bỏ khỏi UI (vẫn có trong file log),
+        progress là tuple tiến trình mới nhất hoặc None nếu không đổi.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+            progress, self._progress = self._progress, None
+            if self._file is not None and pending:
+                self._file.flush()
+
+        skipped = max(0, len(pending) - self.max_lines)
+        if skipped:
+            pending = pending[skipped:]
+        return '\n'.join(pending), skipped, progress
+
+    @contextlib.contextmanager
+    def spill_stdout(self):
+        """Chuyển print() trong khối with vào file log (vẫn in ra console nếu có)"""
+        if self._file is None:
+            yield
+            return
+        with contextlib.redirect_stdout(_StdoutTee(self, sys.stdout)):
+            yield
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
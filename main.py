@@ -11,98 +11,142 @@ from pathlib import Path
 import tempfile
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QPushButton, QLabel, QListWidget, 
-                             QFileDialog, QProgressBar, QTextEdit, QGroupBox,QDialog,
-                             QMessageBox, QSplitter)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
+                             QFileDialog, QProgressBar, QTextEdit, QPlainTextEdit, QGroupBox,QDialog,
+                             QMessageBox, QSplitter, QComboBox, QSpinBox)
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal
 from PyQt5.QtGui import QFont, QIcon
 import traceback
-import requests
 from packaging  import version
 import json
+import multiprocessing
 
-from docx_processor import DocxProcessor # Import lớp đã cập nhật
+from batch_runner import BatchRunner, WorkerPool, format_eta
+from delta_update import apply_patch, delta_asset_name
+from docx_lint import format_issue, lint_files
+from output_writer import DEFAULT_LEVELS, LEVEL_RANGES, OutputOptions, zstd_available
+from log_buffer import LogBuffer, new_log_path
+from update_check import fetch_latest_release
+from update_downloader import DownloadCancelled, download_file, find_release_sha256, get_session
 
-class ProcessingThread(QThread):
-    """Thread xử lý file để không block UI"""
-    progress = pyqtSignal(str)  # Thông báo tiến trình
+# Chu kỳ (ms) đẩy log / tiến trình từ LogBuffer lên giao diện
+LOG_FLUSH_MS = 100
+
+# Số dòng tối đa giữ trong khung log (log đầy đủ nằm trong file)
+LOG_MAX_BLOCKS = 5000
+
+# Khởi động worker pool sau khi cửa sổ hiện lên (ms), để không làm chậm lúc mở app
+WORKER_POOL_DELAY_MS = 500
+
+# Kiểm tra cập nhật (nền) sau khi mở app (ms)
+UPDATE_CHECK_DELAY_MS = 2000
+
+# Lựa chọn định dạng đầu ra: (nhãn, format, gom zip cả batch)
+OUTPUT_CHOICES = [
+    ("XML (.xml)", 'xml', False),
+    ("XML nén gzip (.xml.gz)", 'gz', False),
+    ("XML nén zstd (.xml.zst)", 'zst', False),
+    ("Một file ZIP cho cả batch (kèm manifest)", 'xml', True),
+]
 
-    finished = pyqtSignal(bool, str, dict)  # Kết quả: (overall_success, overall_message, file_results)
 
-    file_progress = pyqtSignal(int, int)  # (current_file, total_files)
+class ProcessingThread(QThread):
+    """
+    Thread xử lý file để không block UI.
+    Log và tiến trình ghi vào log_buffer (MainWindow đọc theo timer), không emit signal từng dòng.
+    Mỗi file chạy trên worker_pool (dùng chung cả phiên): tạm dừng / hủy qua
+    worker_pool.control, file quá thời gian bị dừng và ghi trạng thái 'timeout'.
+    """
+    finished = pyqtSignal(bool, str, dict)  # Kết quả: (overall_success, overall_message, file_results)
     
-    def __init__(self, input_files, output_dir):
+    def __init__(self, input_files, output_dir, log_buffer, worker_pool, output_options=None):
         super().__init__()
 
         self.input_files = input_files
 
         self.output_dir = output_dir
 
-        self.processor = DocxProcessor()
+        self.log_buffer = log_buffer
+
+        self.worker_pool = worker_pool
+
+        self.output_options = output_options
+
+    def log(self, message):
+        self.log_buffer.write(message)
         
     def run(self):
+        # print() của processor chỉ vào file log, không lên khung log
+        with self.log_buffer.spill_stdout():
+            self._run()
+
+    def _run(self):
+        runner = None
         try:
             total_files = len(self.input_files)
-            success_count = 0
-            failed_count = 0
-            file_results = {} # Dictionary để lưu kết quả cho từng file
-
-            for idx, input_file in enumerate(self.input_files, 1):
-                self.file_progress.emit(idx, total_files)
-                
-                file_name = Path(input_file).stem
-                self.progress.emit(f"🔄 Đang xử lý: {file_name}.docx...")
-                
-                try:
-                    # GỌI process_docx MỚI - Trả về xml_content và danh sách lỗi
-                    xml_content, errors = self.processor.process_docx(input_file)
-                    
-                    if errors:
-                        file_results[file_name] = {
-                            'status': 'error',
-                            'errors': errors
-                        }
-                        self.progress.emit(f"⚠️ Hoàn thành có lỗi: {file_name}.docx")
-                        for err in errors:
-                             self.progress.emit(f"   - {err}")
-                        failed_count += 1
-                    else:
-                        file_results[file_name] = {
-                            'status': 'success',
-                            'errors': []
-                        }
-                        self.progress.emit(f"✅ Hoàn thành: {file_name}.xml")
-                        success_count += 1
-                    
-                    # Luôn lưu file, ngay cả khi có lỗi (nếu có thể)
-                    output_file = os.path.join(self.output_dir, f"{file_name}.xml")
-                    with open(output_file, 'w', encoding='utf-8') as f:
-                        f.write(xml_content)
-                    
-                except Exception as e:
-                    error_msg = f"❌ Lỗi nghiêm trọng khi xử lý {file_name}.docx: {str(e)}"
-                    self.progress.emit(error_msg)
-                    self.progress.emit(f"   Chi tiết: {traceback.format_exc()}")
-                    file_results[file_name] = {
-                        'status': 'critical_error',
-                        'errors': [str(e)]
-                    }
-                    failed_count += 1
+            runner = BatchRunner(self.worker_pool.control, self.log, self.log_buffer.set_progress,
+                                 pool=self.worker_pool, output_options=self.output_options)
+            file_results = runner.run(self.input_files, self.output_dir)
+
+            statuses = [result['status'] for result in file_results.values()]
+            success_count = statuses.count('success')
+            timeout_count = statuses.count('timeout')
+            cancelled_count = statuses.count('cancelled')
+            failed_count = len(statuses) - success_count - cancelled_count
             
             # Tạo thông báo tổng thể
-            overall_success = failed_count == 0
-            if success_count == total_files:
+            overall_success = failed_count == 0 and cancelled_count == 0
+            if cancelled_count:
+                overall_message = f"⏹ Đã hủy. {success_count} thành công, {failed_count} có lỗi, " \
+                                  f"{cancelled_count} file chưa xử lý xong."
+            elif success_count == total_files:
                 overall_message = f"✅ Xử lý thành công {success_count}/{total_files} file!"
             elif success_count > 0:
                 overall_message = f"⚠️ Xử lý xong {total_files}/{total_files} file. " \
                                   f"{success_count} thành công, {failed_count} có lỗi."
             else:
                 overall_message = f"❌ Không có file nào được xử lý thành công hoàn toàn! {failed_count} file có lỗi."
+            if timeout_count:
+                overall_message += f" ({timeout_count} file quá thời gian)"
+            if runner.bundle_path:
+                overall_message += f"\n🗜 Đã gom kết quả vào {os.path.basename(runner.bundle_path)}"
 
             # Gửi tín hiệu hoàn thành với kết quả chi tiết
             self.finished.emit(overall_success, overall_message, file_results)
                 
         except Exception as e:
+            self.log(f"   Chi tiết: {traceback.format_exc()}")
             self.finished.emit(False, f"❌ Lỗi nghiêm trọng trong thread: {str(e)}", {})
+        finally:
+            if runner is not None:
+                runner.close()
+
+
+class LintThread(QThread):
+    """
+    Kiểm tra nhanh cấu trúc các file (docx_lint), không chuyển đổi / không ghi file.
+    Chạy song song trên process riêng (không dùng worker_pool của batch chuyển đổi).
+    """
+    finished = pyqtSignal(dict)  # {file: {'issues': [dict], 'ms'}}
+
+    def __init__(self, input_files, log_buffer):
+        super().__init__()
+        self.input_files = input_files
+        self.log_buffer = log_buffer
+        self._done = 0
+
+    def _on_result(self, file_path, result):
+        self._done += 1
+        self.log_buffer.set_progress(self._done, len(self.input_files))
+
+    def run(self):
+        try:
+            results = lint_files(self.input_files, on_result=self._on_result)
+        except Exception as e:
+            self.log_buffer.write(f"   Chi tiết: {traceback.format_exc()}")
+            results = {file_path: {'issues': [{'line': None, 'question': None,
+                                               'message': f"Lỗi khi kiểm tra: {e}"}], 'ms': 0.0}
+                       for file_path in self.input_files}
+        self.finished.emit(results)
 
 
 # CURRENT_VERSION = "1.0.0"  # <-- Bạn tự cập nhật mỗi lần release
@@ -145,44 +189,49 @@ def update_local_version(new_version):
         print(f"Lỗi ghi version.json: {e}")
         
 def check_for_update():
-    """Kiểm tra update từ GitHub, trả về (has_update, exe_url, latest_ver)"""
+    """
+    Kiểm tra update từ GitHub, trả về (has_update, exe_url, latest_ver, exe_sha256, delta_url).
+    Thông tin release lấy qua cache của update_check (TTL + ETag), không gọi API mỗi lần mở app.
+    delta_url: bản vá từ đúng phiên bản đang cài (version.json) nếu release có, không thì None.
+    """
     try:
         CURRENT_VERSION = get_current_version()
-        url = f"https://api.github.com/repos/{GITHUB_REPO}/releases/latest"
-        response = requests.get(url, timeout=10)
-        data = response.json()
+        session = get_session()
+        data = fetch_latest_release(GITHUB_REPO, session=session)
+        if data is None:
+            return False, None, None, None, None
         latest_tag = data.get("tag_name", "0.0.0").lstrip("vV")
         assets = data.get("assets", [])
 
         # Tìm file .exe trong assets
-        exe_url = None
+        exe_asset = None
         for asset in assets:
             if asset["name"].endswith(".exe"):
-                exe_url = asset["browser_download_url"]
+                exe_asset = asset
                 break
 
-        if not exe_url:
-            return False, None, latest_tag
+        if not exe_asset:
+            return False, None, latest_tag, None, None
 
         if version.parse(latest_tag) > version.parse(CURRENT_VERSION):
-            return True, exe_url, latest_tag
-        return False, None, latest_tag
+            # SHA-256 công bố kèm release (release cũ không có thì bỏ qua bước kiểm tra)
+            exe_sha256 = find_release_sha256(assets, exe_asset["name"], session)
+            delta_name = delta_asset_name(exe_asset["name"], CURRENT_VERSION)
+            delta_url = next((asset["browser_download_url"] for asset in assets
+                              if asset["name"] == delta_name), None)
+            return True, exe_asset["browser_download_url"], latest_tag, exe_sha256, delta_url
+        return False, None, latest_tag, None, None
     except Exception:
-        return False, None, None
+        return False, None, None, None, None
 
 
-def download_and_update(download_url, latest_version):
+def download_and_update(download_url, latest_version, exe_sha256=None):
     """Tải file exe mới, thay thế, ghi version.json và restart app"""
     try:
-        # Tải file vào temp
+        # Tải file vào temp (tiếp tục từ lần tải dở nếu có, kiểm tra SHA-256)
         temp_dir = tempfile.gettempdir()
         new_exe = os.path.join(temp_dir, "updated_app.exe")
-
-        with requests.get(download_url, stream=True) as r:
-            r.raise_for_status()
-            with open(new_exe, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
+        download_file(download_url, new_exe, exe_sha256)
 
         if not getattr(sys, "frozen", False):
             QMessageBox.warning(None, "Không thể cập nhật",
@@ -222,37 +271,91 @@ start "" "{current_exe}"
         return False
 
 
+class UpdateCheckWorker(QThread):
+    """Kiểm tra cập nhật ở nền; chỉ emit khi thực sự có bản mới"""
+    # (current_ver, latest_ver, exe_url, exe_sha256, delta_url)
+    update_available = pyqtSignal(str, str, str, object, object)
+
+    def run(self):
+        try:
+            current_version = get_current_version()
+            has_update, url, latest_ver, exe_sha256, delta_url = check_for_update()
+            if has_update and url:
+                self.update_available.emit(current_version, latest_ver, url, exe_sha256, delta_url)
+        except Exception as e:
+            print(f"[Lỗi khi kiểm tra cập nhật]: {e}")
+
+
 class DownloadWorker(QThread):
+    """
+    Tải exe mới bằng update_downloader: mất kết nối thì tải tiếp bằng Range,
+    file tải dở (.part) được giữ lại cho lần sau, kiểm tra SHA-256 trước khi báo xong.
+    Có delta_url thì thử tải bản vá (nhỏ) và áp dụng lên exe đang chạy trước;
+    bản vá lỗi / không khớp hash thì quay về tải exe đầy đủ.
+    """
     progress = pyqtSignal(int)
     finished = pyqtSignal(str)  # truyền đường dẫn file tải xong
     error = pyqtSignal(str)
 
-    def __init__(self, url, save_path):
+    def __init__(self, url, save_path, expected_sha256=None, delta_url=None):
         super().__init__()
         self.url = url
         self.save_path = save_path
+        self.expected_sha256 = expected_sha256
+        self.delta_url = delta_url
+        self._cancelled = False
+        self._last_percent = -1
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _on_progress(self, downloaded, total):
+        if total > 0:
+            percent = int(100 * downloaded / total)
+            # Chỉ emit khi phần trăm đổi, không phải mỗi chunk
+            if percent != self._last_percent:
+                self._last_percent = percent
+                self.progress.emit(percent)
+
+    def _try_delta(self):
+        """Tải + áp dụng bản vá lên exe đang chạy; True nếu đã có exe mới đúng hash"""
+        if not self.delta_url or not getattr(sys, "frozen", False):
+            return False
+        delta_path = self.save_path + ".delta"
+        try:
+            download_file(self.delta_url, delta_path, progress=self._on_progress,
+                          cancelled=lambda: self._cancelled)
+            new_sha256 = apply_patch(sys.executable, delta_path, self.save_path)
+            if self.expected_sha256 and new_sha256 != self.expected_sha256.lower():
+                raise ValueError("exe sau khi vá không khớp SHA-256 của release")
+            return True
+        except DownloadCancelled:
+            raise
+        except Exception as e:
+            print(f"[WARN] Không cập nhật được bằng bản vá, tải bản đầy đủ: {e}")
+            self._last_percent = -1
+            return False
+        finally:
+            try:
+                os.remove(delta_path)
+            except OSError:
+                pass
 
     def run(self):
         try:
-            with requests.get(self.url, stream=True, timeout=30) as r:
-                r.raise_for_status()
-                total_size = int(r.headers.get('content-length', 0))
-                downloaded = 0
-                with open(self.save_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded += len(chunk)
-                            if total_size > 0:
-                                perc = int(100 * downloaded / total_size)
-                                self.progress.emit(perc)
-                self.finished.emit(self.save_path)
+            if not self._try_delta():
+                download_file(self.url, self.save_path, self.expected_sha256,
+                              progress=self._on_progress, cancelled=lambda: self._cancelled)
+            self.finished.emit(self.save_path)
+        except DownloadCancelled:
+            pass
         except Exception as e:
             self.error.emit(str(e))
 
 
 class UpdateDialog(QDialog):
-    def __init__(self, current_version, latest_version, download_url, parent=None):
+    def __init__(self, current_version, latest_version, download_url, parent=None, expected_sha256=None,
+                 delta_url=None):
         super().__init__(parent)
         self.setWindowTitle("Cập nhật phần mềm")
 
@@ -267,6 +370,10 @@ class UpdateDialog(QDialog):
 
         self.latest_version = latest_version
 
+        self.expected_sha256 = expected_sha256
+
+        self.delta_url = delta_url
+
         self.temp_exe_path = None
 
         self.worker = None
@@ -378,7 +485,8 @@ class UpdateDialog(QDialog):
         self.update_folder = update_folder
 
         # Bắt đầu tải
-        self.worker = DownloadWorker(self.download_url, self.temp_exe_path)
+        self.worker = DownloadWorker(self.download_url, self.temp_exe_path, self.expected_sha256,
+                                     self.delta_url)
         self.worker.progress.connect(self.update_progress)
         self.worker.finished.connect(self.on_download_finished)
         self.worker.error.connect(self.on_download_error)
@@ -610,7 +718,7 @@ class UpdateDialog(QDialog):
     def closeEvent(self, event):
         # Đảm bảo luồng được dừng (nếu cần)
         if self.worker and self.worker.isRunning():
-            self.worker.quit()
+            self.worker.cancel()
             self.worker.wait()
         super().closeEvent(event)
 
@@ -620,9 +728,37 @@ class MainWindow(QMainWindow):
         self.input_files = []
         self.output_dir = ""
         self.processing_thread = None
+        self.lint_thread = None
+        self.batch_control = None
+        self.worker_pool = None
+        self.update_check_worker = None
         self.detail_results_text = ""
+        self.log_buffer = LogBuffer(new_log_path())
         self.init_ui()
-        # self.check_update_on_start()
+
+        # Đẩy log / tiến trình đang chờ lên giao diện theo lô
+        self.log_timer = QTimer(self)
+        self.log_timer.setInterval(LOG_FLUSH_MS)
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start()
+        if self.log_buffer.log_path:
+            self.log(f"📝 Log đầy đủ: {self.log_buffer.log_path}")
+
+        # Worker pool khởi động khi event loop đã chạy (cửa sổ đã hiện)
+        QTimer.singleShot(WORKER_POOL_DELAY_MS, self.start_worker_pool)
+        QTimer.singleShot(UPDATE_CHECK_DELAY_MS, self.check_update_on_start)
+
+    def start_worker_pool(self):
+        """Khởi động worker pool (một lần cho cả phiên, dùng lại cho mọi batch)"""
+        if self.worker_pool is not None:
+            return
+        try:
+            self.worker_pool = WorkerPool(log_path=self.log_buffer.log_path)
+            self.worker_pool.start()
+            self.log(f"⚙️ Đã khởi động {len(self.worker_pool.workers)} worker xử lý")
+        except Exception as e:
+            self.worker_pool = None
+            self.log(f"❌ Không khởi động được worker: {e}")
 
     # def check_update_on_start(self):
     #     """Kiểm tra cập nhật ngay khi app mở"""
@@ -637,16 +773,20 @@ class MainWindow(QMainWindow):
     #     except Exception as e:
     #         print(f"Lỗi khi kiểm tra cập nhật: {e}")
     def check_update_on_start(self):
-        """Kiểm tra cập nhật ngay khi app mở"""
+        """Kiểm tra cập nhật ở nền khi app mở, không chặn giao diện"""
+        if self.update_check_worker is not None:
+            return
+        self.update_check_worker = UpdateCheckWorker()
+        self.update_check_worker.update_available.connect(self.on_update_available)
+        self.update_check_worker.start()
+
+    def on_update_available(self, current_version, latest_ver, url, exe_sha256, delta_url):
+        """Có bản mới: hiển thị dialog có tiến trình tải"""
         try:
-            current_version = get_current_version()
-            has_update, url, latest_ver = check_for_update()
-            if has_update and url:
-                # Hiển thị dialog có tiến trình tải
-                dialog = UpdateDialog(current_version, latest_ver, url, self)
-                dialog.exec_()  # dialog sẽ tự xử lý tải + cập nhật + thoát nếu cần
-                # ⚠️ Nếu cập nhật thành công, app đã exit rồi → dòng dưới KHÔNG CHẠY
-                # Nếu người dùng bấm "Để sau", exec_() trả về và app tiếp tục bình thường
+            dialog = UpdateDialog(current_version, latest_ver, url, self, exe_sha256, delta_url)
+            dialog.exec_()  # dialog sẽ tự xử lý tải + cập nhật + thoát nếu cần
+            # ⚠️ Nếu cập nhật thành công, app đã exit rồi → dòng dưới KHÔNG CHẠY
+            # Nếu người dùng bấm "Để sau", exec_() trả về và app tiếp tục bình thường
         except Exception as e:
             print(f"[Lỗi khi kiểm tra cập nhật]: {e}")
             # Có thể hiện QMessageBox nếu muốn, nhưng không bắt buộc
@@ -745,6 +885,22 @@ class MainWindow(QMainWindow):
         self.select_output_btn.setStyleSheet(self.get_button_style("#27ae60"))
         self.select_output_btn.clicked.connect(self.select_output_dir)
         output_layout.addWidget(self.select_output_btn)
+
+        # Định dạng đầu ra: .xml, nén gzip / zstd hoặc một file zip cho cả batch
+        format_layout = QHBoxLayout()
+        format_layout.addWidget(QLabel("Định dạng:"))
+        self.output_format_combo = QComboBox()
+        for label, fmt, bundle in OUTPUT_CHOICES:
+            if fmt == 'zst' and not zstd_available():
+                continue
+            self.output_format_combo.addItem(label, (fmt, bundle))
+        self.output_format_combo.currentIndexChanged.connect(self.update_compress_level)
+        format_layout.addWidget(self.output_format_combo, 1)
+        format_layout.addWidget(QLabel("Mức nén:"))
+        self.compress_level_spin = QSpinBox()
+        format_layout.addWidget(self.compress_level_spin)
+        output_layout.addLayout(format_layout)
+        self.update_compress_level()
         
         output_group.setLayout(output_layout)
         left_layout.addWidget(output_group)
@@ -756,6 +912,27 @@ class MainWindow(QMainWindow):
         self.process_btn.setStyleSheet(self.get_button_style("#16a085", 50))
         self.process_btn.clicked.connect(self.start_processing)
         left_layout.addWidget(self.process_btn)
+
+        # Kiểm tra nhanh cấu trúc (không chuyển đổi)
+        self.lint_btn = QPushButton("🔎 Kiểm tra nhanh")
+        self.lint_btn.setStyleSheet(self.get_button_style("#2980b9"))
+        self.lint_btn.clicked.connect(self.start_lint)
+        left_layout.addWidget(self.lint_btn)
+
+        # Tạm dừng / hủy batch đang chạy
+        control_layout = QHBoxLayout()
+        self.pause_btn = QPushButton("⏸ Tạm dừng")
+        self.pause_btn.setStyleSheet(self.get_button_style("#f39c12"))
+        self.pause_btn.clicked.connect(self.toggle_pause)
+        self.pause_btn.setEnabled(False)
+        control_layout.addWidget(self.pause_btn)
+
+        self.cancel_btn = QPushButton("⏹ Hủy")
+        self.cancel_btn.setStyleSheet(self.get_button_style("#c0392b"))
+        self.cancel_btn.clicked.connect(self.cancel_processing)
+        self.cancel_btn.setEnabled(False)
+        control_layout.addWidget(self.cancel_btn)
+        left_layout.addLayout(control_layout)
         
         splitter.addWidget(left_widget)
         
@@ -794,10 +971,11 @@ class MainWindow(QMainWindow):
         log_group.setFont(QFont("Arial", 10, QFont.Bold))
         log_layout = QVBoxLayout()
         
-        self.log_text = QTextEdit()
+        self.log_text = QPlainTextEdit()
         self.log_text.setReadOnly(True)
+        self.log_text.setMaximumBlockCount(LOG_MAX_BLOCKS)
         self.log_text.setStyleSheet("""
-            QTextEdit {
+            QPlainTextEdit {
                 border: 2px solid #95a5a6;
                 border-radius: 5px;
                 background-color: #2c3e50;
@@ -902,11 +1080,21 @@ class MainWindow(QMainWindow):
             self.log(f"📂 Thư mục đầu ra: {dir_path}")
     
     def log(self, message):
-        """Thêm log"""
-        self.log_text.append(message)
-        self.log_text.verticalScrollBar().setValue(
-            self.log_text.verticalScrollBar().maximum()
-        )
+        """Thêm log (hiển thị ở lần flush_log kế tiếp)"""
+        self.log_buffer.write(message)
+
+    def flush_log(self):
+        """Đẩy lô log và tiến trình mới nhất từ log_buffer lên giao diện"""
+        text, skipped, progress = self.log_buffer.drain()
+        if skipped:
+            self.log_text.appendPlainText(f"... (ẩn {skipped} dòng, xem file log)")
+        if text:
+            self.log_text.appendPlainText(text)
+            self.log_text.verticalScrollBar().setValue(
+                self.log_text.verticalScrollBar().maximum()
+            )
+        if progress is not None:
+            self.update_progress(*progress)
     
     def start_processing(self):
         """Bắt đầu xử lý"""
@@ -927,22 +1115,131 @@ class MainWindow(QMainWindow):
         self.log("="*60)
         
         # Start processing thread
-        self.processing_thread = ProcessingThread(self.input_files, self.output_dir)
-        self.processing_thread.progress.connect(self.log)
-        self.processing_thread.file_progress.connect(self.update_progress)
+        self.start_worker_pool()
+        if self.worker_pool is None:
+            self.set_buttons_enabled(True)
+            return
+        self.batch_control = self.worker_pool.control
+        self.batch_control.reset()
+        self.processing_thread = ProcessingThread(self.input_files, self.output_dir, self.log_buffer,
+                                                  self.worker_pool, self.get_output_options())
         # CẬP NHẬT: Nhận thêm file_results
         self.processing_thread.finished.connect(self.processing_finished)
         self.processing_thread.start()
     
-    def update_progress(self, current, total):
-        """Cập nhật progress bar"""
-        progress = int((current / total) * 100)
-        self.progress_bar.setValue(progress)
-        self.progress_label.setText(f"Đang xử lý file {current}/{total}")
+    def start_lint(self):
+        """Kiểm tra nhanh cấu trúc các file đã chọn (header, Câu, Lời giải, đáp án)"""
+        if not self.input_files:
+            QMessageBox.warning(self, "Cảnh báo", "Vui lòng chọn ít nhất 1 file DOCX!")
+            return
+
+        self.set_buttons_enabled(False)
+        self.pause_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(False)
+        self.progress_bar.setValue(0)
+        self.log("\n" + "="*60)
+        self.log("🔎 KIỂM TRA NHANH CẤU TRÚC...")
+        self.log("="*60)
+
+        self.lint_thread = LintThread(list(self.input_files), self.log_buffer)
+        self.lint_thread.finished.connect(self.lint_finished)
+        self.lint_thread.start()
+
+    def lint_finished(self, results):
+        """Kiểm tra nhanh xong: tóm tắt vào log và hiện chi tiết lỗi"""
+        self.flush_log()
+        failed = {file_path: result for file_path, result in results.items() if result['issues']}
+        total_ms = sum(result['ms'] for result in results.values())
+
+        detailed_text = "🔎 KẾT QUẢ KIỂM TRA NHANH\n"
+        detailed_text += "="*50 + "\n"
+        for file_path, result in results.items():
+            name = os.path.basename(file_path)
+            if result['issues']:
+                detailed_text += f"⚠️ {name} ({result['ms']:.0f} ms):\n"
+                for issue in result['issues']:
+                    detailed_text += f"      • {format_issue(issue)}\n"
+            else:
+                detailed_text += f"✅ {name}: Không có lỗi ({result['ms']:.0f} ms)\n"
+        detailed_text += "\n" + "="*50 + "\n"
+        self.detailed_results_text = detailed_text
+
+        summary = f"Đã kiểm tra {len(results)} file trong {total_ms:.0f} ms: " \
+                  f"{len(failed)} file có lỗi cấu trúc."
+        self.log(detailed_text)
+        self.log(summary)
+        self.flush_log()
+
+        self.progress_bar.setValue(100)
+        self.progress_label.setText("Kiểm tra xong!")
+        self.set_buttons_enabled(True)
+
+        if failed:
+            QMessageBox.warning(self, "Kiểm tra nhanh", summary)
+            self.show_detail_results()
+        else:
+            QMessageBox.information(self, "Kiểm tra nhanh", f"✅ {summary}")
+
+    def _compress_kind(self):
+        """Loại nén của lựa chọn hiện tại: 'gz' / 'zst' / 'zip', None nếu ghi .xml thường"""
+        fmt, bundle = self.output_format_combo.currentData()
+        if fmt != 'xml':
+            return fmt
+        return 'zip' if bundle else None
+
+    def update_compress_level(self):
+        """Đổi định dạng: khoảng mức nén theo thuật toán, về mức mặc định"""
+        kind = self._compress_kind()
+        if kind is not None:
+            self.compress_level_spin.setRange(*LEVEL_RANGES[kind])
+            self.compress_level_spin.setValue(DEFAULT_LEVELS[kind])
+        self.compress_level_spin.setEnabled(kind is not None)
+
+    def get_output_options(self):
+        """OutputOptions cho batch, None nếu ghi .xml thường"""
+        fmt, bundle = self.output_format_combo.currentData()
+        if self._compress_kind() is None:
+            return None
+        return OutputOptions(fmt, self.compress_level_spin.value(), bundle)
+
+    def toggle_pause(self):
+        """Tạm dừng / tiếp tục: worker dừng ở câu hỏi hoặc file kế tiếp"""
+        if self.batch_control is None:
+            return
+        if self.batch_control.is_paused:
+            self.batch_control.resume()
+            self.pause_btn.setText("⏸ Tạm dừng")
+            self.log("▶ Tiếp tục xử lý")
+        else:
+            self.batch_control.pause()
+            self.pause_btn.setText("▶ Tiếp tục")
+            self.log("⏸ Đã tạm dừng (dừng ở câu hỏi / file kế tiếp)")
+
+    def cancel_processing(self):
+        """Hủy batch: file đang chạy dừng ở checkpoint kế tiếp, các file còn lại bị bỏ qua"""
+        if self.batch_control is None:
+            return
+        self.batch_control.cancel()
+        self.pause_btn.setText("⏸ Tạm dừng")
+        self.pause_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(False)
+        self.log("⏹ Đang hủy...")
+
+    def update_progress(self, current, total, fraction=None, eta=None):
+        """Cập nhật progress bar (fraction / eta tính theo dung lượng đã xử lý)"""
+        if fraction is None:
+            fraction = current / total if total else 0
+        self.progress_bar.setValue(int(fraction * 100))
+        label = f"Đã xử lý {current}/{total} file"
+        if eta is not None and current < total:
+            label += f" - còn khoảng {format_eta(eta)}"
+        self.progress_label.setText(label)
         self.statusBar().showMessage(f"Tiến trình: {current}/{total} file")
     
     def processing_finished(self, overall_success, overall_message, file_results):
         """Xử lý xong - CẬP NHẬT để nhận file_results và tạo nội dung chi tiết"""
+        # Hiển thị nốt log của thread trước khi in kết quả
+        self.flush_log()
         self.log("\n" + "="*60)
         self.log("KẾT QUẢ TỔNG THỂ:")
         self.log(overall_message)
@@ -957,8 +1254,8 @@ class MainWindow(QMainWindow):
             for file_name, result in file_results.items():
                 if result['status'] == 'success':
                     detailed_text += f"✅ {file_name}.docx: Thành công - Không có lỗi\n"
-                else: # error hoặc critical_error
-                    status_icon = "❌" if result['status'] == 'critical_error' else "⚠️"
+                else: # error, critical_error, timeout hoặc cancelled
+                    status_icon = {'critical_error': "❌", 'timeout': "⏱", 'cancelled': "⏹"}.get(result['status'], "⚠️")
                     detailed_text += f"{status_icon} {file_name}.docx:\n"
                     for err in result['errors']:
                         detailed_text += f"      • {err}\n"
@@ -970,6 +1267,7 @@ class MainWindow(QMainWindow):
 
         # In tóm tắt vào log chính
         self.log(detailed_text)
+        self.flush_log()
 
         self.progress_bar.setValue(100)
         self.progress_label.setText("Hoàn thành!")
@@ -1029,6 +1327,29 @@ class MainWindow(QMainWindow):
         self.clear_files_btn.setEnabled(enabled)
         self.select_output_btn.setEnabled(enabled)
         self.process_btn.setEnabled(enabled)
+        self.lint_btn.setEnabled(enabled)
+        self.output_format_combo.setEnabled(enabled)
+        self.compress_level_spin.setEnabled(enabled and self._compress_kind() is not None)
+        self.pause_btn.setEnabled(not enabled)
+        self.cancel_btn.setEnabled(not enabled)
+        if enabled:
+            self.pause_btn.setText("⏸ Tạm dừng")
+
+    def closeEvent(self, event):
+        """Đóng cửa sổ: hủy batch đang chạy, tắt worker pool, đẩy nốt log và đóng file log"""
+        if self.processing_thread is not None and self.processing_thread.isRunning():
+            self.batch_control.cancel()
+            self.processing_thread.wait()
+        if self.lint_thread is not None and self.lint_thread.isRunning():
+            self.lint_thread.wait()
+        if self.update_check_worker is not None and self.update_check_worker.isRunning():
+            self.update_check_worker.wait()
+        if self.worker_pool is not None:
+            self.worker_pool.shutdown()
+        self.log_timer.stop()
+        self.flush_log()
+        self.log_buffer.close()
+        super().closeEvent(event)
 
 
 def main():
@@ -1040,4 +1361,6 @@ def main():
 
 
 if __name__ == '__main__':
+    # Cần cho worker process khi chạy từ file .exe (PyInstaller)
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,483 @@
+# omml_latex.py
+"""
+Chuyển công thức Word gốc (OMML: m:oMath / m:oMathPara) sang LaTeX.
+
+python-docx chỉ đọc w:r trực tiếp của paragraph nên công thức chèn bằng
+Insert > Equation bị bỏ mất. Ở đây mỗi m:oMath được dịch sang LaTeX (phân số,
+mũ / chỉ số, căn, ngoặc, tổng / tích phân, hàm, dấu mũ, ma trận, hệ phương trình...)
+và bọc thành <span class="math-tex">$...$</span> giống công thức gõ tay $...$.
+
+Cùng một công thức thường lặp lại ở nhiều đáp án / lời giải: kết quả được cache
+theo hash của XML công thức, dùng chung trong process.
+"""
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Tuple
+
+from lxml import etree
+
+
+M_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/math'
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+
+
+def _m(tag):
+    return f'{{{M_NS}}}{tag}'
+
+
+TAG_OMATH = _m('oMath')
+TAG_OMATH_PARA = _m('oMathPara')
+TAG_W_R = f'{{{W_NS}}}r'
+ATTR_VAL = _m('val')
+
+_CACHE_LIMIT = 4096
+_cache: "OrderedDict[str, str]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+# Ký tự Unicode -> lệnh LaTeX
+_SYMBOLS = {
+    'α': r'\alpha', 'β': r'\beta', 'γ': r'\gamma', 'δ': r'\delta', 'ε': r'\varepsilon', 'ϵ': r'\epsilon',
+    'ζ': r'\zeta', 'η': r'\eta', 'θ': r'\theta', 'ϑ': r'\vartheta', 'ι': r'\iota', 'κ': r'\kappa',
+    'λ': r'\lambda', 'μ': r'\mu', 'ν': r'\nu', 'ξ': r'\xi', 'π': r'\pi', 'ϖ': r'\varpi', 'ρ': r'\rho',
+    'σ': r'\sigma', 'ς': r'\varsigma', 'τ': r'\tau', 'υ': r'\upsilon', 'φ': r'\varphi', 'ϕ': r'\phi',
+    'χ': r'\chi', 'ψ': r'\psi', 'ω': r'\omega',
+    'Γ': r'\Gamma', 'Δ': r'\Delta', '∆': r'\Delta', 'Θ': r'\Theta', 'Λ': r'\Lambda', 'Ξ': r'\Xi',
+    'Π': r'\Pi', 'Σ': r'\Sigma', 'Υ': r'\Upsilon', 'Φ': r'\Phi', 'Ψ': r'\Psi', 'Ω': r'\Omega',
+    '≤': r'\le', '≥': r'\ge', '≠': r'\ne', '≈': r'\approx', '≡': r'\equiv', '∼': r'\sim', '≅': r'\cong',
+    '∝': r'\propto', '≪': r'\ll', '≫': r'\gg', '×': r'\times', '÷': r'\div', '±': r'\pm', '∓': r'\mp',
+    '⋅': r'\cdot', '·': r'\cdot', '∘': r'\circ', '∗': '*', '−': '-', '…': r'\ldots', '⋯': r'\cdots',
+    '⋮': r'\vdots', '⋱': r'\ddots', '∞': r'\infty', '∂': r'\partial', '∇': r'\nabla', '√': r'\surd',
+    '→': r'\to', '←': r'\leftarrow', '↔': r'\leftrightarrow', '⇒': r'\Rightarrow', '⇐': r'\Leftarrow',
+    '⇔': r'\Leftrightarrow', '↑': r'\uparrow', '↓': r'\downarrow', '⟶': r'\longrightarrow',
+    '∈': r'\in', '∉': r'\notin', '∋': r'\ni', '⊂': r'\subset', '⊃': r'\supset', '⊆': r'\subseteq',
+    '⊇': r'\supseteq', '∪': r'\cup', '∩': r'\cap', '∅': r'\varnothing', '∀': r'\forall', '∃': r'\exists',
+    '¬': r'\neg', '∧': r'\wedge', '∨': r'\vee', '∠': r'\angle', '∡': r'\measuredangle', '⊥': r'\perp',
+    '∥': r'\parallel', '△': r'\triangle', '°': r'^{\circ}', '′': "'", '″': "''",
+    'ℝ': r'\mathbb{R}', 'ℕ': r'\mathbb{N}', 'ℤ': r'\mathbb{Z}', 'ℚ': r'\mathbb{Q}', 'ℂ': r'\mathbb{C}',
+    'ℓ': r'\ell', 'ℏ': r'\hbar', '∖': r'\setminus', '∣': r'\mid', '⊕': r'\oplus', '⊗': r'\otimes',
+    '{': r'\{', '}': r'\}', '#': r'\#', '_': r'\_', '$': r'\$', '%': r'\%', '&': r'\&',
+    '\\': r'\backslash ',
+    '<': r'\lt', '>': r'\gt', '~': r'\sim', '\xa0': '~', '\u2009': r'\,', '\u2005': r'\:',
+    '\u2003': r'\quad', '\u200b': '',
+}
+
+_NARY = {
+    '∑': r'\sum', '∏': r'\prod', '∐': r'\coprod', '∫': r'\int', '∬': r'\iint', '∭': r'\iiint',
+    '∮': r'\oint', '⋃': r'\bigcup', '⋂': r'\bigcap', '⋁': r'\bigvee', '⋀': r'\bigwedge',
+}
+
+_ACCENTS = {
+    '\u0302': r'\hat', '\u0303': r'\tilde', '\u0304': r'\bar', '\u0305': r'\overline', '¯': r'\overline',
+    '\u0307': r'\dot', '\u0308': r'\ddot', '\u030c': r'\check', '\u0301': r'\acute', '\u0300': r'\grave',
+    '\u0306': r'\breve', '\u20d7': r'\vec', '\u20d6': r'\overleftarrow', '\u20e1': r'\overleftrightarrow',
+    '→': r'\overrightarrow', '←': r'\overleftarrow', '↔': r'\overleftrightarrow',
+}
+
+_DELIMITERS = {
+    '(': '(', ')': ')', '[': '[', ']': ']', '{': r'\{', '}': r'\}', '|': '|', '‖': r'\|',
+    '⟨': r'\langle', '⟩': r'\rangle', '〈': r'\langle', '〉': r'\rangle', '⌊': r'\lfloor',
+    '⌋': r'\rfloor', '⌈': r'\lceil', '⌉': r'\rceil', '': '.',
+}
+
+_FUNCTIONS = {
+    'sin', 'cos', 'tan', 'cot', 'sec', 'csc', 'arcsin', 'arccos', 'arctan', 'sinh', 'cosh', 'tanh',
+    'coth', 'log', 'ln', 'lg', 'exp', 'lim', 'max', 'min', 'sup', 'inf', 'det', 'gcd', 'deg', 'dim',
+    'ker', 'arg',
+}
+
+# Ký tự không đặt nguyên văn được trong \text{}
+_TEXT_SPECIALS = set('{}%&#$_\\')
+
+# Ghép chữ La-tinh / chữ số liền nhau; ký tự Unicode khác (tiếng Việt...) -> \text{}
+_NEEDS_SPACE = re.compile(r'\\[A-Za-z]+$')
+
+
+def has_math(p) -> bool:
+    """Paragraph (CT_P) có công thức OMML trực tiếp không"""
+    return p.find(TAG_OMATH) is not None or p.find(TAG_OMATH_PARA) is not None
+
+
+def math_slots(p) -> List[Tuple[int, str]]:
+    """
+    Các công thức trực tiếp của paragraph (CT_P) theo thứ tự tài liệu:
+    [(số w:r đứng trước, html span math-tex)], để chèn đúng chỗ giữa các run.
+    """
+    if not has_math(p):
+        return []
+    slots = []
+    runs_before = 0
+    for child in p:
+        if child.tag == TAG_W_R:
+            runs_before += 1
+        elif child.tag in (TAG_OMATH, TAG_OMATH_PARA):
+            html = math_html(child)
+            if html:
+                slots.append((runs_before, html))
+    return slots
+
+
+def math_html(element) -> str:
+    """<span class="math-tex">$...$</span> của m:oMath / m:oMathPara ('' nếu công thức rỗng)"""
+    latex = to_latex(element)
+    if not latex:
+        return ''
+    latex = latex.replace('&', '&amp;')
+    return f'<span class="math-tex">${latex}$</span>'
+
+
+def to_latex(element) -> str:
+    """LaTeX của m:oMath / m:oMathPara, cache theo hash XML"""
+    key = hashlib.sha1(etree.tostring(element)).hexdigest()
+    with _cache_lock:
+        latex = _cache.get(key)
+        if latex is not None:
+            _cache.move_to_end(key)
+            return latex
+
+    if element.tag == TAG_OMATH_PARA:
+        latex = r' \\ '.join(filter(None, (_tidy(_children(m)) for m in element.iter(TAG_OMATH))))
+    else:
+        latex = _tidy(_children(element))
+
+    with _cache_lock:
+        _cache[key] = latex
+        if len(_cache) > _CACHE_LIMIT:
+            _cache.popitem(last=False)
+    return latex
+
+
+def _tidy(latex):
+    return re.sub(r'\s+', ' ', latex).strip()
+
+
+def _local(element):
+    tag = element.tag
+    if not isinstance(tag, str):
+        return ''
+    return tag.rsplit('}', 1)[-1] if tag.startswith(f'{{{M_NS}}}') else ''
+
+
+def _prop(element, pr_tag, name, default=None):
+    """Giá trị m:val của <m:{pr_tag}><m:{name} m:val=.../></m:{pr_tag}>"""
+    pr = element.find(_m(pr_tag))
+    if pr is None:
+        return default
+    node = pr.find(_m(name))
+    if node is None:
+        return default
+    value = node.get(ATTR_VAL)
+    # Thuộc tính bật/tắt không có m:val nghĩa là bật
+    return value if value is not None else 'on'
+
+
+def _join(parts):
+    out = ''
+    for part in parts:
+        if not part:
+            continue
+        if out and _NEEDS_SPACE.search(out) and part[0].isalpha():
+            out += ' '
+        out += part
+    return out
+
+
+def _children(element):
+    return _join(_convert(child) for child in element)
+
+
+def _arg(element, name):
+    node = element.find(_m(name))
+    return _children(node) if node is not None else ''
+
+
+def _group(latex):
+    return f'{{{latex}}}'
+
+
+def _convert(element) -> str:
+    name = _local(element)
+    if not name or name.endswith('Pr'):
+        return ''
+    handler = _HANDLERS.get(name)
+    if handler is not None:
+        return handler(element)
+    # e, num, den, sub, sup, deg, lim, fName, oMath... -> nội dung con
+    return _children(element)
+
+
+def _plain_text(text):
+    """Chữ thường (m:nor) -> \\text{}; ký tự đặc biệt của LaTeX ({ } % & ...) đặt ngoài \\text{} ở dạng escape"""
+    parts = []
+    pending = ''
+    for ch in text:
+        if ch in _TEXT_SPECIALS:
+            if pending:
+                parts.append(rf'\text{{{pending}}}')
+                pending = ''
+            parts.append(_SYMBOLS[ch])
+        else:
+            pending += ch
+    if pending:
+        parts.append(rf'\text{{{pending}}}')
+    return _join(parts)
+
+
+def _text(text, plain=False, align=False):
+    """
+    Chuỗi m:t -> LaTeX; plain (m:nor / kiểu chữ thường dài) -> \\text{}.
+    align: chuỗi nằm trong m:eqArr, '&' là điểm căn lề của Word nên giữ nguyên.
+    """
+    if plain:
+        return _plain_text(text) if text.strip() else ''
+    if text in _FUNCTIONS:
+        return rf'\{text}'
+    parts = []
+    pending = ''
+    for ch in text:
+        if ch in _SYMBOLS and not (align and ch == '&'):
+            if pending:
+                parts.append(rf'\text{{{pending}}}')
+                pending = ''
+            parts.append(_SYMBOLS[ch])
+        elif ord(ch) < 128:
+            if pending:
+                parts.append(rf'\text{{{pending}}}')
+                pending = ''
+            parts.append(ch)
+        else:
+            pending += ch
+    if pending:
+        parts.append(rf'\text{{{pending}}}')
+    return _join(parts)
+
+
+def _run(element):
+    text = ''.join(t.text or '' for t in element.iter(_m('t')))
+    if not text:
+        return ''
+    rpr = element.find(_m('rPr'))
+    plain = rpr is not None and rpr.find(_m('nor')) is not None
+    if not plain and rpr is not None:
+        style = rpr.find(_m('sty'))
+        # Chữ đứng (sty=p) nhiều ký tự không phải tên hàm: từ ngữ, đơn vị...
+        if style is not None and style.get(ATTR_VAL) == 'p' and len(text) > 1 \
+                and text.isalpha() and text not in _FUNCTIONS:
+            return rf'\mathrm{{{text}}}'
+    align = '&' in text and any(a.tag == _m('eqArr') for a in element.iterancestors())
+    return _text(text, plain, align)
+
+
+def _fraction(element):
+    kind = _prop(element, 'fPr', 'type', 'bar')
+    num, den = _arg(element, 'num'), _arg(element, 'den')
+    if kind == 'lin':
+        return f'{num}/{den}'
+    if kind == 'noBar':
+        return rf'\genfrac{{}}{{}}{{0pt}}{{}}{_group(num)}{_group(den)}'
+    return rf'\frac{_group(num)}{_group(den)}'
+
+
+def _base(element):
+    base = _arg(element, 'e')
+    return base if len(base) == 1 or (base.startswith('\\') and base[1:].isalpha()) else _group(base)
+
+
+def _sup(element):
+    return f"{_base(element)}^{_group(_arg(element, 'sup'))}"
+
+
+def _sub(element):
+    return f"{_base(element)}_{_group(_arg(element, 'sub'))}"
+
+
+def _subsup(element):
+    return f"{_base(element)}_{_group(_arg(element, 'sub'))}^{_group(_arg(element, 'sup'))}"
+
+
+def _pre(element):
+    return f"{{}}_{_group(_arg(element, 'sub'))}^{_group(_arg(element, 'sup'))}{_arg(element, 'e')}"
+
+
+def _radical(element):
+    degree = _arg(element, 'deg')
+    hidden = _prop(element, 'radPr', 'degHide') in ('on', '1', 'true')
+    if degree and not hidden:
+        return rf"\sqrt[{degree}]{_group(_arg(element, 'e'))}"
+    return rf"\sqrt{_group(_arg(element, 'e'))}"
+
+
+def _delimiter(element):
+    begin = _prop(element, 'dPr', 'begChr', '(')
+    end = _prop(element, 'dPr', 'endChr', ')')
+    separator = _prop(element, 'dPr', 'sepChr', '|')
+    begin = _DELIMITERS.get(begin if begin != 'on' else '', begin)
+    end = _DELIMITERS.get(end if end != 'on' else '', end)
+    separator = r' \mid ' if separator == '|' else _SYMBOLS.get(separator, separator)
+    items = [_children(e) for e in element.iterchildren(_m('e'))]
+    return rf'\left{begin} {separator.join(items)} \right{end}'
+
+
+def _nary(element):
+    char = _prop(element, 'naryPr', 'chr', '∫')
+    operator = _NARY.get(char, _SYMBOLS.get(char, char))
+    sub = '' if _prop(element, 'naryPr', 'subHide') in ('on', '1', 'true') else _arg(element, 'sub')
+    sup = '' if _prop(element, 'naryPr', 'supHide') in ('on', '1', 'true') else _arg(element, 'sup')
+    if _prop(element, 'naryPr', 'limLoc') == 'undOvr' and operator.endswith('int'):
+        operator += r'\limits'
+    out = operator
+    if sub:
+        out += f'_{_group(sub)}'
+    if sup:
+        out += f'^{_group(sup)}'
+    return _join([out, ' ', _arg(element, 'e')])
+
+
+def _function(element):
+    name = _arg(element, 'fName')
+    return _join([name, ' ', _arg(element, 'e')])
+
+
+def _accent(element):
+    char = _prop(element, 'accPr', 'chr', '\u0302')
+    command = _ACCENTS.get(char, r'\hat')
+    return f"{command}{_group(_arg(element, 'e'))}"
+
+
+def _bar(element):
+    position = _prop(element, 'barPr', 'pos', 'bot')
+    command = r'\overline' if position == 'top' else r'\underline'
+    return f"{command}{_group(_arg(element, 'e'))}"
+
+
+def _group_char(element):
+    char = _prop(element, 'groupChrPr', 'chr', '⏟')
+    position = _prop(element, 'groupChrPr', 'pos', 'bot')
+    body = _group(_arg(element, 'e'))
+    if char in ('⏞', '⏟'):
+        return (r'\overbrace' if char == '⏞' else r'\underbrace') + body
+    arrow = {'→': r'\xrightarrow', '←': r'\xleftarrow', '⇒': r'\xRightarrow'}.get(char)
+    if arrow:
+        return arrow + body
+    return (r'\overset' if position == 'top' else r'\underset') + _group(_SYMBOLS.get(char, char)) + body
+
+
+def _lim_low(element):
+    base = _arg(element, 'e')
+    limit = _group(_arg(element, 'lim'))
+    if base.startswith('\\') and base[1:] in _FUNCTIONS:
+        return f'{base}_{limit}'
+    return rf'\underset{limit}{_group(base)}'
+
+
+def _lim_upp(element):
+    return rf"\overset{_group(_arg(element, 'lim'))}{_group(_arg(element, 'e'))}"
+
+
+def _equation_array(element):
+    rows = [_children(e) for e in element.iterchildren(_m('e'))]
+    if not any('&' in row for row in rows):
+        return r'\begin{array}{l}' + r' \\ '.join(rows) + r'\end{array}'
+    return r'\begin{aligned}' + r' \\ '.join(rows) + r'\end{aligned}'
+
+
+def _matrix(element):
+    rows = []
+    for row in element.iterchildren(_m('mr')):
+        rows.append(' & '.join(_children(e) for e in row.iterchildren(_m('e'))))
+    return r'\begin{matrix}' + r' \\ '.join(rows) + r'\end{matrix}'
+
+
+def _border_box(element):
+    return rf"\boxed{_group(_arg(element, 'e'))}"
+
+
+def _phantom(element):
+    if _prop(element, 'phantPr', 'show') in ('0', 'off', 'false'):
+        return rf"\phantom{_group(_arg(element, 'e'))}"
+    return _arg(element, 'e')
+
+
+_HANDLERS = {
+    'r': _run,
+    'f': _fraction,
+    'sSup': _sup,
+    'sSub': _sub,
+    'sSubSup': _subsup,
+    'sPre': _pre,
+    'rad': _radical,
+    'd': _delimiter,
+    'nary': _nary,
+    'func': _function,
+    'acc': _accent,
+    'bar': _bar,
+    'groupChr': _group_char,
+    'limLow': _lim_low,
+    'limUpp': _lim_upp,
+    'eqArr': _equation_array,
+    'm': _matrix,
+    'borderBox': _border_box,
+    'phant': _phantom,
+}
+
+
+# $...$ gõ tay; các span math-tex đã có (công thức OMML) được giữ nguyên
+_DOLLAR_MATH = re.compile(r'(<span class="math-tex">.*?</span>)|\$[^$]*\$', re.DOTALL)
+
+
+def wrap_dollar_math(html: str, lead: str = '') -> str:
+    """Bọc $...$ thành <span class="math-tex">$...$</span> (lead: chuỗi chèn trước span)"""
+    return _DOLLAR_MATH.sub(lambda m: m.group(1) or f'{lead}<span class="math-tex">{m.group()}</span>', html)
+
+
+def _selftest():
+    """Chuyển tài liệu có công thức OMML chứa % (TOAN, HL, TINHOC, chế độ stream): % chỉ escape một lần"""
+    import contextlib
+    import io
+    import os
+    import tempfile
+
+    from docx import Document
+    from docx_processor import DocxProcessor
+
+    omath = (f'<m:oMath xmlns:m="{M_NS}"><m:r><m:t>50%</m:t></m:r>'
+             f'<m:r><m:rPr><m:nor/></m:rPr><m:t>giảm 5%</m:t></m:r></m:oMath>')
+
+    def add_math(paragraph):
+        paragraph._p.append(etree.fromstring(omath))
+
+    work_dir = tempfile.mkdtemp(prefix='omml_latex_')
+    # Số công thức: học liệu (chỉ TOAN) + câu hỏi + lời giải
+    for subject, expected in (('TOANTHPT', 3), ('TINHOCTHPT', 2)):
+        doc = Document()
+        doc.add_paragraph(f'[{subject}_1, 1, NB]')
+        if subject == 'TOANTHPT':
+            add_math(doc.add_paragraph('HL: Học liệu '))
+        add_math(doc.add_paragraph('Câu 1: Tỉ lệ '))
+        for text in ('A. 1', 'B. 2', 'C. 3', 'D. 4', 'Lời giải', 'A', '###'):
+            doc.add_paragraph(text)
+        add_math(doc.add_paragraph('Giải thích: '))
+        path = os.path.join(work_dir, f'{subject}.docx')
+        doc.save(path)
+
+        processor = DocxProcessor()
+        with contextlib.redirect_stdout(io.StringIO()):
+            xml_content, _ = processor.process_docx(path)
+            processor.index_question = 0
+            processor.process_docx_stream(path, path + '.xml')
+        with open(path + '.xml', 'r', encoding='utf-8') as f:
+            streamed = f.read()
+        for mode, output in (('process_docx', xml_content), ('stream', streamed)):
+            assert output.count(r'50\%') == expected and r'\text{giảm 5}\%' in output, f"{subject} ({mode}): thiếu \\%"
+            assert r'\\%' not in output, f"{subject} ({mode}): % bị escape hai lần"
+        print(f"{subject}: OK")
+
+
+if __name__ == '__main__':
+    import sys
+    if sys.argv[1:] == ['--selftest']:
+        _selftest()
+    else:
+        print("python omml_latex.py --selftest")
@@ -0,0 +1,247 @@
+# output_writer.py
+"""
+Ghi file đầu ra dạng nén (.xml.gz / .xml.zst) hoặc gom cả batch vào một file zip.
+
+XML đầu ra chứa ảnh base64 nên thường 20-100 MB mỗi file. Với OutputOptions:
+- format 'gz' / 'zst': XML được nén dần trong lúc ghi; phần nén chạy trên thread
+  riêng (zlib / zstd nhả GIL) nhận dữ liệu qua hàng đợi có giới hạn, nên chồng
+  lên thời gian chuyển đổi mà RAM không tăng theo kích thước file;
+- bundle: mỗi file xong là được đưa ngay vào một file zip chung của batch (nén
+  trên thread riêng trong lúc các file khác còn đang chuyển đổi) rồi xóa bản lẻ;
+  cuối batch ghi thêm manifest.json (trạng thái, lỗi, kích thước, sha256 từng file);
+- level: mức nén, đổi CPU lấy dung lượng (gzip / zip 0-9, zstd 1-22).
+zstd cần thư viện `zstandard`; không có thì dùng gzip.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+import zipfile
+from typing import Optional
+
+
+FORMATS = {'xml': '.xml', 'gz': '.xml.gz', 'zst': '.xml.zst'}
+
+DEFAULT_LEVELS = {'gz': 6, 'zst': 3, 'zip': 6}
+LEVEL_RANGES = {'gz': (0, 9), 'zst': (1, 22), 'zip': (0, 9)}
+
+# Kích thước một khối gửi sang thread nén và số khối tối đa đang chờ
+CHUNK_SIZE = 1024 * 1024
+QUEUE_CHUNKS = 8
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def zstd_available() -> bool:
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class OutputOptions:
+    """Định dạng file đầu ra (picklable, để truyền sang worker process)"""
+
+    __slots__ = ('format', 'level', 'bundle')
+
+    def __init__(self, format='xml', level=None, bundle=False):
+        format = format.lower().lstrip('.').replace('gzip', 'gz').replace('zstd', 'zst')
+        if format not in FORMATS:
+            raise ValueError(f"Định dạng đầu ra không hỗ trợ: {format}")
+        if format == 'zst' and not zstd_available():
+            print("[WARN] Chưa cài zstandard, dùng gzip")
+            format = 'gz'
+        kind = 'zip' if format == 'xml' else format
+        if level is not None:
+            low, high = LEVEL_RANGES[kind]
+            if not low <= level <= high:
+                raise ValueError(f"Mức nén {kind} phải trong khoảng {low}-{high}")
+        self.format = format
+        self.level = level
+        self.bundle = bundle
+
+    @property
+    def suffix(self) -> str:
+        return FORMATS[self.format]
+
+    def level_for(self, kind) -> int:
+        return self.level if self.level is not None else DEFAULT_LEVELS[kind]
+
+
+def add_arguments(parser, bundle=True):
+    """Tùy chọn dòng lệnh cho các entrypoint ghi file (watch_folder)"""
+    parser.add_argument('--output-format', choices=sorted(FORMATS), default='xml',
+                        help="Định dạng file đầu ra: xml, gz (.xml.gz) hoặc zst (.xml.zst)")
+    parser.add_argument('--compress-level', type=int, default=None,
+                        help="Mức nén (gzip / zip 0-9, zstd 1-22)")
+    if bundle:
+        parser.add_argument('--bundle', action='store_true', help="Gom cả batch vào một file zip kèm manifest")
+
+
+def output_options_from_args(args) -> Optional[OutputOptions]:
+    """OutputOptions tương ứng với add_arguments(), None nếu giữ .xml thường"""
+    bundle = getattr(args, 'bundle', False)
+    if args.output_format == 'xml' and not bundle:
+        return None
+    return OutputOptions(args.output_format, args.compress_level, bundle)
+
+
+class CompressedWriter:
+    """File text ghi ra dạng nén (gzip / zstd); nén chạy trên thread riêng"""
+
+    def __init__(self, path, format, level):
+        self._raw = open(path, 'wb')
+        try:
+            if format == 'gz':
+                # mtime=0: cùng nội dung thì cùng file nén; tên gốc trong header không gồm đuôi .part
+                name = path[:-len('.part')] if path.endswith('.part') else path
+                self._compressor = gzip.GzipFile(filename=name, mode='wb', fileobj=self._raw,
+                                                 compresslevel=level, mtime=0)
+            else:
+                import zstandard
+                self._compressor = zstandard.ZstdCompressor(level=level, write_checksum=True).stream_writer(
+                    self._raw, closefd=False)
+        except Exception:
+            self._raw.close()
+            raise
+        self._queue = queue.Queue(QUEUE_CHUNKS)
+        self._buffer = []
+        self._buffered = 0
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='output-compressor', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            data = self._queue.get()
+            if data is None:
+                break
+            if self._error is None:
+                try:
+                    self._compressor.write(data)
+                except Exception as e:
+                    self._error = e
+        try:
+            self._compressor.close()
+        except Exception as e:
+            self._error = self._error or e
+        finally:
+            self._raw.close()
+
+    def _put(self, data):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(data)
+
+    def write(self, text):
+        # Chuỗi lớn (cả tài liệu) được cắt khối để thread nén bắt đầu ngay
+        for start in range(0, len(text), CHUNK_SIZE):
+            data = text[start:start + CHUNK_SIZE].encode('utf-8')
+            self._buffer.append(data)
+            self._buffered += len(data)
+            if self._buffered >= CHUNK_SIZE:
+                self._put(b''.join(self._buffer))
+                self._buffer = []
+                self._buffered = 0
+        return len(text)
+
+    def close(self):
+        if self._thread is None:
+            return
+        try:
+            if self._buffer and self._error is None:
+                self._queue.put(b''.join(self._buffer))
+            self._buffer = []
+        finally:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def open_output(path, options: Optional[OutputOptions] = None):
+    """Mở file đầu ra để ghi text, nén theo options.format (None = .xml thường)"""
+    if options is None or options.format == 'xml':
+        return open(path, 'w', encoding='utf-8')
+    return CompressedWriter(path, options.format, options.level_for(options.format))
+
+
+def open_binary(path):
+    """Đọc lại file đầu ra dạng bytes XML (giải nén theo đuôi file)"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.zst'):
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+
+class BundleWriter:
+    """
+    Gom các file đầu ra của một batch vào một file zip.
+    add() chỉ xếp hàng; thread riêng nén file vào zip rồi xóa bản lẻ.
+    close() ghi manifest.json và đổi tên .part thành file zip cuối cùng.
+    """
+
+    def __init__(self, path, level=DEFAULT_LEVELS['zip'], compress=True):
+        self.path = path
+        self._part = path + '.part'
+        self._zip = zipfile.ZipFile(self._part, 'w', zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED,
+                                    compresslevel=level if compress else None)
+        self._queue = queue.Queue()
+        self._added = {}  # arcname -> {'size', 'sha256'} | {'error'}
+        self._thread = threading.Thread(target=self._run, name='output-bundle', daemon=True)
+        self._thread.start()
+
+    def add(self, file_path, arcname):
+        self._queue.put((file_path, arcname))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            file_path, arcname = item
+            try:
+                digest = hashlib.sha256()
+                size = 0
+                with open(file_path, 'rb') as src, self._zip.open(arcname, 'w', force_zip64=True) as dst:
+                    for data in iter(lambda: src.read(CHUNK_SIZE), b''):
+                        digest.update(data)
+                        size += len(data)
+                        dst.write(data)
+                self._added[arcname] = {'size': size, 'sha256': digest.hexdigest()}
+                os.remove(file_path)
+            except Exception as e:
+                print(f"[ERROR] Không đưa được {file_path} vào file zip: {e}")
+                self._added[arcname] = {'error': str(e)}
+
+    def close(self, entries) -> str:
+        """
+        Chờ nén xong, ghi manifest rồi đóng zip.
+        entries: [{'source', 'output' (arcname | None), 'status', 'errors'}] theo thứ tự input.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        files = []
+        for entry in entries:
+            entry = dict(entry)
+            entry.update(self._added.get(entry.get('output'), {}))
+            files.append(entry)
+        manifest = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'files': files}
+        self._zip.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=2))
+        self._zip.close()
+        os.replace(self._part, self.path)
+        return self.path
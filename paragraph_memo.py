@@ -0,0 +1,154 @@
+# paragraph_memo.py
+"""
+Memo thông tin paragraph cho một tài liệu.
+
+Cùng một paragraph bị tính .text nhiều lần qua các bước (process_docx,
+format_questions, protocol_of_q, dang_tn / dang_ds, hdg_tn...), mỗi lần lại nối
+text của mọi run qua python-docx. ParagraphMemo giữ kết quả theo phần tử CT_P:
+text, bản strip / lowercase, hyperlink và cờ phân loại (text_flags), mỗi
+thứ chỉ tính một lần khi cần tới.
+"""
+
+import re
+
+from docx.oxml.ns import qn
+
+
+TAG_P = qn('w:p')
+TAG_R = qn('w:r')
+TAG_HYPERLINK = qn('w:hyperlink')
+ATTR_R_ID = qn('r:id')
+RT_HYPERLINK = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/hyperlink'
+
+# ===== Cờ phân loại paragraph =====
+IS_EMPTY = 1            # không có run nào
+IS_HEADER = 2           # [tag, posttype, level]
+IS_HL = 4               # HL: ...
+IS_QUESTION = 8         # Câu 1 (máy trạng thái trong process_docx)
+IS_QUESTION_SPLIT = 16  # câu 1 (tách câu trong format_questions)
+IS_SOLUTION = 32        # Lời giải
+IS_ANSWER_CHOICE = 64   # A. B. C. D. (trắc nghiệm)
+IS_STATEMENT = 128      # a) b) c) d) (đúng/sai)
+IS_SHARPENED = 256      # ### (tách phần lời giải)
+IS_AUDIO = 512          # Audio: ... / link mathplay
+
+_RE_HEADER = re.compile(r'^\[.*\]$')
+_RE_QUESTION = re.compile(r'^C[âa]u\s*\d', re.IGNORECASE)
+_RE_QUESTION_SPLIT = re.compile(r'^c[ââ]u.\d')
+_RE_SOLUTION = re.compile(r'^\s*l[ờơ]i\s+gi[ảẩ]i\s*[:：]?', re.IGNORECASE)
+_RE_ANSWER_CHOICE = re.compile(r'^[A-Z]\.')
+_RE_STATEMENT = re.compile(r'^[a-z]\s*[\.\)]', re.IGNORECASE)
+
+
+def text_flags(text: str, has_runs=True) -> int:
+    """Cờ phân loại của paragraph từ text đã strip, cùng các regex mà pipeline dùng"""
+    flags = 0 if has_runs else IS_EMPTY
+    if not text:
+        return flags
+    if _RE_HEADER.match(text):
+        flags |= IS_HEADER
+    if text.startswith('HL:'):
+        flags |= IS_HL
+    if _RE_QUESTION.match(text):
+        flags |= IS_QUESTION
+    lower = text.lower()
+    if _RE_QUESTION_SPLIT.match(lower):
+        flags |= IS_QUESTION_SPLIT
+    if _RE_SOLUTION.match(lower):
+        flags |= IS_SOLUTION
+    if _RE_ANSWER_CHOICE.match(text):
+        flags |= IS_ANSWER_CHOICE
+    if _RE_STATEMENT.match(text):
+        flags |= IS_STATEMENT
+    if text.startswith('###'):
+        flags |= IS_SHARPENED
+    if text.startswith('Audio:') or text.startswith('https://mathplay.onluyen.vn'):
+        flags |= IS_AUDIO
+    return flags
+
+
+class ParagraphInfo:
+    """Thông tin đã tính của một paragraph"""
+
+    __slots__ = ('text', 'stripped', '_lower', '_flags', '_hyperlinks', '_run_hyperlinks')
+
+    def __init__(self, p):
+        self.text = p.text
+        self.stripped = self.text.strip()
+        self._lower = None
+        self._flags = None
+        self._hyperlinks = None
+        self._run_hyperlinks = None
+
+
+class ParagraphMemo:
+    """Cache ParagraphInfo theo phần tử CT_P, dùng chung cho mọi bước xử lý một tài liệu"""
+
+    def __init__(self):
+        self._infos = {}
+
+    def clear(self):
+        self._infos.clear()
+
+    def discard(self, element):
+        """Bỏ cache của các paragraph dưới `element` (khi phần tử đã được giải phóng)"""
+        if not self._infos:
+            return
+        for p in element.iter(TAG_P):
+            self._infos.pop(p, None)
+
+    def get(self, paragraph) -> ParagraphInfo:
+        p = paragraph._p
+        info = self._infos.get(p)
+        if info is None:
+            info = self._infos[p] = ParagraphInfo(p)
+        return info
+
+    def text(self, paragraph) -> str:
+        return self.get(paragraph).text
+
+    def stripped(self, paragraph) -> str:
+        return self.get(paragraph).stripped
+
+    def lower(self, paragraph) -> str:
+        """text.strip().lower()"""
+        info = self.get(paragraph)
+        if info._lower is None:
+            info._lower = info.stripped.lower()
+        return info._lower
+
+    def flags(self, paragraph) -> int:
+        info = self.get(paragraph)
+        if info._flags is None:
+            info._flags = text_flags(info.stripped, len(paragraph._p.r_lst) > 0)
+        return info._flags
+
+    def hyperlinks(self, paragraph) -> list:
+        """URL của các w:hyperlink con trực tiếp của paragraph"""
+        info = self.get(paragraph)
+        if info._hyperlinks is None:
+            rels = paragraph.part.rels
+            links = []
+            for hyperlink in paragraph._p.iterchildren(TAG_HYPERLINK):
+                rId = hyperlink.get(ATTR_R_ID)
+                if rId:
+                    links.append(rels[rId].target_ref)
+            info._hyperlinks = links
+        return info._hyperlinks
+
+    def run_hyperlinks(self, paragraph) -> list:
+        """URL http(s) của các w:hyperlink nằm bên trong run (field lồng trong w:r)"""
+        info = self.get(paragraph)
+        if info._run_hyperlinks is None:
+            rels = paragraph.part.rels
+            links = []
+            for r in paragraph._p.iterchildren(TAG_R):
+                for hyperlink in r.iter(TAG_HYPERLINK):
+                    rId = hyperlink.get(ATTR_R_ID)
+                    if not rId or rId not in rels:
+                        continue
+                    rel = rels[rId]
+                    if rel.reltype == RT_HYPERLINK and rel.target_ref and rel.target_ref.startswith('http'):
+                        links.append(rel.target_ref)
+            info._run_hyperlinks = links
+        return info._run_hyperlinks
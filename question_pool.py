@@ -0,0 +1,157 @@
+# question_pool.py
+"""
+Render song song các câu hỏi của MỘT tài liệu lớn.
+
+Process chính tách câu hỏi như bình thường, sau đó gửi XML gốc (w:p / w:tbl)
+của từng câu cùng các quan hệ mà câu đó tham chiếu (ảnh, hyperlink) sang worker.
+Worker dựng lại một document "vỏ" chỉ chứa các phần tử đó, render bằng
+DocxProcessor.render_question và trả về phần tử <question> đã dựng xong (dạng bytes).
+"""
+
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+from lxml import etree
+
+import xml_builder
+
+
+NS_R = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+# Số job tối thiểu trên mỗi worker, để phân tải đều khi câu hỏi dài ngắn khác nhau
+JOBS_PER_WORKER = 4
+MAX_QUESTIONS_PER_JOB = 32
+
+_worker_processor = None
+
+
+def create_pool(workers, processor_kwargs=None):
+    """processor_kwargs: tham số tạo DocxProcessor trong worker (vd. image_options)"""
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                               initargs=(processor_kwargs or {},))
+
+
+def render_questions(pool, doc, group, group_of_q, workers):
+    """Render `group_of_q` trên `pool`, trả về list (question_xml | None, errors) theo thứ tự"""
+    meta = {
+        'subject': group['subject'],
+        'posttype': group['posttype'],
+        'knowledgelevel': group['knowledgelevel'],
+        'level': group['level'],
+    }
+
+    chunk = max(1, min(MAX_QUESTIONS_PER_JOB, math.ceil(len(group_of_q) / (workers * JOBS_PER_WORKER))))
+    jobs = []
+    for start in range(0, len(group_of_q), chunk):
+        jobs.append(pack_job(doc, meta, group_of_q[start:start + chunk], start))
+
+    results = []
+    for job_result in pool.map(_render_job, jobs):
+        for data, errors in job_result:
+            results.append((xml_builder.loads(data) if data is not None else None, errors))
+    return results
+
+
+def pack_job(doc, meta, questions, start_idx):
+    """Đóng gói một nhóm câu hỏi liên tiếp: XML gốc + quan hệ được tham chiếu"""
+    rels = doc.part.rels
+    packed_questions = []
+    packed_rels = {}
+
+    for offset, question_dict in enumerate(questions):
+        items = []
+        for item in question_dict['items']:
+            element = item._element
+            items.append(etree.tostring(element))
+
+            for node in element.iter():
+                for attr, rId in node.attrib.items():
+                    if not attr.startswith(f'{{{NS_R}}}') or rId in packed_rels or rId not in rels:
+                        continue
+                    rel = rels[rId]
+                    if rel.is_external:
+                        packed_rels[rId] = (rel.reltype, True, rel.target_ref, None, None)
+                    else:
+                        target = rel.target_part
+                        packed_rels[rId] = (rel.reltype, False, str(target.partname),
+                                            target.content_type, target.blob)
+
+        packed_questions.append({
+            'idx': start_idx + offset,
+            'question_tag': question_dict['question_tag'],
+            'items': items,
+        })
+
+    return {'group': meta, 'questions': packed_questions, 'rels': packed_rels}
+
+
+# ============================================
+# Phía worker
+# ============================================
+
+def _init_worker(processor_kwargs):
+    global _worker_processor
+    from docx_processor import DocxProcessor
+    _worker_processor = DocxProcessor(**processor_kwargs)
+
+
+def _shell_document(rels):
+    """Document rỗng có sẵn các quan hệ (rId giữ nguyên như tài liệu gốc)"""
+    from docx import Document
+    from docx.opc.packuri import PackURI
+    from docx.opc.part import Part
+
+    doc = Document()
+    body = doc.element.body
+    for child in list(body):
+        if not child.tag.endswith('}sectPr'):
+            body.remove(child)
+
+    doc_rels = doc.part.rels
+    for rId, (reltype, is_external, target, content_type, blob) in rels.items():
+        doc_rels.pop(rId, None)
+        doc_rels.related_parts.pop(rId, None)
+        if is_external:
+            doc_rels.add_relationship(reltype, target, rId, is_external=True)
+        else:
+            part = Part(PackURI(target), content_type, blob, doc.part.package)
+            doc_rels.add_relationship(reltype, part, rId)
+    return doc
+
+
+def _render_job(job):
+    from docx.oxml.parser import parse_xml
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+    from image_manifest import get_manifest
+
+    doc = _shell_document(job['rels'])
+    body = doc.element.body
+
+    questions = []
+    for packed in job['questions']:
+        items = []
+        for xml in packed['items']:
+            element = parse_xml(xml)
+            body.append(element)
+            if element.tag.endswith('}tbl'):
+                items.append(Table(element, doc))
+            else:
+                items.append(Paragraph(element, doc))
+        questions.append((packed, items))
+
+    processor = _worker_processor
+    processor.doc = doc
+    processor.tinhoc_processor.doc = doc
+    processor.images = get_manifest(doc.part)
+    processor.memo.clear()
+
+    results = []
+    for packed, items in questions:
+        errors = []
+        question_dict = {'items': items, 'question_tag': packed['question_tag']}
+        each_question_xml = processor.render_question(job['group'], question_dict, packed['idx'], errors)
+        # Cây lxml không pickle được, gửi về dạng bytes (giữ nguyên đánh dấu HTML)
+        data = xml_builder.dumps(each_question_xml) if each_question_xml is not None else None
+        results.append((data, errors))
+    return results
@@ -1,31 +1,39 @@
 import re
 import base64
 from typing import List, Dict, Any, Tuple, Optional
-from xml.etree import ElementTree as ET
+from xml_builder import Element, SubElement, set_html
 from document_element import (
     get_blob, get_bytes, get_width, get_height, get_element_type, 
     get_text, get_num_children, get_child, get_attributes, 
-    get_text_attribute_indices, get_num_rows, get_row, get_num_cells, get_cell
+    get_text_attribute_indices, get_table_grid, get_math_html
 )
+from image_manifest import get_manifest
+import vector_image
+import omml_latex
 from docx import Document
 from docx.text.paragraph import Paragraph
 from docx.text.run import Run
+from docx.oxml.ns import qn
+
+
+P_TAG = qn('w:p')
+
+
 class TinHocProcessor:
     
     def __init__(self):
         pass
     
  
-    def create_safe_text_node(self, tag_name: str, content: str) -> ET.Element:
+    def create_safe_text_node(self, tag_name: str, content: str) -> Element:
             """
             Create XML element with safe HTML content.
             Preserves allowed HTML tags while escaping others.
             Special case: preserves entire <table class='table-material-question'>...</table> blocks untouched.
             """
-            element = ET.Element(tag_name)
+            element = Element(tag_name)
             
             if not content:
-                element.text = ''
                 return element
 
             # ================================================
@@ -74,6 +82,18 @@ class TinHocProcessor:
             )
             content = image_pattern.sub(protect_image_block, content)
 
+            # Công thức (span math-tex: $...$ gõ tay hoặc OMML) giữ nguyên, không escape
+            math_blocks = []
+            math_placeholder = '__MATH_BLOCK_{}__'
+
+            def protect_math_block(match):
+                placeholder = math_placeholder.format(len(math_blocks))
+                math_blocks.append(match.group(0))
+                return placeholder
+
+            math_pattern = re.compile(r'<span\s+class=["\']math-tex["\']\s*>.*?</span>', re.IGNORECASE | re.DOTALL)
+            content = math_pattern.sub(protect_math_block, content)
+
             # ================================================
             # STEP 1–5: Run original escaping logic on the rest
             # ================================================
@@ -172,6 +192,9 @@ class TinHocProcessor:
                 placeholder = image_placeholder.format(i)
                 safe_content = safe_content.replace(placeholder, img_html)    
 
+            for i, math_html in enumerate(math_blocks):
+                safe_content = safe_content.replace(math_placeholder.format(i), math_html)
+
             # STEP 7: Convert fullwidth to actual HTML (ONLY for allowed tags)
             fullwidth_tag_pattern = re.compile(
                 r'＜(\/?(?:b|i|u|strong|em|br|center|sub|sup|small|big|mark))\b([^＜＞]*?)＞',
@@ -179,23 +202,23 @@ class TinHocProcessor:
             )
             safe_content = fullwidth_tag_pattern.sub(r'<\1\2>', safe_content)
 
-            element.text = safe_content
+            set_html(element, safe_content)
             return element
 
     # ============================================
     # TN (Multiple Choice) Processing Functions
     # ============================================
 
-    def dang_tn_tinhoc(self, cau_sau_xu_ly: List, each_question_xml: ET.Element, audio: List, doc: Document = None):
+    def dang_tn_tinhoc(self, cau_sau_xu_ly: List, each_question_xml: Element, audio: List, doc: Document = None):
         """Process multiple choice question - Tin học"""
         # XML structure similar to normal TN
-        type_ans = ET.SubElement(each_question_xml, 'typeAnswer')
+        type_ans = SubElement(each_question_xml, 'typeAnswer')
         type_ans.text = '0'
         
-        type_view = ET.SubElement(each_question_xml, 'typeViewContent')
+        type_view = SubElement(each_question_xml, 'typeViewContent')
         type_view.text = '0'
         
-        temp = ET.SubElement(each_question_xml, 'template')
+        temp = SubElement(each_question_xml, 'template')
         temp.text = '0'
         
         # Process hint question if exists
@@ -256,7 +279,7 @@ class TinHocProcessor:
             # Ví dụ: coi như không có đáp án đúng
             index_answer = []
             # Tạo listanswers rỗng nếu cần
-            listanswers = ET.SubElement(each_question_xml, 'listanswers')
+            listanswers = SubElement(each_question_xml, 'listanswers')
         else:
             index_answer = self.list_answers_tn_tinhoc(content_q[1], cau_sau_xu_ly[1][0], each_question_xml, doc)
         
@@ -268,7 +291,7 @@ class TinHocProcessor:
         self.hdg_tn_tinhoc(array_hdg, index_answer, each_question_xml, doc)
 
     def list_answers_tn_tinhoc(self, content: List, answer_para: Any, 
-                                each_question_xml: ET.Element, doc: Document = None) -> List[str]:
+                                each_question_xml: Element, doc: Document = None) -> List[str]:
         """Process answer list - Tin học"""
         multiple_choices = []
         
@@ -303,20 +326,20 @@ class TinHocProcessor:
         answer_tn = get_text(get_child(answer_para[0], 0)).strip()
         number_of_answer = [s for s in re.split(r'(\S)', answer_tn) if s]
         
-        listanswers = ET.SubElement(each_question_xml, 'listanswers')
+        listanswers = SubElement(each_question_xml, 'listanswers')
         
         # Create XML for answers
         for i, choice in enumerate(multiple_choices):
-            answer = ET.SubElement(listanswers, 'answer')
+            answer = SubElement(listanswers, 'answer')
             
-            index = ET.SubElement(answer, 'index')
+            index = SubElement(answer, 'index')
             index.text = str(i)
             
             cont = self.create_safe_text_node('content', choice)
             answer.append(cont)
             
             dung_sai = 'TRUE' if str(i + 1) in number_of_answer else 'FALSE'
-            isans = ET.SubElement(answer, 'isanswer')
+            isans = SubElement(answer, 'isanswer')
             isans.text = dung_sai
         
         return number_of_answer
@@ -343,6 +366,9 @@ class TinHocProcessor:
                 img_base64 = base64.b64encode(get_bytes(blob)).decode('utf-8')
                 
                 result += f'<img style="width:{width}px;height:{height}px;" src="data:image/png;base64,{img_base64}" />'
+            elif get_element_type(child) == 'EQUATION':
+
+                result += get_math_html(child)
         
         return result
 
@@ -399,7 +425,7 @@ class TinHocProcessor:
         
         return html_content
     def hdg_tn_tinhoc(self, array_hdg: List, index_answer: List[str], 
-                    each_question_xml: ET.Element, doc: Document = None):
+                    each_question_xml: Element, doc: Document = None):
         """Process explanation for TN - Tin học.
         Nếu có hướng dẫn (hdg) thực sự thì thêm vào, 
         còn nếu trống thì KHÔNG thêm 'Đáp án đúng là ...'."""
@@ -432,15 +458,15 @@ class TinHocProcessor:
     # DS (True/False) Processing Functions
     # ============================================
 
-    def dang_ds_tinhoc(self, cau_sau_xu_ly: List, each_question_xml: ET.Element, audio: List, doc: Document = None):
+    def dang_ds_tinhoc(self, cau_sau_xu_ly: List, each_question_xml: Element, audio: List, doc: Document = None):
         """Process true/false question - Tin học"""
-        type_ans = ET.SubElement(each_question_xml, 'typeAnswer')
+        type_ans = SubElement(each_question_xml, 'typeAnswer')
         type_ans.text = '1'
         
-        type_view = ET.SubElement(each_question_xml, 'typeViewContent')
+        type_view = SubElement(each_question_xml, 'typeViewContent')
         type_view.text = '0'
         
-        temp = ET.SubElement(each_question_xml, 'template')
+        temp = SubElement(each_question_xml, 'template')
         temp.text = '0'
         
         # Process hint question
@@ -497,7 +523,7 @@ class TinHocProcessor:
         
         self.hdg_ds_tinhoc(content_q[1], array_hdg, answers, each_question_xml, doc)
 
-    def question_ds_tinhoc(self, content_q: List, each_question_xml: ET.Element, audio: List, doc: Document = None):
+    def question_ds_tinhoc(self, content_q: List, each_question_xml: Element, audio: List, doc: Document = None):
         """Process question content for DS format - Tin học"""
         noidung = self.convert_b4_add_tinhoc(content_q[0], doc)
         
@@ -513,27 +539,27 @@ class TinHocProcessor:
         cont_xml = self.create_safe_text_node('contentquestion', noidung)
         each_question_xml.append(cont_xml)
 
-    def dap_an_ds_tinhoc(self, answers: str, each_question_xml: ET.Element, content: List, doc: Document = None):
+    def dap_an_ds_tinhoc(self, answers: str, each_question_xml: Element, content: List, doc: Document = None):
         """Process answers for DS format - Tin học"""
-        listanswers = ET.SubElement(each_question_xml, 'listanswers')
+        listanswers = SubElement(each_question_xml, 'listanswers')
         
         for so in range(len(answers)):
             value_text = self.convert_b4_add_tinhoc(content[so], doc).strip()
             value_text = re.sub(r'^.*?\)', '', value_text).strip()
             
-            answer = ET.SubElement(listanswers, 'answer')
+            answer = SubElement(listanswers, 'answer')
             
-            index = ET.SubElement(answer, 'index')
+            index = SubElement(answer, 'index')
             index.text = str(so)
             
             cont = self.create_safe_text_node('content', value_text)
             answer.append(cont)
             
-            isans = ET.SubElement(answer, 'isanswer')
+            isans = SubElement(answer, 'isanswer')
             isans.text = 'TRUE' if answers[so] == '1' else 'FALSE'
 
     def hdg_ds_tinhoc(self, content_q: List, array_hdg: List, answers: str, 
-                      each_question_xml: ET.Element, doc: Document = None):
+                      each_question_xml: Element, doc: Document = None):
         """Process explanation for DS - Tin học"""
         loi_giai = ''
         co_hdg = False
@@ -555,28 +581,29 @@ class TinHocProcessor:
 
    
     def convert_table_tinhoc(self, table: Any) -> str:
-        """Convert table to HTML - Tin học"""
+        """
+        Convert table to HTML - Tin học.
+        Duyệt thẳng w:tr / w:tc / w:p qua get_table_grid (tuyến tính theo số ô),
+        gộp ô theo gridSpan / vMerge giống DocxProcessor.convert_table_to_html.
+        """
         html = "<table class='table-material-question'>"
-        num_rows = get_num_rows(table)
         
-        for r in range(num_rows):
+        for row in get_table_grid(table):
             html += '<tr>'
-            row = get_row(table, r)
-            num_cells = get_num_cells(row)
             
-            for c in range(num_cells):
-                cell = get_cell(row, c)
-                num_paras = get_num_children(cell)
+            for cell in row:
                 cell_html = ''
+                for p in cell['xml'].iterchildren(P_TAG):
+                    text = p.text.strip()
+                    if text:
+                        cell_html += f'<p>{text}</p>'
                 
-                for p in range(num_paras):
-                    child = get_child(cell, p)
-                    if get_element_type(child) == 'PARAGRAPH':
-                        text = get_text(child).strip()
-                        if text:
-                            cell_html += f'<p>{text}</p>'
-                
-                html += f'<td>{cell_html}</td>'
+                attrs = ''
+                if cell['rowspan'] > 1:
+                    attrs += f' rowspan="{cell["rowspan"]}"'
+                if cell['colspan'] > 1:
+                    attrs += f' colspan="{cell["colspan"]}"'
+                html += f'<td{attrs}>{cell_html}</td>'
             
             html += '</tr>'
         
@@ -599,20 +626,14 @@ class TinHocProcessor:
                 self.convert_normal_paras_tinhoc(paragraph, index, new_children, doc)
 
                 # ✅ Xử lý ảnh (giống hoàn toàn convert_b4_add)
+                images = get_manifest(doc.part)
                 for run in paragraph.runs:
-                    blips = run._element.xpath(
-                        './/*[local-name()="blip" and namespace-uri()="http://schemas.openxmlformats.org/drawingml/2006/main"]'
-                    )
-                    if blips:
+                    refs = images.refs_for(run._element, 'blip')
+                    if refs:
                         try:
-                            rId_nodes = run._element.xpath(
-                                './/*[local-name()="blip"]/@*[local-name()="embed"]'
-                            )
-                            if rId_nodes:
-                                rId = rId_nodes[0]
-                                img_tag = self._make_img_tag_from_rid(rId, doc)
-                                if img_tag:
-                                    new_children.append(img_tag)
+                            img_tag = self._make_img_tag_from_rid(refs[0].rId, doc)
+                            if img_tag:
+                                new_children.append(img_tag)
                         except Exception:
                             pass
 
@@ -622,13 +643,8 @@ class TinHocProcessor:
             else:
                 string_content += new_content
 
-        # ✅ Xử lý MathJax/LaTeX
-        import re
-        math_latex = re.compile(r'\$[^$]*\$')
-        string_content = math_latex.sub(
-            lambda m: f' <span class="math-tex">{m.group()}</span>',
-            string_content
-        )
+        # ✅ Xử lý MathJax/LaTeX (giữ nguyên công thức OMML đã bọc sẵn)
+        string_content = omml_latex.wrap_dollar_math(string_content, ' ')
 
         return string_content
 
@@ -636,22 +652,19 @@ class TinHocProcessor:
     def _make_img_tag_from_rid(self, rId: str, doc: Document) -> str:
         """Dùng rId để lấy image part từ doc.part.related_parts, trả về thẻ <img src="data:...">"""
         try:
-            part = doc.part.related_parts.get(rId)
-            if not part:
-                for rel in doc.part.rels.values():
-                    target = getattr(rel, 'target_part', None)
-                    if target and getattr(target, 'content_type', '').startswith('image') and rel.rId == rId:
-                        part = target
-                        break
-
-            if not part:
+            images = get_manifest(doc.part)
+            info = images.get(rId)
+            if info is None:
                 return ''
 
-            img_bytes = part.blob
-            content_type = getattr(part, 'content_type', 'image/png')
-            import base64
-            b64 = base64.b64encode(img_bytes).decode('ascii')
-            return f'<center><img src="data:{content_type};base64,{b64}" /></center>'
+            if vector_image.is_vector(info):
+                # EMF/WMF -> PNG (trình duyệt không hiển thị được ảnh vector của Windows)
+                png_b64 = vector_image.encode_png(info)
+                if png_b64 is not None:
+                    return f'<center><img src="data:image/png;base64,{png_b64}" /></center>'
+
+            b64 = images.encode(rId, transcode=False)
+            return f'<center><img src="data:{info.content_type};base64,{b64}" /></center>'
         except Exception:
             return ''
 
@@ -703,6 +716,9 @@ class TinHocProcessor:
                         prev_format = current_format.copy()
 
                     html_content += segment_text
+            elif get_element_type(child) == 'EQUATION':
+                # Công thức Word (OMML) -> span math-tex
+                html_content += get_math_html(child)
 
         if prev_format['underline']:
             html_content += '</u>'
@@ -722,4 +738,4 @@ class TinHocProcessor:
             flags=re.IGNORECASE
         )
 
-        new_children.append(html_content.strip())
\ No newline at end of file
+        new_children.append(html_content.strip())
@@ -0,0 +1,103 @@
+# update_check.py
+"""
+Kiểm tra bản release mới nhất trên GitHub, có cache trên đĩa.
+
+Mỗi lần mở app đều gọi API releases thì chậm khi qua proxy và cả phòng máy
+dễ chạm giới hạn rate limit của GitHub. Ở đây:
+- còn trong TTL (mặc định 6 giờ) thì dùng luôn kết quả cache, không gọi mạng;
+- hết TTL thì gửi request có điều kiện (If-None-Match theo ETag đã lưu):
+  304 Not Modified chỉ làm mới thời điểm kiểm tra (không tính vào rate limit);
+- lỗi mạng / rate limit thì dùng kết quả cache cũ nếu có.
+Cache chỉ giữ các trường cần dùng (tag_name, tên / URL / digest của asset).
+
+TTL đổi được qua tham số ttl hoặc biến môi trường DOCX_XML_UPDATE_TTL_S.
+"""
+
+import json
+import os
+import time
+from typing import Optional
+
+from app_paths import get_cache_dir
+from update_downloader import get_session
+
+
+DEFAULT_TTL_S = 6 * 3600
+TTL_ENV_VAR = 'DOCX_XML_UPDATE_TTL_S'
+REQUEST_TIMEOUT_S = 10
+CACHE_FILE_NAME = 'update_check.json'
+
+
+def get_ttl(ttl: Optional[float] = None) -> float:
+    if ttl is not None:
+        return ttl
+    try:
+        return float(os.environ[TTL_ENV_VAR])
+    except (KeyError, ValueError):
+        return DEFAULT_TTL_S
+
+
+def _load_cache(path) -> dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(path, cache):
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"[WARN] Không ghi được cache kiểm tra cập nhật: {e}")
+
+
+def _summarize(data: dict) -> dict:
+    """Chỉ giữ các trường cần cho kiểm tra / tải cập nhật"""
+    return {
+        'tag_name': data.get('tag_name', '0.0.0'),
+        'assets': [{key: asset.get(key) for key in ('name', 'browser_download_url', 'digest', 'size')}
+                   for asset in data.get('assets', [])],
+    }
+
+
+def fetch_latest_release(repo: str, ttl: Optional[float] = None, cache_path: Optional[str] = None,
+                         session=None) -> Optional[dict]:
+    """
+    Thông tin release mới nhất {'tag_name', 'assets'} của repo (dạng 'owner/name'),
+    lấy từ cache khi còn hạn. Trả về None nếu không có mạng và chưa có cache.
+    """
+    url = f"https://api.github.com/repos/{repo}/releases/latest"
+    cache_path = cache_path or os.path.join(get_cache_dir(), CACHE_FILE_NAME)
+    cache = _load_cache(cache_path)
+    entry = cache.get(url)
+    now = time.time()
+
+    if entry and 0 <= now - entry.get('checked_at', 0) < get_ttl(ttl):
+        return entry['release']
+
+    headers = {'Accept': 'application/vnd.github+json'}
+    if entry and entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    try:
+        response = (session or get_session()).get(url, headers=headers, timeout=REQUEST_TIMEOUT_S)
+    except Exception as e:
+        print(f"[WARN] Không kiểm tra được cập nhật: {e}")
+        return entry['release'] if entry else None
+
+    if response.status_code == 304 and entry:
+        entry['checked_at'] = now
+    elif response.status_code == 200:
+        entry = {'etag': response.headers.get('ETag'), 'checked_at': now,
+                 'release': _summarize(response.json())}
+    else:
+        # 403 rate limit, 404 chưa có release...: giữ cache cũ
+        print(f"[WARN] Kiểm tra cập nhật trả về HTTP {response.status_code}")
+        return entry['release'] if entry else None
+
+    cache[url] = entry
+    _save_cache(cache_path, cache)
+    return entry['release']
@@ -0,0 +1,496 @@
+# update_downloader.py
+"""
+Tải bản cập nhật (exe ~60 MB) bền với mạng chập chờn.
+
+- Một requests.Session dùng chung (pool kết nối, keep-alive) cho kiểm tra cập nhật và tải.
+- Tải vào file .part kèm file trạng thái .part.json; mất kết nối thì thử lại và
+  tiếp tục bằng HTTP Range từ byte đã có (If-Range theo ETag / Last-Modified:
+  file trên server đã đổi thì tải lại từ đầu). Hủy giữa chừng cũng giữ .part
+  để lần sau tải tiếp.
+- Kích thước chunk thích ứng: tăng khi đọc nhanh, giảm khi mạng chậm.
+- Tùy chọn chia file thành nhiều đoạn Range tải song song (khi server hỗ trợ Range).
+- Kiểm tra SHA-256 công bố kèm release trước khi đổi .part thành file đích.
+
+Tự kiểm tra với server HTTP cục bộ (hỗ trợ Range, cắt kết nối giữa chừng):
+    python update_downloader.py --selftest
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
+
+
+CONNECT_TIMEOUT_S = 10
+READ_TIMEOUT_S = 30
+
+# Chunk đọc thích ứng: mỗi lần đọc nhắm ~CHUNK_TARGET_S giây
+MIN_CHUNK_BYTES = 64 * 1024
+MAX_CHUNK_BYTES = 1024 * 1024
+START_CHUNK_BYTES = 256 * 1024
+CHUNK_TARGET_S = 0.25
+
+# Thử lại khi mất kết nối / lỗi 5xx (mỗi lần thử lại tiếp tục từ byte đã có)
+MAX_RETRIES = 8
+RETRY_BACKOFF_S = 1.0
+MAX_BACKOFF_S = 15.0
+
+# File nhỏ hơn ngưỡng này không chia đoạn song song
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+DEFAULT_SEGMENTS = 3
+
+# Ghi file trạng thái tối đa mỗi chu kỳ này (giây)
+STATE_SAVE_INTERVAL_S = 1.0
+
+_RETRYABLE = (requests.ConnectionError, requests.Timeout,
+              requests.exceptions.ChunkedEncodingError, Urllib3HTTPError)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class DownloadError(Exception):
+    """Tải thất bại (hết lượt thử lại, lỗi HTTP 4xx...)"""
+
+
+class ChecksumMismatch(DownloadError):
+    """File tải xong không khớp SHA-256 công bố"""
+
+
+class DownloadCancelled(DownloadError):
+    """Người dùng hủy; file .part được giữ để tải tiếp lần sau"""
+
+
+class _Restart(Exception):
+    """Server bỏ qua Range / file đã đổi: phải tải lại từ đầu"""
+
+
+def get_session() -> requests.Session:
+    """Session dùng chung cả ứng dụng (giữ kết nối giữa các request)"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=DEFAULT_SEGMENTS + 2)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(MAX_CHUNK_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_sha256(text: str, file_name: Optional[str] = None) -> Optional[str]:
+    """Lấy hash từ nội dung kiểu sha256sum ("<hash>  <tên file>") hoặc chỉ có hash"""
+    for line in text.splitlines():
+        match = re.match(r'\s*([0-9a-fA-F]{64})\b\s*\*?(.*)', line)
+        if not match:
+            continue
+        name = match.group(2).strip()
+        if not file_name or not name or os.path.basename(name) == file_name:
+            return match.group(1).lower()
+    return None
+
+
+def find_release_sha256(assets, asset_name: str, session: Optional[requests.Session] = None) -> Optional[str]:
+    """
+    SHA-256 của asset trong release GitHub: trường 'digest' (nếu API có trả về),
+    hoặc asset '<tên>.sha256' / 'SHA256SUMS' đi kèm. Không có thì trả về None.
+    """
+    for asset in assets:
+        digest = asset.get('digest') or ''
+        if asset.get('name') == asset_name and digest.startswith('sha256:'):
+            return digest.split(':', 1)[1].lower()
+
+    session = session or get_session()
+    for asset in assets:
+        name = asset.get('name', '')
+        if name in (asset_name + '.sha256', 'SHA256SUMS', 'SHA256SUMS.txt'):
+            response = session.get(asset['browser_download_url'],
+                                   timeout=(CONNECT_TIMEOUT_S, READ_TIMEOUT_S))
+            response.raise_for_status()
+            return parse_sha256(response.text, asset_name)
+    return None
+
+
+class _Segment:
+    """Đoạn [start, end] (end=None: không biết kích thước) và số byte đã tải"""
+
+    __slots__ = ('start', 'end', 'done')
+
+    def __init__(self, start, end, done=0):
+        self.start = start
+        self.end = end
+        self.done = done
+
+    @property
+    def remaining(self):
+        return None if self.end is None else self.end - self.start + 1 - self.done
+
+
+class UpdateDownloader:
+    """
+    Tải một URL về file đích, tiếp tục được sau khi mất kết nối hoặc bị hủy.
+
+        downloader = UpdateDownloader(segments=3)
+        downloader.download(url, 'new_app.exe', expected_sha256=sha, progress=on_progress)
+
+    progress(downloaded, total) được gọi từ thread tải (total=0 nếu server không báo kích thước);
+    cancelled() trả về True để dừng (ném DownloadCancelled).
+    """
+
+    def __init__(self, session: Optional[requests.Session] = None, segments: int = 1,
+                 max_retries: int = MAX_RETRIES):
+        self.session = session or get_session()
+        self.segments = max(1, segments)
+        self.max_retries = max_retries
+
+    def download(self, url: str, dest: str, expected_sha256: Optional[str] = None,
+                 progress: Optional[Callable[[int, int], None]] = None,
+                 cancelled: Optional[Callable[[], bool]] = None) -> str:
+        part_path = dest + '.part'
+        state_path = part_path + '.json'
+        self._progress = progress
+        self._cancelled = cancelled
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+        size, validator, ranges = self._probe(url)
+        for attempt in range(2):
+            segments = self._load_state(state_path, part_path, url, size, validator)
+            if segments is None:
+                segments = self._plan(part_path, size, ranges)
+            else:
+                print(f"[DEBUG] Tải tiếp {os.path.basename(dest)} từ "
+                      f"{sum(s.done for s in segments)}/{size} byte")
+            self._state = (state_path, url, size, validator, segments)
+            self._total = size or 0
+            self._downloaded = sum(s.done for s in segments)
+            self._last_save = 0.0
+            try:
+                self._run_segments(url, part_path, validator, segments, ranges)
+                break
+            except _Restart:
+                # Server trả nguyên file thay vì đoạn (không hỗ trợ Range / file đã đổi)
+                print("[WARN] Server không tiếp tục được từ giữa file, tải lại từ đầu")
+                self._discard(part_path, state_path)
+                ranges = False
+        else:
+            raise DownloadError("Không tải được file cập nhật")
+
+        if expected_sha256:
+            actual = sha256_file(part_path)
+            if actual != expected_sha256.lower():
+                self._discard(part_path, state_path)
+                raise ChecksumMismatch(f"SHA-256 không khớp: {actual} != {expected_sha256.lower()}")
+        os.replace(part_path, dest)
+        self._remove(state_path)
+        return dest
+
+    # ------------------------------------------------------------------ #
+
+    def _probe(self, url):
+        """HEAD: (kích thước, validator cho If-Range, server có hỗ trợ Range không)"""
+        try:
+            response = self.session.head(url, allow_redirects=True,
+                                         headers={'Accept-Encoding': 'identity'},
+                                         timeout=(CONNECT_TIMEOUT_S, READ_TIMEOUT_S))
+        except _RETRYABLE:
+            return None, None, False
+        if response.status_code >= 400:
+            return None, None, False
+        length = response.headers.get('Content-Length')
+        size = int(length) if length and length.isdigit() else None
+        validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+        # ETag yếu (W/) không dùng được cho If-Range
+        if validator and validator.startswith('W/'):
+            validator = None
+        ranges = size is not None and response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+        return size, validator, ranges
+
+    def _plan(self, part_path, size, ranges):
+        """Chia đoạn và tạo file .part rỗng (cấp sẵn kích thước khi biết trước)"""
+        with open(part_path, 'wb') as f:
+            if size:
+                f.truncate(size)
+        if not ranges:
+            return [_Segment(0, size - 1 if size else None)]
+        count = self.segments if size >= PARALLEL_MIN_BYTES else 1
+        step = -(-size // count)
+        return [_Segment(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+    def _load_state(self, state_path, part_path, url, size, validator):
+        """Các đoạn đã tải dở từ lần trước, None nếu không tiếp tục được"""
+        if not size or not os.path.exists(part_path) or not os.path.exists(state_path):
+            return None
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (state.get('url') != url or state.get('size') != size or not validator
+                or state.get('validator') != validator or os.path.getsize(part_path) != size):
+            return None
+        return [_Segment(*segment) for segment in state['segments']]
+
+    def _save_state(self, force=False):
+        state_path, url, size, validator, segments = self._state
+        if not size:
+            return
+        now = time.monotonic()
+        # Các thread đoạn cùng ghi một file .tmp: ghi lần lượt, bản chụp sau ghi sau
+        with self._save_lock:
+            with self._lock:
+                if not force and now - self._last_save < STATE_SAVE_INTERVAL_S:
+                    return
+                self._last_save = now
+                state = {'url': url, 'size': size, 'validator': validator,
+                         'segments': [[s.start, s.end, s.done] for s in segments]}
+            tmp_path = state_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, state_path)
+
+    def _run_segments(self, url, part_path, validator, segments, ranges):
+        pending = [s for s in segments if s.remaining != 0]
+        try:
+            if len(pending) <= 1:
+                for segment in pending:
+                    self._fetch_segment(url, part_path, validator, segment, ranges)
+                return
+            with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+                futures = [executor.submit(self._fetch_segment, url, part_path, validator, segment, ranges)
+                           for segment in pending]
+                for future in futures:
+                    future.result()
+        finally:
+            self._save_state(force=True)
+
+    def _fetch_segment(self, url, part_path, validator, segment, ranges):
+        """Tải một đoạn, thử lại (tiếp tục từ byte đã có) khi mất kết nối"""
+        retries = 0
+        while segment.remaining != 0:
+            done_before = segment.done
+            try:
+                self._stream_segment(url, part_path, validator, segment, ranges)
+                return
+            except _RETRYABLE as e:
+                # Chỉ đếm các lần thử liên tiếp không tải thêm được byte nào
+                retries = 1 if segment.done > done_before else retries + 1
+                if retries > self.max_retries:
+                    raise DownloadError(f"Mất kết nối quá {self.max_retries} lần: {e}") from e
+                delay = min(MAX_BACKOFF_S, RETRY_BACKOFF_S * 2 ** (retries - 1))
+                print(f"[WARN] Mất kết nối ({type(e).__name__}), thử lại sau {delay:.0f}s "
+                      f"từ byte {segment.start + segment.done}")
+                self._save_state(force=True)
+                self._sleep(delay)
+                if not ranges and segment.done:
+                    # Không có Range: chỉ tải lại được từ đầu
+                    with self._lock:
+                        self._downloaded -= segment.done
+                    segment.done = 0
+
+    def _stream_segment(self, url, part_path, validator, segment, ranges):
+        headers = {'Accept-Encoding': 'identity'}
+        offset = segment.start + segment.done
+        if ranges:
+            headers['Range'] = f"bytes={offset}-{segment.end}"
+            if validator:
+                headers['If-Range'] = validator
+
+        with self.session.get(url, headers=headers, stream=True,
+                              timeout=(CONNECT_TIMEOUT_S, READ_TIMEOUT_S)) as response:
+            if response.status_code >= 500:
+                raise requests.ConnectionError(f"HTTP {response.status_code}")
+            if response.status_code >= 400:
+                raise DownloadError(f"HTTP {response.status_code} khi tải {url}")
+            if ranges and response.status_code != 206:
+                raise _Restart()
+
+            chunk_size = START_CHUNK_BYTES
+            with open(part_path, 'r+b') as f:
+                f.seek(offset)
+                while segment.remaining != 0:
+                    if self._cancelled is not None and self._cancelled():
+                        raise DownloadCancelled("Đã hủy tải cập nhật")
+                    want = chunk_size if segment.end is None else min(chunk_size, segment.remaining)
+                    started = time.monotonic()
+                    data = response.raw.read(want)
+                    if not data:
+                        if segment.end is None:
+                            return
+                        raise requests.exceptions.ChunkedEncodingError("Kết nối đóng trước khi đủ dữ liệu")
+                    f.write(data)
+                    segment.done += len(data)
+                    self._advance(len(data))
+                    chunk_size = self._adapt_chunk(chunk_size, len(data), time.monotonic() - started)
+
+    @staticmethod
+    def _adapt_chunk(chunk_size, got, elapsed):
+        if got < chunk_size:
+            return chunk_size
+        if elapsed < CHUNK_TARGET_S / 2:
+            return min(MAX_CHUNK_BYTES, chunk_size * 2)
+        if elapsed > CHUNK_TARGET_S * 2:
+            return max(MIN_CHUNK_BYTES, chunk_size // 2)
+        return chunk_size
+
+    def _advance(self, n):
+        with self._lock:
+            self._downloaded += n
+            downloaded = self._downloaded
+        if self._progress is not None:
+            self._progress(downloaded, self._total)
+        self._save_state()
+
+    def _sleep(self, delay):
+        deadline = time.monotonic() + delay
+        while time.monotonic() < deadline:
+            if self._cancelled is not None and self._cancelled():
+                raise DownloadCancelled("Đã hủy tải cập nhật")
+            time.sleep(min(0.2, deadline - time.monotonic()))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _discard(self, part_path, state_path):
+        self._remove(part_path)
+        self._remove(state_path)
+
+
+def download_file(url, dest, expected_sha256=None, progress=None, cancelled=None,
+                  segments=DEFAULT_SEGMENTS) -> str:
+    """Tải url về dest (tiếp tục file .part nếu có), kiểm tra SHA-256 nếu được cung cấp"""
+    return UpdateDownloader(segments=segments).download(url, dest, expected_sha256, progress, cancelled)
+
+
+# ---------------------------------------------------------------------- #
+# Tự kiểm tra với server cục bộ
+
+def _serve_bytes(payload: bytes, drop_after: int = 0):
+    """
+    Server HTTP cục bộ phục vụ payload ở /app.exe, hỗ trợ HEAD / Range / If-Range.
+    drop_after > 0: mỗi response cắt kết nối sau chừng đó byte (giả lập mạng rớt).
+    Trả về (server, url); gọi server.shutdown() khi xong.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    etag = '"%s"' % hashlib.sha256(payload).hexdigest()[:16]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _headers(self, status, start, end):
+            self.send_response(status)
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            if status == 206:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{len(payload)}')
+            self.end_headers()
+
+        def _range(self):
+            header = self.headers.get('Range')
+            if_range = self.headers.get('If-Range')
+            if not header or (if_range and if_range != etag):
+                return 200, 0, len(payload) - 1
+            start, _, end = header.split('=', 1)[1].partition('-')
+            return 206, int(start), int(end) if end else len(payload) - 1
+
+        def do_HEAD(self):
+            self._headers(200, 0, len(payload) - 1)
+
+        def do_GET(self):
+            status, start, end = self._range()
+            self._headers(status, start, end)
+            body = payload[start:end + 1]
+            if drop_after and len(body) > drop_after:
+                self.wfile.write(body[:drop_after])
+                self.wfile.flush()
+                self.close_connection = True
+                return
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.handle_error = lambda request, client_address: None  # client chủ động ngắt khi hủy
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/app.exe'
+
+
+def _selftest():
+    import tempfile
+    global RETRY_BACKOFF_S
+    RETRY_BACKOFF_S = 0.01
+
+    payload = os.urandom(PARALLEL_MIN_BYTES + 3 * 1024 * 1024 + 7)
+    expected = hashlib.sha256(payload).hexdigest()
+    work_dir = tempfile.mkdtemp(prefix='update_downloader_')
+
+    def check(name, segments, drop_after, **kwargs):
+        server, url = _serve_bytes(payload, drop_after)
+        dest = os.path.join(work_dir, name)
+        try:
+            UpdateDownloader(segments=segments).download(url, dest, expected, **kwargs)
+            with open(dest, 'rb') as f:
+                assert f.read() == payload, f"{name}: sai nội dung"
+            print(f"{name}: OK")
+        finally:
+            server.shutdown()
+
+    check('single.exe', 1, 0)
+    check('single_drop.exe', 1, 1024 * 1024)
+    check('parallel_drop.exe', 4, 1024 * 1024)
+
+    # Hủy giữa chừng rồi tải tiếp từ .part
+    server, url = _serve_bytes(payload)
+    dest = os.path.join(work_dir, 'resume.exe')
+    seen = []
+    try:
+        try:
+            UpdateDownloader(segments=2).download(url, dest, expected, progress=lambda d, t: seen.append(d),
+                                                  cancelled=lambda: bool(seen) and seen[-1] > len(payload) // 3)
+            raise AssertionError("resume.exe: không dừng khi hủy")
+        except DownloadCancelled:
+            print(f"resume.exe: hủy ở {seen[-1]}/{len(payload)} byte")
+        with open(dest + '.part.json', 'r', encoding='utf-8') as f:
+            kept = sum(segment[2] for segment in json.load(f)['segments'])
+        assert 0 < kept < len(payload), f"resume.exe: .part giữ {kept} byte"
+        UpdateDownloader(segments=2).download(url, dest, expected)
+        assert sha256_file(dest) == expected, "resume.exe: sai nội dung sau khi tải tiếp"
+        print(f"resume.exe: tiếp tục từ {kept} byte, OK")
+
+        try:
+            UpdateDownloader().download(url, os.path.join(work_dir, 'bad.exe'), '0' * 64)
+            raise AssertionError("bad.exe: không phát hiện sai hash")
+        except ChecksumMismatch:
+            print("bad.exe: phát hiện sai hash OK")
+        assert not os.path.exists(os.path.join(work_dir, 'bad.exe')), "bad.exe: file sai hash vẫn được giữ"
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    import sys
+    if '--selftest' in sys.argv:
+        _selftest()
@@ -0,0 +1,882 @@
+# vector_image.py
+"""
+Chuyển ảnh vector EMF / WMF (xem trước công thức MathType, sơ đồ Word cũ) sang PNG.
+
+Trình duyệt không hiển thị được EMF/WMF, còn Pillow chỉ vẽ được chúng trên
+Windows. Thứ tự thử:
+1. Pillow trên Windows (GDI, có sẵn trong Pillow, không cần mạng);
+2. bộ vẽ thuần Python ở đây: đọc các record EMF / WMF phổ biến (đường, đa giác,
+   path, hình chữ nhật, ellipse, chữ, bitmap DIB) và vẽ lại bằng Pillow ImageDraw.
+   Font tìm theo tên file TrueType thông dụng, không có thì dùng font mặc định
+   của Pillow; chữ trong font Symbol được đổi sang Unicode.
+Kết quả PNG ở kích thước hiển thị (x dpi_factor) được lưu vào cache bền theo
+nội dung (thư mục cache người dùng / vector_images / <sha1>_<w>x<h>.png), nên mỗi
+công thức chỉ phải vẽ một lần trên mỗi máy.
+"""
+
+import base64
+import math
+import os
+import struct
+import sys
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+from app_paths import get_cache_dir
+
+
+VECTOR_FORMATS = ('x-emf', 'emf', 'x-wmf', 'wmf')
+
+# Tăng khi bộ vẽ thay đổi, để ảnh cache cũ không còn được dùng
+RENDERER_VERSION = 1
+
+# Độ phân giải PNG = kích thước hiển thị (px 96 DPI) x hệ số này
+DEFAULT_DPI_FACTOR = 2.0
+EMU_PER_PX = 9525
+MAX_DIMENSION = 4096
+
+BEZIER_STEPS = 8
+
+# Font thường gặp -> file TrueType (Windows\Fonts; tên file giống nhau trên nhiều máy)
+_FONT_FILES = {
+    'times new roman': ('times.ttf', 'timesbd.ttf', 'timesi.ttf', 'timesbi.ttf'),
+    'arial': ('arial.ttf', 'arialbd.ttf', 'ariali.ttf', 'arialbi.ttf'),
+    'courier new': ('cour.ttf', 'courbd.ttf', 'couri.ttf', 'courbi.ttf'),
+    'symbol': ('symbol.ttf',) * 4,
+    'cambria math': ('cambria.ttc',) * 4,
+    'mt extra': ('mtextra.ttf',) * 4,
+}
+_FALLBACK_FONTS = ('DejaVuSerif.ttf', 'DejaVuSans.ttf', 'LiberationSerif-Regular.ttf')
+
+# Font Symbol (charset 2 / mã 0xF0xx) -> Unicode
+_SYMBOL_MAP = dict(zip(
+    'ABGDEZHQIKLMNXOPRSTUFCYWabgdezhqiklmnxoprstufcywjJVv',
+    'ΑΒΓΔΕΖΗΘΙΚΛΜΝΞΟΠΡΣΤΥΦΧΨΩαβγδεζηθικλμνξοπρστυφχψωϕϑςϖ',
+))
+_SYMBOL_MAP.update({
+    '\xb4': '×', '\xb8': '÷', '\xb1': '±', '\xa3': '≤', '\xb3': '≥', '\xb9': '≠', '\xbb': '≈',
+    '\xba': '≡', '\xb5': '∝', '\xa5': '∞', '\xb6': '∂', '\xd1': '∇', '\xd6': '√', '\xe5': '∑',
+    '\xd5': '∏', '\xf2': '∫', '\xae': '→', '\xac': '←', '\xdb': '⇔', '\xde': '⇒', '\xce': '∈',
+    '\xcf': '∉', '\xc7': '∩', '\xc8': '∪', '\xcc': '⊂', '\xc9': '⊃', '\xd7': '·', '\xb0': '°',
+    '\xa2': '′', '\xb2': '″', '\x2d': '−', '\xbc': '…', '\xc6': '∅', '\x22': '∀', '\x24': '∃',
+    '\xe6': '(', '\xe8': '(', '\xf6': ')', '\xf8': ')', '\xe9': '[', '\xeb': '[', '\xf9': ']',
+    '\xfb': ']', '\xec': '{', '\xed': '{', '\xee': '{', '\xfc': '}', '\xfd': '}', '\xfe': '}',
+    '\xbd': '|', '\xe1': '⟨', '\xf1': '⟩', '\xd0': '∠', '\x5e': '⊥', '\x40': '≅', '\x7e': '∼',
+})
+
+_font_cache = {}
+_font_lock = threading.Lock()
+
+# base64 PNG trong bộ nhớ (tránh đọc lại file cache cho ảnh lặp lại trong tài liệu)
+_MEMORY_CACHE_LIMIT = 512
+_memory_cache: "OrderedDict[tuple, Optional[str]]" = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def is_vector(info) -> bool:
+    return info.format in VECTOR_FORMATS
+
+
+def target_size(extent, natural_px, dpi_factor=DEFAULT_DPI_FACTOR) -> Tuple[int, int]:
+    """Kích thước PNG: extent (EMU) nếu có, không thì kích thước tự nhiên của ảnh (px 96 DPI)"""
+    if extent and extent[0] and extent[1]:
+        width, height = extent[0] / EMU_PER_PX, extent[1] / EMU_PER_PX
+    else:
+        width, height = natural_px
+    scale = min(dpi_factor, MAX_DIMENSION / max(width, height, 1))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+# ---------------------------------------------------------------------- #
+# Cache bền theo nội dung
+
+def _cache_path(sha1, size):
+    return os.path.join(get_cache_dir('vector_images'), sha1[:2],
+                        f"{sha1}_{size[0]}x{size[1]}_v{RENDERER_VERSION}.png")
+
+
+def encode_png(info, extent=None, dpi_factor=DEFAULT_DPI_FACTOR) -> Optional[str]:
+    """
+    Base64 PNG của ảnh vector `info` (image_manifest.ImageInfo) ở kích thước hiển thị
+    `extent` (EMU, mặc định extent của ảnh trong manifest), đọc từ cache nếu đã vẽ
+    trước đó; None nếu không vẽ được.
+    """
+    natural = natural_size(info.blob)
+    if natural is None:
+        return None
+    size = target_size(extent or info.extent, natural, dpi_factor)
+    key = (info.sha1, size)
+    with _memory_lock:
+        if key in _memory_cache:
+            _memory_cache.move_to_end(key)
+            return _memory_cache[key]
+
+    path = _cache_path(info.sha1, size)
+    try:
+        with open(path, 'rb') as f:
+            png = f.read()
+    except OSError:
+        png = rasterize(info.blob, size)
+        if png is not None:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(png)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"[WARN] Không ghi được cache ảnh vector: {e}")
+
+    b64 = base64.b64encode(png).decode('ascii') if png is not None else None
+    with _memory_lock:
+        _memory_cache[key] = b64
+        if len(_memory_cache) > _MEMORY_CACHE_LIMIT:
+            _memory_cache.popitem(last=False)
+    return b64
+
+
+def rasterize(blob: bytes, size: Tuple[int, int]) -> Optional[bytes]:
+    """Vẽ EMF / WMF ra PNG kích thước `size`; None nếu không vẽ được"""
+    img = None
+    if sys.platform == 'win32':
+        img = _rasterize_pillow(blob, size)
+    if img is None:
+        try:
+            if blob[:4] == b'\x01\x00\x00\x00' and blob[40:44] == b' EMF':
+                img = _EmfRenderer(blob, size).render()
+            else:
+                img = _WmfRenderer(blob, size).render()
+        except (struct.error, IndexError, ValueError, ZeroDivisionError, OSError) as e:
+            print(f"[WARN] Không vẽ được ảnh vector: {e}")
+            img = None
+    if img is None:
+        return None
+    output = BytesIO()
+    img.save(output, format='PNG', optimize=True)
+    return output.getvalue()
+
+
+def _rasterize_pillow(blob, size):
+    try:
+        img = Image.open(BytesIO(blob))
+        width, height = img.size
+        dpi = img.info.get('dpi', 72)
+        dpi = dpi[0] if isinstance(dpi, tuple) else dpi
+        img.load(dpi=max(1, round(dpi * min(size[0] / width, size[1] / height))))
+        img = img.convert('RGBA')
+        return img.resize(size, Image.LANCZOS) if img.size != size else img
+    except Exception as e:
+        print(f"[DEBUG] Pillow không vẽ được ảnh vector, dùng bộ vẽ nội bộ: {e}")
+        return None
+
+
+def natural_size(blob: bytes) -> Optional[Tuple[float, float]]:
+    """Kích thước tự nhiên (px 96 DPI) từ header EMF (frame, 0.01 mm) / WMF placeable"""
+    try:
+        if blob[:4] == b'\x01\x00\x00\x00' and blob[40:44] == b' EMF':
+            left, top, right, bottom = struct.unpack_from('<4i', blob, 24)
+            return (right - left) / 2540 * 96, (bottom - top) / 2540 * 96
+        if blob[:4] == b'\xd7\xcd\xc6\x9a':
+            left, top, right, bottom, inch = struct.unpack_from('<4hH', blob, 6)
+            return abs(right - left) / inch * 96, abs(bottom - top) / inch * 96
+    except (struct.error, ZeroDivisionError):
+        return None
+    return None
+
+
+# ---------------------------------------------------------------------- #
+# Bộ vẽ thuần Python
+
+def _colorref(value):
+    return value & 0xFF, (value >> 8) & 0xFF, (value >> 16) & 0xFF
+
+
+def _load_font(face, size, bold, italic):
+    key = (face, size, bold, italic)
+    with _font_lock:
+        font = _font_cache.get(key)
+        if font is not None:
+            return font
+        files = _FONT_FILES.get(face.lower())
+        candidates = [files[bold + 2 * italic]] if files else []
+        candidates += list(_FALLBACK_FONTS)
+        for name in candidates:
+            try:
+                font = ImageFont.truetype(name, size)
+                break
+            except OSError:
+                continue
+        else:
+            font = ImageFont.load_default(size)
+        _font_cache[key] = font
+        return font
+
+
+class _Obj:
+    """Bút / cọ / font GDI"""
+
+    __slots__ = ('kind', 'color', 'width', 'null', 'face', 'height', 'bold', 'italic', 'symbol', 'angle')
+
+    def __init__(self, kind, color=(0, 0, 0), width=0, null=False, face='', height=0,
+                 bold=False, italic=False, symbol=False, angle=0.0):
+        self.kind = kind
+        self.color = color
+        self.width = width
+        self.null = null
+        self.face = face
+        self.height = height
+        self.bold = bold
+        self.italic = italic
+        self.symbol = symbol
+        self.angle = angle
+
+
+# Stock object (SelectObject với chỉ số 0x80000000 | n)
+_STOCK = {
+    0: _Obj('brush', (255, 255, 255)), 1: _Obj('brush', (192, 192, 192)), 2: _Obj('brush', (128, 128, 128)),
+    3: _Obj('brush', (64, 64, 64)), 4: _Obj('brush', (0, 0, 0)), 5: _Obj('brush', null=True),
+    6: _Obj('pen', (255, 255, 255)), 7: _Obj('pen', (0, 0, 0)), 8: _Obj('pen', null=True),
+    10: _Obj('font', face='Courier New', height=-12), 11: _Obj('font', face='Courier New', height=-12),
+    12: _Obj('font', face='Arial', height=-12), 13: _Obj('font', face='Arial', height=-12),
+    14: _Obj('font', face='Arial', height=-12), 16: _Obj('font', face='Courier New', height=-12),
+    17: _Obj('font', face='Arial', height=-12),
+}
+
+
+class _State:
+    __slots__ = ('pen', 'brush', 'font', 'text_color', 'text_align', 'window_org', 'window_ext',
+                 'viewport_org', 'viewport_ext', 'map_mode', 'world', 'position')
+
+    def __init__(self):
+        self.pen = _STOCK[7]
+        self.brush = _STOCK[0]
+        self.font = _STOCK[12]
+        self.text_color = (0, 0, 0)
+        self.text_align = 0
+        self.window_org = (0, 0)
+        self.window_ext = None
+        self.viewport_org = (0, 0)
+        self.viewport_ext = None
+        self.map_mode = 1
+        self.world = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+        self.position = (0, 0)
+
+    def copy(self):
+        other = _State.__new__(_State)
+        for name in _State.__slots__:
+            setattr(other, name, getattr(self, name))
+        return other
+
+
+class _Renderer:
+    """Phần chung của bộ vẽ EMF / WMF: trạng thái DC, đổi tọa độ, các lệnh vẽ"""
+
+    def __init__(self, blob, size):
+        self.blob = blob
+        self.size = size
+        self.image = Image.new('RGBA', size, (255, 255, 255, 0))
+        self.draw = ImageDraw.Draw(self.image)
+        self.state = _State()
+        self.stack = []
+        self.objects = {}
+        self.drawn = 0
+        self.path = None  # list các figure (list điểm px) khi đang ghi path
+
+    # --- tọa độ ---
+
+    def logical_to_device(self, x, y):
+        m11, m12, m21, m22, dx, dy = self.state.world
+        x, y = x * m11 + y * m21 + dx, x * m12 + y * m22 + dy
+        state = self.state
+        if state.window_ext and state.viewport_ext and state.window_ext[0] and state.window_ext[1]:
+            x = (x - state.window_org[0]) * state.viewport_ext[0] / state.window_ext[0] + state.viewport_org[0]
+            y = (y - state.window_org[1]) * state.viewport_ext[1] / state.window_ext[1] + state.viewport_org[1]
+        else:
+            x = x - state.window_org[0] + state.viewport_org[0]
+            y = y - state.window_org[1] + state.viewport_org[1]
+        return x, y
+
+    def device_to_image(self, x, y):
+        raise NotImplementedError
+
+    def px(self, x, y):
+        return self.device_to_image(*self.logical_to_device(x, y))
+
+    def scale(self):
+        """Số px ảnh cho một đơn vị logic (trung bình hai trục)"""
+        x0, y0 = self.px(0, 0)
+        x1, y1 = self.px(1000, 1000)
+        return (abs(x1 - x0) + abs(y1 - y0)) / 2000
+
+    def pen_width(self):
+        return max(1, round(self.state.pen.width * self.scale()))
+
+    # --- lệnh vẽ ---
+
+    def select(self, obj):
+        if obj is None:
+            return
+        setattr(self.state, obj.kind, obj)
+
+    def polyline(self, points):
+        pts = [self.px(x, y) for x, y in points]
+        if self.path is not None:
+            self.path.append(pts)
+            return
+        if len(pts) >= 2 and not self.state.pen.null:
+            self.draw.line(pts, fill=self.state.pen.color, width=self.pen_width(), joint='curve')
+            self.drawn += 1
+
+    def polygon(self, points):
+        pts = [self.px(x, y) for x, y in points]
+        if self.path is not None:
+            self.path.append(pts + pts[:1])
+            return
+        self._fill_stroke([pts], True, True)
+
+    def _fill_stroke(self, figures, fill, stroke):
+        for pts in figures:
+            if len(pts) < 2:
+                continue
+            if fill and not self.state.brush.null and len(pts) >= 3:
+                self.draw.polygon(pts, fill=self.state.brush.color)
+                self.drawn += 1
+            if stroke and not self.state.pen.null:
+                closed = pts if pts[0] == pts[-1] else pts + pts[:1]
+                self.draw.line(closed if fill else pts, fill=self.state.pen.color,
+                               width=self.pen_width(), joint='curve')
+                self.drawn += 1
+
+    def rectangle(self, left, top, right, bottom, ellipse=False):
+        (x0, y0), (x1, y1) = self.px(left, top), self.px(right, bottom)
+        box = [min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)]
+        fill = None if self.state.brush.null else self.state.brush.color
+        outline = None if self.state.pen.null else self.state.pen.color
+        if fill is None and outline is None:
+            return
+        if ellipse:
+            self.draw.ellipse(box, fill=fill, outline=outline, width=self.pen_width())
+        else:
+            self.draw.rectangle(box, fill=fill, outline=outline, width=self.pen_width())
+        self.drawn += 1
+
+    def move_to(self, x, y):
+        self.state.position = (x, y)
+        if self.path is not None:
+            self.path.append([self.px(x, y)])
+
+    def line_to(self, x, y):
+        start = self.state.position
+        self.state.position = (x, y)
+        if self.path is not None:
+            if not self.path:
+                self.path.append([self.px(*start)])
+            self.path[-1].append(self.px(x, y))
+            return
+        self.polyline([start, (x, y)])
+
+    def bezier(self, points, start=None):
+        """Các đoạn Bézier bậc 3 (start + 3 điểm mỗi đoạn) -> polyline"""
+        if start is None:
+            start, points = points[0], points[1:]
+        out = [start]
+        for i in range(0, len(points) - 2, 3):
+            p0, p1, p2, p3 = out[-1], points[i], points[i + 1], points[i + 2]
+            for step in range(1, BEZIER_STEPS + 1):
+                t = step / BEZIER_STEPS
+                a, b, c, d = (1 - t) ** 3, 3 * t * (1 - t) ** 2, 3 * t * t * (1 - t), t ** 3
+                out.append((a * p0[0] + b * p1[0] + c * p2[0] + d * p3[0],
+                            a * p0[1] + b * p1[1] + c * p2[1] + d * p3[1]))
+        return out
+
+    def poly_to(self, points, bezier=False):
+        start = self.state.position
+        pts = self.bezier(points, start) if bezier else [start] + list(points)
+        self.state.position = points[-1] if points else start
+        if self.path is not None:
+            if not self.path:
+                self.path.append([self.px(*start)])
+            self.path[-1].extend(self.px(x, y) for x, y in pts[1:])
+            return
+        self.polyline(pts)
+
+    def text(self, x, y, text):
+        text = text.rstrip('\x00')
+        if not text.strip():
+            return
+        font_obj = self.state.font
+        if font_obj.symbol:
+            text = ''.join(_SYMBOL_MAP.get(chr(ord(ch) & 0xFF) if ord(ch) >= 0xF000 else ch, ch)
+                           for ch in text)
+        x0, y0 = self.px(0, 0)
+        x1, y1 = self.px(0, abs(font_obj.height))
+        size = max(4, round(math.hypot(x1 - x0, y1 - y0) * (1 if font_obj.height < 0 else 0.85)))
+        font = _load_font(font_obj.face, size, font_obj.bold, font_obj.italic)
+
+        align = self.state.text_align
+        horizontal = 'm' if align & 6 == 6 else 'r' if align & 2 else 'l'
+        vertical = 's' if align & 24 == 24 else 'b' if align & 8 else 'a'
+        if align & 1:  # TA_UPDATECP
+            x, y = self.state.position
+        px, py = self.px(x, y)
+        self.draw.text((px, py), text, fill=self.state.text_color, font=font, anchor=horizontal + vertical)
+        self.drawn += 1
+
+    def bitmap(self, left, top, width, height, bmi, bits):
+        """Vẽ DIB (BITMAPINFO + dữ liệu) vào hình chữ nhật logic"""
+        if not bmi or not bits:
+            return
+        (header_size,) = struct.unpack_from('<I', bmi, 0)
+        file_header = b'BM' + struct.pack('<IHHI', 14 + len(bmi) + len(bits), 0, 0, 14 + len(bmi))
+        dib = Image.open(BytesIO(file_header + bmi + bits)).convert('RGBA')
+        (x0, y0), (x1, y1) = self.px(left, top), self.px(left + width, top + height)
+        box = (round(min(x0, x1)), round(min(y0, y1)), round(max(x0, x1)), round(max(y0, y1)))
+        target = (max(1, box[2] - box[0]), max(1, box[3] - box[1]))
+        self.image.alpha_composite(dib.resize(target, Image.LANCZOS), box[:2])
+        self.drawn += 1
+
+    def save_dc(self):
+        self.stack.append(self.state.copy())
+
+    def restore_dc(self, relative=-1):
+        if not self.stack:
+            return
+        index = relative if relative < 0 else relative - len(self.stack) - 1
+        try:
+            self.state = self.stack[index]
+            del self.stack[index:]
+        except IndexError:
+            self.state = self.stack.pop()
+
+    def result(self):
+        if not self.drawn:
+            return None
+        # Nền trắng giống khi Word hiển thị công thức
+        background = Image.new('RGBA', self.size, (255, 255, 255, 255))
+        background.alpha_composite(self.image)
+        return background.convert('RGB')
+
+
+class _EmfRenderer(_Renderer):
+    """Bộ vẽ EMF (một tập record thường gặp)"""
+
+    def __init__(self, blob, size):
+        super().__init__(blob, size)
+        bounds = struct.unpack_from('<4i', blob, 8)
+        frame = struct.unpack_from('<4i', blob, 24)
+        device = struct.unpack_from('<2i', blob, 72)
+        millimeters = struct.unpack_from('<2i', blob, 80)
+        # frame (0.01 mm) -> đơn vị thiết bị tham chiếu
+        px_per_mm = (device[0] / millimeters[0], device[1] / millimeters[1])
+        left, top = frame[0] / 100 * px_per_mm[0], frame[1] / 100 * px_per_mm[1]
+        right, bottom = frame[2] / 100 * px_per_mm[0], frame[3] / 100 * px_per_mm[1]
+        if right - left <= 0 or bottom - top <= 0:
+            left, top, right, bottom = bounds[0], bounds[1], bounds[2] + 1, bounds[3] + 1
+        self.origin = (left, top)
+        self.factor = (size[0] / (right - left), size[1] / (bottom - top))
+        self.px_per_mm = px_per_mm
+
+    def device_to_image(self, x, y):
+        return (x - self.origin[0]) * self.factor[0], (y - self.origin[1]) * self.factor[1]
+
+    def logical_to_device(self, x, y):
+        mode = self.state.map_mode
+        if mode in (1, 7, 8):
+            return super().logical_to_device(x, y)
+        # Map mode cố định: đơn vị logic -> mm -> thiết bị, trục y hướng lên
+        mm = {2: 0.1, 3: 0.01, 4: 0.254, 5: 0.0254, 6: 25.4 / 1440}.get(mode, 1)
+        m11, m12, m21, m22, dx, dy = self.state.world
+        x, y = x * m11 + y * m21 + dx, x * m12 + y * m22 + dy
+        x = (x - self.state.window_org[0]) * mm * self.px_per_mm[0] + self.state.viewport_org[0]
+        y = -(y - self.state.window_org[1]) * mm * self.px_per_mm[1] + self.state.viewport_org[1]
+        return x, y
+
+    def _points16(self, offset, count):
+        values = struct.unpack_from(f'<{2 * count}h', self.blob, offset)
+        return list(zip(values[::2], values[1::2]))
+
+    def _points32(self, offset, count):
+        values = struct.unpack_from(f'<{2 * count}i', self.blob, offset)
+        return list(zip(values[::2], values[1::2]))
+
+    def render(self):
+        blob = self.blob
+        pos = 0
+        while pos + 8 <= len(blob):
+            kind, size = struct.unpack_from('<II', blob, pos)
+            if size < 8:
+                break
+            self._record(kind, pos + 8, pos)
+            if kind == 14:  # EMR_EOF
+                break
+            pos += size
+        return self.result()
+
+    def _record(self, kind, p, start):
+        blob = self.blob
+        state = self.state
+        if kind in (2, 3, 4, 5, 6, 85, 86, 87, 88, 89):
+            # POLYBEZIER / POLYGON / POLYLINE / POLYBEZIERTO / POLYLINETO (32 bit và 16 bit)
+            (count,) = struct.unpack_from('<I', blob, p + 16)
+            points = (self._points16 if kind >= 85 else self._points32)(p + 20, count)
+            base = kind - 83 if kind >= 85 else kind
+            if base == 2:
+                self.polyline(self.bezier(points))
+            elif base == 3:
+                self.polygon(points)
+            elif base == 4:
+                self.polyline(points)
+            elif base in (5, 6):
+                self.poly_to(points, bezier=base == 5)
+        elif kind in (7, 8, 90, 91):
+            # POLYPOLYLINE / POLYPOLYGON
+            polys, _ = struct.unpack_from('<II', blob, p + 16)
+            counts = struct.unpack_from(f'<{polys}I', blob, p + 24)
+            offset = p + 24 + 4 * polys
+            reader = self._points16 if kind >= 90 else self._points32
+            step = 4 if kind >= 90 else 8
+            for count in counts:
+                points = reader(offset, count)
+                offset += step * count
+                if kind in (8, 91):
+                    self.polygon(points)
+                else:
+                    self.polyline(points)
+        elif kind == 9:
+            state.window_ext = struct.unpack_from('<2i', blob, p)
+        elif kind == 10:
+            state.window_org = struct.unpack_from('<2i', blob, p)
+        elif kind == 11:
+            state.viewport_ext = struct.unpack_from('<2i', blob, p)
+        elif kind == 12:
+            state.viewport_org = struct.unpack_from('<2i', blob, p)
+        elif kind == 17:
+            (state.map_mode,) = struct.unpack_from('<I', blob, p)
+        elif kind == 22:
+            (state.text_align,) = struct.unpack_from('<I', blob, p)
+        elif kind == 24:
+            state.text_color = _colorref(struct.unpack_from('<I', blob, p)[0])
+        elif kind == 27:
+            self.move_to(*struct.unpack_from('<2i', blob, p))
+        elif kind == 33:
+            self.save_dc()
+        elif kind == 34:
+            self.restore_dc(struct.unpack_from('<i', blob, p)[0])
+        elif kind == 35:
+            state.world = struct.unpack_from('<6f', blob, p)
+        elif kind == 36:
+            matrix = struct.unpack_from('<6f', blob, p)
+            (mode,) = struct.unpack_from('<I', blob, p + 24)
+            if mode == 1:
+                state.world = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+            elif mode == 2:
+                state.world = _multiply(matrix, state.world)
+            elif mode == 3:
+                state.world = _multiply(state.world, matrix)
+            elif mode == 4:
+                state.world = matrix
+        elif kind == 37:
+            (index,) = struct.unpack_from('<I', blob, p)
+            self.select(_STOCK.get(index & 0x7FFFFFFF) if index & 0x80000000 else self.objects.get(index))
+        elif kind == 38:
+            index, style, width = struct.unpack_from('<3I', blob, p)
+            color = struct.unpack_from('<I', blob, p + 16)[0]
+            self.objects[index] = _Obj('pen', _colorref(color), width, null=style & 0xF == 5)
+        elif kind == 95:
+            index = struct.unpack_from('<I', blob, p)[0]
+            style, width, _, color = struct.unpack_from('<4I', blob, p + 20)
+            self.objects[index] = _Obj('pen', _colorref(color), width, null=style & 0xF == 5)
+        elif kind == 39:
+            index, style, color = struct.unpack_from('<3I', blob, p)
+            self.objects[index] = _Obj('brush', _colorref(color), null=style == 1)
+        elif kind == 40:
+            self.objects.pop(struct.unpack_from('<I', blob, p)[0], None)
+        elif kind == 82:
+            index, height, _, escapement, _, weight = struct.unpack_from('<I5i', blob, p)
+            italic, _, _, charset = struct.unpack_from('<4B', blob, p + 24)
+            face = blob[p + 32:p + 96].decode('utf-16-le', 'ignore').split('\x00')[0]
+            self.objects[index] = _Obj('font', face=face, height=height or -12, bold=weight >= 600,
+                                       italic=bool(italic), symbol=charset == 2 or face.lower() == 'symbol',
+                                       angle=escapement / 10)
+        elif kind in (42, 43, 44):
+            self.rectangle(*struct.unpack_from('<4i', blob, p), ellipse=kind == 42)
+        elif kind == 54:
+            self.line_to(*struct.unpack_from('<2i', blob, p))
+        elif kind == 59:
+            self.path = []
+        elif kind == 60:
+            pass
+        elif kind == 61:
+            if self.path:
+                self.path[-1].append(self.path[-1][0])
+        elif kind in (62, 63, 64):
+            figures, self.path = self.path or [], None
+            self._fill_stroke(figures, fill=kind in (62, 63), stroke=kind in (63, 64))
+        elif kind == 67:
+            self.path = None
+        elif kind == 84:
+            # EXTTEXTOUTW: EMRTEXT bắt đầu sau bounds (16) + graphicsMode + exScale + eyScale
+            text_pos = p + 28
+            x, y, chars, offset = struct.unpack_from('<2i2I', blob, text_pos)
+            text = blob[start + offset:start + offset + 2 * chars].decode('utf-16-le', 'ignore')
+            self.text(x, y, text)
+        elif kind == 81:
+            # STRETCHDIBITS
+            x, y = struct.unpack_from('<2i', blob, p + 16)
+            off_bmi, cb_bmi, off_bits, cb_bits = struct.unpack_from('<4I', blob, p + 40)
+            width, height = struct.unpack_from('<2i', blob, p + 64)
+            self.bitmap(x, y, width, height, blob[start + off_bmi:start + off_bmi + cb_bmi],
+                        blob[start + off_bits:start + off_bits + cb_bits])
+
+
+def _multiply(a, b):
+    """Tích hai ma trận affine XFORM (eM11, eM12, eM21, eM22, eDx, eDy): a rồi b"""
+    return (a[0] * b[0] + a[1] * b[2], a[0] * b[1] + a[1] * b[3],
+            a[2] * b[0] + a[3] * b[2], a[2] * b[1] + a[3] * b[3],
+            a[4] * b[0] + a[5] * b[2] + b[4], a[4] * b[1] + a[5] * b[3] + b[5])
+
+
+class _WmfRenderer(_Renderer):
+    """Bộ vẽ WMF (placeable hoặc không), tọa độ logic ánh xạ thẳng theo window"""
+
+    def __init__(self, blob, size):
+        super().__init__(blob, size)
+        self.bbox = None
+        self.start = 0
+        if blob[:4] == b'\xd7\xcd\xc6\x9a':
+            left, top, right, bottom = struct.unpack_from('<4h', blob, 6)
+            self.bbox = (left, top, right, bottom)
+            self.start = 22
+        (header_words,) = struct.unpack_from('<H', blob, self.start + 2)
+        self.start += header_words * 2
+        self.slots = []
+
+    def logical_to_device(self, x, y):
+        return x, y
+
+    def device_to_image(self, x, y):
+        state = self.state
+        if state.window_ext and state.window_ext[0] and state.window_ext[1]:
+            org, ext = state.window_org, state.window_ext
+        else:
+            left, top, right, bottom = self.bbox or (0, 0, self.size[0], self.size[1])
+            org, ext = (left, top), (right - left, bottom - top)
+        return (x - org[0]) * self.size[0] / ext[0], (y - org[1]) * self.size[1] / ext[1]
+
+    def _add_object(self, obj):
+        for i, slot in enumerate(self.slots):
+            if slot is None:
+                self.slots[i] = obj
+                return
+        self.slots.append(obj)
+
+    def _points(self, offset, count):
+        values = struct.unpack_from(f'<{2 * count}h', self.blob, offset)
+        return list(zip(values[::2], values[1::2]))
+
+    def render(self):
+        blob = self.blob
+        pos = self.start
+        while pos + 6 <= len(blob):
+            words, function = struct.unpack_from('<IH', blob, pos)
+            if function == 0 or words < 3:
+                break
+            self._record(function, pos + 6, words * 2 - 6)
+            pos += words * 2
+        return self.result()
+
+    def _record(self, function, p, length):
+        blob = self.blob
+        state = self.state
+        if function == 0x020B:
+            y, x = struct.unpack_from('<2h', blob, p)
+            state.window_org = (x, y)
+        elif function == 0x020C:
+            y, x = struct.unpack_from('<2h', blob, p)
+            state.window_ext = (x, y)
+        elif function == 0x0209:
+            state.text_color = _colorref(struct.unpack_from('<I', blob, p)[0])
+        elif function == 0x012E:
+            (state.text_align,) = struct.unpack_from('<H', blob, p)
+        elif function == 0x001E:
+            self.save_dc()
+        elif function == 0x0127:
+            self.restore_dc(struct.unpack_from('<h', blob, p)[0])
+        elif function == 0x02FA:
+            style, width, _ = struct.unpack_from('<3h', blob, p)
+            color = struct.unpack_from('<I', blob, p + 6)[0]
+            self._add_object(_Obj('pen', _colorref(color), width, null=style & 0xF == 5))
+        elif function == 0x02FC:
+            style, color = struct.unpack_from('<HI', blob, p)
+            self._add_object(_Obj('brush', _colorref(color), null=style == 1))
+        elif function == 0x02FB:
+            height, _, escapement, _, weight = struct.unpack_from('<5h', blob, p)
+            italic, _, _, charset = struct.unpack_from('<4B', blob, p + 10)
+            face = blob[p + 18:p + length].split(b'\x00')[0].decode('cp1252', 'ignore')
+            self._add_object(_Obj('font', face=face, height=height or -12, bold=weight >= 600,
+                                  italic=bool(italic), symbol=charset == 2 or face.lower() == 'symbol',
+                                  angle=escapement / 10))
+        elif function in (0x00F7, 0x06FF, 0x0142, 0x01F9, 0x0762):
+            self._add_object(None)  # palette / region / pattern brush: giữ chỗ trong bảng object
+        elif function == 0x012D:
+            (index,) = struct.unpack_from('<H', blob, p)
+            if index < len(self.slots):
+                self.select(self.slots[index])
+        elif function == 0x01F0:
+            (index,) = struct.unpack_from('<H', blob, p)
+            if index < len(self.slots):
+                self.slots[index] = None
+        elif function == 0x0214:
+            y, x = struct.unpack_from('<2h', blob, p)
+            self.move_to(x, y)
+        elif function == 0x0213:
+            y, x = struct.unpack_from('<2h', blob, p)
+            self.line_to(x, y)
+        elif function in (0x0325, 0x0324):
+            (count,) = struct.unpack_from('<h', blob, p)
+            points = self._points(p + 2, count)
+            (self.polyline if function == 0x0325 else self.polygon)(points)
+        elif function == 0x0538:
+            (polys,) = struct.unpack_from('<H', blob, p)
+            counts = struct.unpack_from(f'<{polys}H', blob, p + 2)
+            offset = p + 2 + 2 * polys
+            for count in counts:
+                self.polygon(self._points(offset, count))
+                offset += 4 * count
+        elif function in (0x041B, 0x0418, 0x061C):
+            bottom, right, top, left = struct.unpack_from('<4h', blob, p + (4 if function == 0x061C else 0))
+            self.rectangle(left, top, right, bottom, ellipse=function == 0x0418)
+        elif function == 0x0521:
+            (count,) = struct.unpack_from('<h', blob, p)
+            text = blob[p + 2:p + 2 + count]
+            y, x = struct.unpack_from('<2h', blob, p + 2 + count + (count & 1))
+            self.text(x, y, text.decode('cp1252', 'ignore'))
+        elif function == 0x0A32:
+            y, x, count, options = struct.unpack_from('<2h2H', blob, p)
+            offset = p + 8 + (8 if options & 0x0006 else 0)
+            self.text(x, y, blob[offset:offset + count].decode('cp1252', 'ignore'))
+        elif function == 0x0F43:
+            # STRETCHDIB: rop(4) usage(2) srcH srcW ySrc xSrc destH destW yDst xDst, rồi DIB
+            dest_h, dest_w, y, x = struct.unpack_from('<4h', blob, p + 14)
+            self._dib(x, y, dest_w, dest_h, p + 22, length - 22)
+        elif function == 0x0B41:
+            # DIBSTRETCHBLT: rop(4) srcH srcW ySrc xSrc destH destW yDst xDst, rồi DIB
+            dest_h, dest_w, y, x = struct.unpack_from('<4h', blob, p + 12)
+            self._dib(x, y, dest_w, dest_h, p + 20, length - 20)
+
+    def _dib(self, x, y, width, height, offset, length):
+        (header_size,) = struct.unpack_from('<I', self.blob, offset)
+        bit_count, = struct.unpack_from('<H', self.blob, offset + 14)
+        colors = struct.unpack_from('<I', self.blob, offset + 32)[0] if header_size >= 40 else 0
+        if bit_count <= 8:
+            colors = colors or (1 << bit_count)
+        bmi_length = header_size + 4 * colors
+        data = self.blob[offset:offset + length]
+        self.bitmap(x, y, width, height, data[:bmi_length], data[bmi_length:])
+
+
+def _selftest():
+    """Dựng EMF / WMF tổng hợp (đường, hình, chữ Symbol, bitmap), vẽ và kiểm tra cache"""
+    import tempfile
+    import time
+
+    def emr(kind, payload):
+        return struct.pack('<II', kind, 8 + len(payload)) + payload
+
+    # Frame 20 x 10 mm trên thiết bị 1000 x 1000 px / 250 x 250 mm -> 80 x 40 đơn vị
+    records = [
+        emr(38, struct.pack('<4I', 1, 0, 2, 0) + struct.pack('<I', 0x0000FF)),         # CREATEPEN đỏ, rộng 2
+        emr(37, struct.pack('<I', 1)),
+        emr(87, struct.pack('<4i', 0, 0, 80, 40) + struct.pack('<I', 3) + struct.pack('<6h', 2, 38, 40, 2, 78, 38)),
+        emr(39, struct.pack('<3I', 2, 0, 0xFF0000)),                                  # CREATEBRUSH xanh
+        emr(37, struct.pack('<I', 2)),
+        emr(42, struct.pack('<4i', 50, 5, 75, 20)),                                  # ELLIPSE
+        emr(82, struct.pack('<I5i', 3, -16, 0, 0, 0, 400) + bytes([0, 0, 0, 2, 0, 0, 0, 0])
+            + 'Symbol'.encode('utf-16-le').ljust(64, b'\x00')),
+        emr(37, struct.pack('<I', 3)),
+    ]
+    text = 'b'  # α ≥ b
+    text_record_size = 8 + 16 + 12 + 40
+    records.append(emr(84, struct.pack('<4i', 0, 0, 80, 40) + struct.pack('<Iff', 1, 0, 0)
+                       + struct.pack('<2i2I', 5, 8, len(text), text_record_size) + struct.pack('<I4iI', 0, 0, 0, 0, 0, 0)
+                       + text.encode('utf-16-le')))
+    bmi = struct.pack('<IiiHHIIiiII', 40, 2, 2, 1, 24, 0, 0, 0, 0, 0, 0)
+    bits = bytes([0, 255, 0] * 2 + [0, 0]) * 2
+    records.append(emr(81, struct.pack('<4i', 0, 0, 80, 40) + struct.pack('<2i', 60, 25) + struct.pack('<4i', 0, 0, 2, 2)
+                       + struct.pack('<4I', 80, len(bmi), 80 + len(bmi), len(bits))
+                       + struct.pack('<2I', 0, 0xCC0020) + struct.pack('<2i', 10, 10) + bmi + bits))
+    records.append(emr(14, struct.pack('<3I', 0, 16, 20)))
+    body = b''.join(records)
+    header = struct.pack('<4i', 0, 0, 79, 39) + struct.pack('<4i', 0, 0, 2000, 1000) + b' EMF' \
+        + struct.pack('<IIIHHIII', 0x10000, 0, len(records) + 1, 4, 0, 0, 0, 0) + struct.pack('<4i', 1000, 1000, 250, 250)
+    emf = emr(1, header)
+    emf = emf[:48] + struct.pack('<I', len(emf) + len(body)) + emf[52:] + body
+
+    # WMF placeable 1 inch x 0.5 inch (1440 twip/inch)
+    wmf_records = [
+        struct.pack('<IH', 3 + 2, 0x020C) + struct.pack('<2h', 720, 1440),               # SETWINDOWEXT
+        struct.pack('<IH', 3 + 5, 0x02FA) + struct.pack('<3hI', 0, 20, 0, 0x000000),       # CREATEPEN
+        struct.pack('<IH', 3 + 1, 0x012D) + struct.pack('<H', 0),
+        struct.pack('<IH', 3 + 7, 0x0325) + struct.pack('<7h', 3, 100, 100, 700, 600, 1300, 100),
+        struct.pack('<IH', 3 + 4, 0x041B) + struct.pack('<4h', 650, 1400, 400, 900),      # RECTANGLE
+        struct.pack('<IH', 3 + 25, 0x02FB) + struct.pack('<5h', -200, 0, 0, 0, 400) + bytes(8)
+        + b'Times New Roman'.ljust(32, b'\x00'),                                        # CREATEFONTINDIRECT
+        struct.pack('<IH', 3 + 1, 0x012D) + struct.pack('<H', 1),
+        struct.pack('<IH', 3 + 5, 0x0521) + struct.pack('<h', 3) + b'x+1\x00' + struct.pack('<2h', 300, 50),
+        struct.pack('<IH', 3, 0),
+    ]
+    wmf_body = b''.join(wmf_records)
+    wmf_header = struct.pack('<HHHIHIH', 1, 9, 0x300, (18 + len(wmf_body)) // 2, 1, 10, 0)
+    placeable = b'\xd7\xcd\xc6\x9a' + struct.pack('<h4hHI', 0, 0, 0, 1440, 720, 1440, 0)
+    placeable += struct.pack('<H', _wmf_checksum(placeable))
+    wmf = placeable + wmf_header + wmf_body
+
+    class _Info:
+        def __init__(self, blob, fmt):
+            import hashlib
+            self.blob, self.format, self.extent = blob, fmt, None
+            self.sha1 = hashlib.sha1(blob + str(time.time()).encode()).hexdigest()
+
+    out_dir = tempfile.mkdtemp(prefix='vector_image_')
+    for name, blob, fmt in (('emf', emf, 'x-emf'), ('wmf', wmf, 'x-wmf')):
+        info = _Info(blob, fmt)
+        started = time.perf_counter()
+        b64 = encode_png(info)
+        first = time.perf_counter() - started
+        _memory_cache.clear()
+        started = time.perf_counter()
+        again = encode_png(info)
+        cached = time.perf_counter() - started
+        assert b64 is not None, f"{name}: không vẽ được"
+        assert again == b64, f"{name}: ảnh đọc từ cache đĩa khác ảnh vừa vẽ"
+        png = base64.b64decode(b64)
+        path = os.path.join(out_dir, f'{name}.png')
+        with open(path, 'wb') as f:
+            f.write(png)
+        img = Image.open(BytesIO(png))
+        # Cả hai ảnh mẫu có tỉ lệ 2:1
+        assert img.format == 'PNG' and abs(img.width - 2 * img.height) <= 2, f"{name}: kích thước sai {img.size}"
+        colors = len(img.convert('RGB').getcolors(1 << 16) or [])
+        assert colors > 1, f"{name}: ảnh trống"
+        cache_file = _cache_path(info.sha1, img.size)
+        assert os.path.exists(cache_file), f"{name}: không ghi cache đĩa"
+        print(f"{name}: {img.size} {colors} màu, {first * 1000:.1f} ms, cache đĩa {cached * 1000:.1f} ms -> {path}")
+        os.remove(cache_file)
+
+
+def _wmf_checksum(placeable: bytes) -> int:
+    checksum = 0
+    for (word,) in struct.iter_unpack('<H', placeable[:20]):
+        checksum ^= word
+    return checksum
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--selftest']:
+        _selftest()
+    else:
+        print("python vector_image.py --selftest")
@@ -0,0 +1,254 @@
+# watch_folder.py
+"""
+Chế độ daemon: theo dõi thư mục và tự chuyển đổi file .docx mới / vừa sửa.
+
+    python watch_folder.py D:/de_thi/xong -o D:/de_thi/xml
+    python watch_folder.py in1 in2 -o out --interval 2 --stable 3 --debounce 2
+
+- Quét định kỳ (polling, không cần thư viện ngoài). Một file chỉ được coi là
+  sẵn sàng khi kích thước + mtime không đổi trong `stable` giây và zip đã đọc
+  được central directory, nên file đang copy dở bị bỏ qua.
+- Debounce: khi editor thả nhiều file một lúc, chờ tới khi không còn file mới
+  trong `debounce` giây rồi mới gửi cả lô cho WorkerPool (batch_runner).
+- Kết quả ghi vào cây thư mục đầu ra giống cây đầu vào
+  (nhiều thư mục đầu vào thì mỗi thư mục một nhánh con theo tên).
+- State DB (sqlite) lưu kích thước / mtime của lần chuyển đổi gần nhất, khởi
+  động lại không chuyển đổi lại file chưa đổi. File lỗi cũng được ghi nhận và
+  chỉ chạy lại khi file thay đổi.
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import sqlite3
+import time
+import zipfile
+
+import image_optimizer
+import output_writer
+import xml_validate
+from batch_runner import BatchRunner, WorkerPool
+from log_buffer import new_log_path
+
+
+DEFAULT_INTERVAL_S = 2.0
+DEFAULT_STABLE_S = 3.0
+DEFAULT_DEBOUNCE_S = 2.0
+
+# Số file tối đa trong một lô, đủ thì gửi luôn không chờ debounce
+MAX_BATCH_FILES = 200
+
+STATE_FILE_NAME = '.docx_xml_state.sqlite'
+
+
+class StateDB:
+    """Trạng thái chuyển đổi của từng file đầu vào (sqlite)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            ' path TEXT PRIMARY KEY,'
+            ' size INTEGER NOT NULL,'
+            ' mtime_ns INTEGER NOT NULL,'
+            ' status TEXT NOT NULL,'
+            ' output TEXT,'
+            ' errors INTEGER NOT NULL DEFAULT 0,'
+            ' converted_at REAL NOT NULL)'
+        )
+        self._conn.commit()
+
+    def load(self) -> dict:
+        """{path: (size, mtime_ns)} của mọi file đã xử lý"""
+        return {path: (size, mtime_ns)
+                for path, size, mtime_ns in self._conn.execute('SELECT path, size, mtime_ns FROM files')}
+
+    def record(self, rows):
+        """rows: [(path, size, mtime_ns, status, output, error_count)]"""
+        now = time.time()
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO files (path, size, mtime_ns, status, output, errors, converted_at)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [row + (now,) for row in rows]
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+class _Candidate:
+    """File đang chờ ổn định"""
+
+    __slots__ = ('size', 'mtime_ns', 'stable_since')
+
+    def __init__(self, size, mtime_ns, now):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.stable_since = now
+
+
+class FolderWatcher:
+    """Quét các thư mục đầu vào, gom file sẵn sàng thành lô và chuyển đổi trên WorkerPool"""
+
+    def __init__(self, input_dirs, output_dir, interval=DEFAULT_INTERVAL_S, stable=DEFAULT_STABLE_S,
+                 debounce=DEFAULT_DEBOUNCE_S, workers=None, state_path=None, log_path=None, processor_kwargs=None,
+                 output_options=None):
+        self.input_dirs = [os.path.abspath(d) for d in input_dirs]
+        self.output_dir = os.path.abspath(output_dir)
+        self.interval = interval
+        self.stable = stable
+        self.debounce = debounce
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        self.state = StateDB(state_path or os.path.join(self.output_dir, STATE_FILE_NAME))
+        self.done = self.state.load()
+        # print() của processor trong worker vào file log, console chỉ còn log của daemon
+        self.pool = WorkerPool(workers, log_path, processor_kwargs=processor_kwargs)
+        self.runner = BatchRunner(self.pool.control, print, pool=self.pool, output_options=output_options)
+        self.suffix = output_options.suffix if output_options else '.xml'
+
+        self._candidates = {}  # path -> _Candidate
+        self._ready = {}       # path -> (size, mtime_ns)
+        self._last_change = 0.0
+        self._running = False
+
+    def output_path(self, input_dir, path) -> str:
+        """Đường dẫn .xml (.xml.gz / .xml.zst) tương ứng trong cây đầu ra"""
+        rel = os.path.relpath(path, input_dir)
+        if len(self.input_dirs) > 1:
+            rel = os.path.join(os.path.basename(input_dir.rstrip(os.sep)), rel)
+        return os.path.join(self.output_dir, os.path.splitext(rel)[0] + self.suffix)
+
+    def _iter_docx(self):
+        for input_dir in self.input_dirs:
+            for root, dirs, files in os.walk(input_dir):
+                # Không quét thư mục đầu ra nếu nó nằm trong thư mục đầu vào
+                dirs[:] = [d for d in dirs if os.path.join(root, d) != self.output_dir]
+                for name in files:
+                    if name.lower().endswith('.docx') and not name.startswith('~$'):
+                        yield input_dir, os.path.join(root, name)
+
+    def scan(self, now):
+        """Một lượt quét: cập nhật file đang chờ ổn định và danh sách file sẵn sàng"""
+        seen = set()
+        for input_dir, path in self._iter_docx():
+            seen.add(path)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            signature = (st.st_size, st.st_mtime_ns)
+            if self.done.get(path) == signature or self._ready.get(path) == signature:
+                continue
+
+            candidate = self._candidates.get(path)
+            if candidate is None or (candidate.size, candidate.mtime_ns) != signature:
+                self._candidates[path] = _Candidate(st.st_size, st.st_mtime_ns, now)
+                self._ready.pop(path, None)
+                self._last_change = now
+                continue
+
+            if now - candidate.stable_since >= self.stable and zipfile.is_zipfile(path):
+                del self._candidates[path]
+                self._ready[path] = signature
+                self._last_change = now
+
+        # File bị xóa / đổi tên trước khi kịp chuyển đổi
+        for path in [p for p in self._candidates if p not in seen]:
+            del self._candidates[path]
+        for path in [p for p in self._ready if p not in seen]:
+            del self._ready[path]
+
+    def _input_dir_of(self, path):
+        for input_dir in self.input_dirs:
+            if os.path.commonpath([input_dir, path]) == input_dir:
+                return input_dir
+        return os.path.dirname(path)
+
+    def convert_ready(self):
+        """Chuyển đổi các file sẵn sàng thành một lô, ghi kết quả vào state DB"""
+        batch = dict(list(self._ready.items())[:MAX_BATCH_FILES])
+        for path in batch:
+            del self._ready[path]
+
+        output_paths = {}
+        for path in batch:
+            output_paths[path] = self.output_path(self._input_dir_of(path), path)
+            os.makedirs(os.path.dirname(output_paths[path]), exist_ok=True)
+
+        print(f"[DEBUG] Chuyển đổi {len(batch)} file")
+        self.pool.control.reset()
+        results = self.runner.run(list(batch), output_paths=output_paths)
+
+        rows = []
+        for path, result in results.items():
+            if result['status'] == 'cancelled':
+                continue  # dừng giữa chừng: lần chạy sau xử lý lại
+            size, mtime_ns = batch[path]
+            rows.append((path, size, mtime_ns, result['status'], output_paths[path], len(result['errors'])))
+            self.done[path] = (size, mtime_ns)
+        self.state.record(rows)
+
+    def run(self):
+        """Vòng lặp chính, tới khi stop() hoặc Ctrl+C"""
+        self._running = True
+        self.pool.start()
+        print(f"[DEBUG] Theo dõi {', '.join(self.input_dirs)} -> {self.output_dir} "
+              f"({len(self.pool.workers)} worker, {len(self.done)} file đã có trong state)")
+        try:
+            while self._running:
+                now = time.monotonic()
+                self.scan(now)
+                if self._ready and (now - self._last_change >= self.debounce
+                                    or len(self._ready) >= MAX_BATCH_FILES):
+                    self.convert_ready()
+                    continue
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def stop(self):
+        self._running = False
+        self.pool.control.cancel()
+
+    def close(self):
+        self.pool.shutdown()
+        self.state.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Theo dõi thư mục và tự chuyển đổi DOCX sang XML")
+    parser.add_argument('inputs', nargs='+', help="Thư mục đầu vào")
+    parser.add_argument('-o', '--output', required=True, help="Thư mục đầu ra (cây thư mục giống đầu vào)")
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL_S, help="Chu kỳ quét (giây)")
+    parser.add_argument('--stable', type=float, default=DEFAULT_STABLE_S,
+                        help="Thời gian kích thước / mtime phải giữ nguyên (giây)")
+    parser.add_argument('--debounce', type=float, default=DEFAULT_DEBOUNCE_S,
+                        help="Chờ không còn file mới trong khoảng này rồi mới chạy lô (giây)")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--state', default=None, help=f"File state sqlite (mặc định: <output>/{STATE_FILE_NAME})")
+    parser.add_argument('--log', default=None, help="File log chi tiết của worker (mặc định: thư mục logs)")
+    image_optimizer.add_arguments(parser)
+    xml_validate.add_arguments(parser)
+    # Daemon ghi từng file theo cây thư mục, không gom zip theo lô
+    output_writer.add_arguments(parser, bundle=False)
+    args = parser.parse_args()
+
+    watcher = FolderWatcher(args.inputs, args.output, args.interval, args.stable, args.debounce,
+                            args.workers, args.state, args.log or new_log_path(),
+                            {**image_optimizer.processor_kwargs_from_args(args),
+                             **xml_validate.processor_kwargs_from_args(args)},
+                            output_writer.output_options_from_args(args))
+    # Dừng gọn khi service manager gửi SIGTERM (như Ctrl+C)
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    watcher.run()
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,120 @@
+# xml_builder.py
+"""
+Dựng XML đầu ra bằng lxml.
+
+Các trường nội dung (contentquestion, content, explainquestion, contentHtml, ...)
+chứa HTML đã serialize sẵn. Thay vì gán HTML vào .text rồi để tostring escape và
+post_process_xml unescape lại, set_html() đánh dấu phần tử ngay lúc dựng: khi ghi
+ra, lxml serialize khung XML (pretty_print ở tầng C) và HTML được chèn nguyên văn
+vào đúng vị trí.
+
+Đánh dấu nằm trên chính phần tử (attribute HTML_MARK), nên cây vẫn serialize /
+parse lại được bằng dumps() / loads() khi gửi qua process khác.
+"""
+
+import re
+
+from lxml import etree
+from lxml.etree import Element, SubElement
+
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>\n'
+
+# Attribute đánh dấu phần tử có nội dung HTML, bị gỡ khi serialize
+HTML_MARK = '_html'
+
+# Token giữ chỗ cho HTML trong chuỗi lxml trả về (ký tự vùng Private Use)
+_TOKEN = re.compile('\ue000(\\d+)\ue001')
+
+# % chưa escape trong LaTeX (công thức OMML đã escape sẵn thành \%)
+_UNESCAPED_PERCENT = re.compile(r'(?<!\\)%')
+_MATH_TEX = re.compile(r'<span\s+class=["\']math-tex["\']\s*>(.*?)</span>', re.DOTALL | re.IGNORECASE)
+_REPLACELATER = re.compile('REPLACELATER', re.IGNORECASE)
+
+
+def set_html(element, html):
+    """Gán `html` (đã serialize sẵn) làm nội dung của `element`"""
+    if html:
+        element.text = html
+        element.set(HTML_MARK, '1')
+    else:
+        element.text = None
+        element.attrib.pop(HTML_MARK, None)
+    return element
+
+
+def html_element(parent, tag, html):
+    """SubElement với nội dung HTML"""
+    return set_html(SubElement(parent, tag), html)
+
+
+def html_node(tag, html):
+    """Element độc lập với nội dung HTML"""
+    return set_html(Element(tag), html)
+
+
+def _clean_mathlatex(match):
+    inner = _UNESCAPED_PERCENT.sub(r'\\%', match.group(1))
+    return (
+        inner
+        .replace('<strong>', '')
+        .replace('</strong>', '')
+        .replace('<i>', '')
+        .replace('</i>', '')
+        .replace('<u>', '')
+        .replace('</u>', '')
+        .replace('<br>', '')
+        .replace('<br/>', '')
+        .replace('\\frac', '\\dfrac')
+    )
+
+
+def clean_html(html):
+    """Làm sạch HTML trước khi ghi: bỏ placeholder, chuẩn hóa xuống dòng, bỏ bọc math-tex (giữ LaTeX)"""
+    if 'REPLACELATER' in html.upper():
+        html = _REPLACELATER.sub('', html)
+    if '\r' in html:
+        html = html.replace('\r\n', '\n').replace('\r', '\n')
+    if 'math-tex' in html:
+        html = _MATH_TEX.sub(_clean_mathlatex, html)
+    return html
+
+
+def to_string(root, declaration=True, level=0):
+    """
+    Serialize `root` thành chuỗi XML.
+    level > 0: thụt lề như khi `root` nằm ở độ sâu `level` (ghi từng phần tử ở chế độ stream).
+    """
+    payloads = []
+    marked = []
+    for node in root.iter():
+        if node.get(HTML_MARK) is not None:
+            marked.append((node, node.text))
+            payloads.append(clean_html(node.text or ''))
+            node.text = f'\ue000{len(payloads) - 1}\ue001'
+            del node.attrib[HTML_MARK]
+        elif node.text == '':
+            node.text = None
+
+    try:
+        xml_str = etree.tostring(root, encoding='unicode', pretty_print=True)
+    finally:
+        for node, text in marked:
+            node.text = text
+            node.set(HTML_MARK, '1')
+
+    if level:
+        pad = '  ' * level
+        xml_str = ''.join(pad + line for line in xml_str.splitlines(True))
+    if payloads:
+        xml_str = _TOKEN.sub(lambda m: payloads[int(m.group(1))], xml_str)
+    return (XML_DECLARATION if declaration else '') + xml_str
+
+
+def dumps(element) -> bytes:
+    """Bytes của cây (giữ nguyên đánh dấu HTML), dùng để gửi qua process khác"""
+    return etree.tostring(element, encoding='utf-8')
+
+
+def loads(data: bytes):
+    return etree.fromstring(data)
@@ -0,0 +1,365 @@
+# xml_validate.py
+"""
+Kiểm tra (tùy chọn) file XML đầu ra ngay sau khi ghi, trong worker đã tạo ra file.
+
+Lỗi như HTML mở thẻ không đóng lọt vào <contentquestion> hay câu hỏi thiếu
+<listanswers> thường chỉ lộ ra khi LMS import thất bại. Khi bật (DocxProcessor
+validate_output=True, tham số --validate-output hoặc biến môi trường
+DOCX_XML_VALIDATE=1), convert_file đọc lại file vừa ghi và nối lỗi vào danh
+sách lỗi của file (file_results):
+- file được đọc theo từng khối, không dựng cả cây: nội dung HTML của các trường
+  (contentquestion, content, explainquestion, ...) được tách ra khi đọc (HTML
+  chèn nguyên văn nên file không phải XML hợp lệ), phần khung XML còn lại đưa
+  vào XMLPullParser của lxml;
+- mỗi <question> / <itemDocument> đọc xong được kiểm tra với schema RelaxNG
+  (biên dịch một lần cho mỗi process) rồi giải phóng ngay;
+- HTML của từng trường được kiểm tra cân bằng thẻ (thẻ chưa đóng, thẻ đóng thừa),
+  cũng theo từng khối nên ảnh base64 lớn không bị nạp nguyên vào bộ nhớ.
+Vị trí lỗi là số dòng trong file XML đầu ra.
+"""
+
+import os
+import re
+import sys
+from typing import List
+
+from lxml import etree
+
+from output_writer import open_binary
+
+
+ENV_VAR = 'DOCX_XML_VALIDATE'
+
+# Các trường chứa HTML (set_html / create_safe_text_node), nội dung không phải XML
+HTML_FIELDS = ('contentquestion', 'content', 'explainquestion', 'hintQuestion', 'contentHtml',
+               'urlSpeechContent', 'urlSpeechExplain', 'contentMedia')
+
+# Số lỗi tối đa ghi cho một file, phần còn lại chỉ đếm
+MAX_ERRORS = 20
+
+CHUNK_SIZE = 1024 * 1024
+
+_FIELD_OPEN = re.compile(rb'<(' + b'|'.join(f.encode() for f in HTML_FIELDS) + rb')>')
+_FIELD_OPEN_MAX = max(len(f) for f in HTML_FIELDS) + 2
+
+_HTML_TAG = re.compile(rb'<(/?)([A-Za-z][A-Za-z0-9]*)(?:[^>"\']|"[^"]*"|\'[^\']*\')*?(/?)>')
+_VOID_TAGS = {b'area', b'base', b'br', b'col', b'embed', b'hr', b'img', b'input', b'link', b'meta',
+              b'param', b'source', b'track', b'wbr'}
+
+_RNG_NS = 'http://relaxng.org/ns/structure/1.0'
+_XSD_TYPES = 'http://www.w3.org/2001/XMLSchema-datatypes'
+
+# Grammar chung; start được chọn theo loại bản ghi (question / itemDocument)
+_GRAMMAR = f'''<grammar xmlns="{_RNG_NS}" datatypeLibrary="{_XSD_TYPES}">
+  <start><ref name="%s"/></start>
+  <define name="question">
+    <element name="question">
+      <element name="indexGroupQuestionMaterial"><data type="nonNegativeInteger"/></element>
+      <element name="subject"><text/></element>
+      <element name="tag"><text/></element>
+      <element name="posttype"><text/></element>
+      <element name="knowledgelevel"><text/></element>
+      <element name="levelquestion"><data type="nonNegativeInteger"/></element>
+      <zeroOrMore>
+        <choice>
+          <element name="urlSpeechContent"><text/></element>
+          <element name="contentMedia"><text/></element>
+          <element name="typeContentMedia"><text/></element>
+          <element name="urlSpeechExplain"><text/></element>
+        </choice>
+      </zeroOrMore>
+      <element name="typeAnswer"><choice><value>0</value><value>1</value><value>3</value><value>5</value></choice></element>
+      <element name="typeViewContent"><data type="nonNegativeInteger"/></element>
+      <element name="template"><data type="nonNegativeInteger"/></element>
+      <optional><element name="hintQuestion"><text/></element></optional>
+      <element name="contentquestion"><text/></element>
+      <element name="listanswers">
+        <oneOrMore>
+          <element name="answer">
+            <element name="index"><data type="nonNegativeInteger"/></element>
+            <element name="content"><text/></element>
+            <element name="isanswer"><choice><value>TRUE</value><value>FALSE</value></choice></element>
+          </element>
+        </oneOrMore>
+      </element>
+      <optional><element name="explainquestion"><text/></element></optional>
+    </element>
+  </define>
+  <define name="itemDocument">
+    <element name="itemDocument">
+      <element name="subjectId"><text/></element>
+      <element name="knowledgeId"><text/></element>
+      <element name="groupQuestionMaterial"><data type="nonNegativeInteger"/></element>
+      <element name="contentHtml"><text/></element>
+      <element name="listQuestion"><zeroOrMore><ref name="question"/></zeroOrMore></element>
+    </element>
+  </define>
+</grammar>'''
+
+# Thẻ gốc -> thẻ bản ghi con được phép
+_RECORDS = {'questions': 'question', 'itemDocuments': 'itemDocument'}
+
+_schemas = {}
+
+
+def get_schema(record: str) -> etree.RelaxNG:
+    """Schema RelaxNG của một loại bản ghi, biên dịch lần đầu dùng rồi giữ cho cả process"""
+    schema = _schemas.get(record)
+    if schema is None:
+        grammar = _GRAMMAR % record
+        schema = _schemas[record] = etree.RelaxNG(etree.fromstring(grammar.encode('utf-8')))
+    return schema
+
+
+def is_enabled(value=None) -> bool:
+    """validate_output của DocxProcessor: None thì theo biến môi trường DOCX_XML_VALIDATE"""
+    if value is not None:
+        return bool(value)
+    return os.environ.get(ENV_VAR, '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def add_arguments(parser):
+    """Tùy chọn dòng lệnh cho các entrypoint (conversion_service, watch_folder)"""
+    parser.add_argument('--validate-output', action='store_true', default=None,
+                        help="Kiểm tra cấu trúc XML và HTML nhúng của file đầu ra, lỗi ghi vào kết quả")
+
+
+def processor_kwargs_from_args(args) -> dict:
+    """Tham số DocxProcessor tương ứng với add_arguments()"""
+    return {'validate_output': True} if args.validate_output else {}
+
+
+class _HtmlChecker:
+    """Kiểm tra cân bằng thẻ của một đoạn HTML, nhận dữ liệu theo từng khối"""
+
+    def __init__(self):
+        self.stack = []
+        self.problems = []
+        self._pending = b''
+
+    def feed(self, data: bytes):
+        if self._pending and b'>' not in data:
+            # Thẻ dài (ảnh base64) chưa kết thúc: chỉ nối thêm, không quét lại
+            self._pending += data
+            return
+        buf = self._pending + data if self._pending else data
+        pos = 0
+        for m in _HTML_TAG.finditer(buf):
+            self._tag(m.group(2).lower(), closing=bool(m.group(1)), self_closing=bool(m.group(3)))
+            pos = m.end()
+        lt = buf.rfind(b'<', pos)
+        self._pending = buf[lt:] if lt != -1 and b'>' not in buf[lt:] else b''
+
+    def _tag(self, name, closing, self_closing):
+        if not closing:
+            if not self_closing and name not in _VOID_TAGS:
+                self.stack.append(name)
+            return
+        if name in _VOID_TAGS:
+            return
+        if name not in self.stack:
+            self.problems.append(f"thẻ đóng </{name.decode()}> thừa")
+            return
+        while self.stack:
+            top = self.stack.pop()
+            if top == name:
+                break
+            self.problems.append(f"thẻ <{top.decode()}> chưa đóng")
+
+    def close(self) -> List[str]:
+        self.problems.extend(f"thẻ <{name.decode()}> chưa đóng" for name in reversed(self.stack))
+        self.stack = []
+        return self.problems
+
+
+class _Validator:
+    """Đọc file đầu ra theo khối: tách HTML, kiểm tra khung XML theo từng bản ghi"""
+
+    def __init__(self):
+        self.errors = []
+        self.skipped = 0
+        self.parser = etree.XMLPullParser(events=('start', 'end'))
+        self.root = None
+        self.records = 0
+        self.line = 1  # dòng hiện tại trong file (theo số '\n' đã đọc)
+        self.broken = False
+
+    def error(self, message):
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(message)
+        else:
+            self.skipped += 1
+
+    def _xml(self, data: bytes):
+        """Đưa một đoạn khung XML vào parser và xử lý các bản ghi đã đọc xong"""
+        if self.broken or not data:
+            return
+        self.line += data.count(b'\n')
+        try:
+            self.parser.feed(data)
+            self._events()
+        except etree.XMLSyntaxError as e:
+            self.error(f"XML đầu ra sai cú pháp: {e}")
+            self.broken = True
+
+    def _events(self):
+        for event, elem in self.parser.read_events():
+            if event == 'start':
+                if self.root is None:
+                    self.root = elem
+                    if elem.tag not in _RECORDS:
+                        self.error(f"Thẻ gốc <{elem.tag}> không phải <questions> hoặc <itemDocuments>")
+                continue
+            if elem.getparent() is not self.root:
+                continue
+            self.records += 1
+            expected = _RECORDS.get(self.root.tag)
+            if elem.tag != expected:
+                self.error(f"Dòng {elem.sourceline}: thẻ <{elem.tag}> không được phép trong <{self.root.tag}>")
+            else:
+                schema = get_schema(elem.tag)
+                if not schema.validate(elem):
+                    error = schema.error_log.last_error
+                    label = 'câu hỏi' if elem.tag == 'question' else 'học liệu'
+                    self.error(f"Dòng {error.line if error.line > 0 else elem.sourceline} "
+                               f"({label} #{self.records}): {error.message}")
+            # Bản ghi đã kiểm tra xong: giải phóng. Không gỡ chính elem khỏi cây khi
+            # parser còn đang dựng tiếp (lxml 4.9 hỏng bộ nhớ), chỉ xóa nội dung của nó
+            # và gỡ các bản ghi trước đó
+            elem.clear()
+            while elem.getprevious() is not None:
+                del self.root[0]
+
+    def run(self, stream):
+        buf = b''
+        field = close_tag = None
+        html = None
+        field_line = 0
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            buf += chunk
+            while True:
+                if field is None:
+                    m = _FIELD_OPEN.search(buf)
+                    if m is None:
+                        # Giữ lại đoạn cuối có thể là đầu một thẻ mở bị cắt giữa hai khối
+                        lt = buf.rfind(b'<')
+                        keep = lt if chunk and lt != -1 and len(buf) - lt < _FIELD_OPEN_MAX else len(buf)
+                        self._xml(buf[:keep])
+                        buf = buf[keep:]
+                        break
+                    self._xml(buf[:m.end()])
+                    field = m.group(1)
+                    close_tag = b'</' + field + b'>'
+                    html = _HtmlChecker()
+                    field_line = self.line
+                    buf = buf[m.end():]
+                else:
+                    end = buf.find(close_tag)
+                    if end == -1:
+                        # Giữ lại phần cuối có thể là đầu thẻ đóng bị cắt
+                        safe = max(0, len(buf) - len(close_tag) + 1) if chunk else len(buf)
+                        html.feed(buf[:safe])
+                        self._xml(b'\n' * buf.count(b'\n', 0, safe))
+                        buf = buf[safe:]
+                        break
+                    html.feed(buf[:end])
+                    self._xml(b'\n' * buf.count(b'\n', 0, end))
+                    for problem in html.close():
+                        self.error(f"Dòng {field_line}: HTML trong <{field.decode()}> không cân bằng: {problem}")
+                    field = None
+                    buf = buf[end:]
+            if not chunk:
+                break
+
+        if field is not None:
+            self.error(f"Dòng {field_line}: thiếu thẻ đóng </{field.decode()}>")
+        elif not self.broken:
+            if self.root is None:
+                self.error("File XML đầu ra rỗng")
+            else:
+                try:
+                    self.parser.close()
+                    self._events()
+                except etree.XMLSyntaxError as e:
+                    self.error(f"XML đầu ra sai cú pháp: {e}")
+        if self.skipped:
+            self.errors.append(f"... và {self.skipped} lỗi kiểm tra XML khác")
+        return self.errors
+
+
+def validate_stream(stream) -> List[str]:
+    """Kiểm tra XML đầu ra đọc từ stream nhị phân, trả về danh sách lỗi (rỗng nếu hợp lệ)"""
+    return _Validator().run(stream)
+
+
+def validate_file(path) -> List[str]:
+    """Kiểm tra một file XML đầu ra (.xml / .xml.gz / .xml.zst), trả về danh sách lỗi (rỗng nếu hợp lệ)"""
+    try:
+        with open_binary(path) as f:
+            return validate_stream(f)
+    except OSError as e:
+        return [f"Không đọc được file XML đầu ra để kiểm tra: {e}"]
+
+
+_SAMPLE_QUESTION = """  <question>
+    <indexGroupQuestionMaterial>0</indexGroupQuestionMaterial>
+    <subject>Toán</subject>
+    <tag>t</tag>
+    <posttype>p</posttype>
+    <knowledgelevel>k</knowledgelevel>
+    <levelquestion>%d</levelquestion>
+    <typeAnswer>0</typeAnswer>
+    <typeViewContent>0</typeViewContent>
+    <template>0</template>
+    <contentquestion><p>Câu <b>%d</b> &amp; x<br><img src="data:image/png;base64,%s"></p></contentquestion>
+    <listanswers>
+      <answer><index>0</index><content><p>A</p></content><isanswer>TRUE</isanswer></answer>
+      <answer><index>1</index><content><p>B</p></content><isanswer>FALSE</isanswer></answer>
+    </listanswers>
+    <explainquestion><p>Giải</p></explainquestion>
+  </question>
+"""
+
+
+def _selftest():
+    """Kiểm tra với lxml đang cài: file hợp lệ (nhiều bản ghi, đọc qua nhiều khối) không
+    có lỗi, file sai cấu trúc / HTML lệch thẻ bị báo lỗi"""
+    import io
+
+    global CHUNK_SIZE
+    saved_chunk = CHUNK_SIZE
+    CHUNK_SIZE = 4096  # nhiều khối, thẻ và trường HTML bị cắt giữa hai khối
+    try:
+        body = ''.join(_SAMPLE_QUESTION % (i, i, 'A' * (i * 97 % 5000)) for i in range(200))
+        good = f'<?xml version="1.0" encoding="utf-8"?>\n<questions>\n{body}</questions>\n'.encode('utf-8')
+        errors = validate_stream(io.BytesIO(good))
+        assert errors == [], errors
+
+        bad_html = good.replace(b'<b>7</b>', b'<b>7', 1)
+        errors = validate_stream(io.BytesIO(bad_html))
+        assert len(errors) == 1 and 'chưa đóng' in errors[0], errors
+
+        bad_schema = good.replace(b'<typeAnswer>0</typeAnswer>', b'<typeAnswer>9</typeAnswer>', 1)
+        errors = validate_stream(io.BytesIO(bad_schema))
+        assert len(errors) == 1 and 'câu hỏi #1' in errors[0], errors
+
+        errors = validate_stream(io.BytesIO(good[:len(good) // 2]))
+        assert errors, "file bị cắt cụt không bị phát hiện"
+    finally:
+        CHUNK_SIZE = saved_chunk
+    print(f"xml_validate selftest OK (lxml {'.'.join(map(str, etree.LXML_VERSION))})")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--selftest']:
+        _selftest()
+        sys.exit(0)
+    failed = 0
+    for path in sys.argv[1:]:
+        errors = validate_file(path)
+        failed += bool(errors)
+        print(f"{path}: {'OK' if not errors else f'{len(errors)} lỗi'}")
+        for err in errors:
+            print(f"    {err}")
+    sys.exit(1 if failed else 0)